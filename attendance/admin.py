@@ -1,7 +1,8 @@
 from django.contrib import admin
 from .models import (
     Organization, Lecturer, Student, Course, CourseEnrollment, Attendance, 
-    AttendanceToken, Feedback, EmailVerificationToken, PasswordResetToken
+    AttendanceToken, Feedback, EmailVerificationToken, PasswordResetToken,
+    AnalyticsSnapshot, AtRiskStudent, ReportJob, ReportCacheEntry
 )
 
 admin.site.register(Organization)
@@ -14,3 +15,7 @@ admin.site.register(AttendanceToken)
 admin.site.register(Feedback)
 admin.site.register(EmailVerificationToken)
 admin.site.register(PasswordResetToken)
+admin.site.register(AnalyticsSnapshot)
+admin.site.register(AtRiskStudent)
+admin.site.register(ReportJob)
+admin.site.register(ReportCacheEntry)
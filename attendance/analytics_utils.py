@@ -1,42 +1,53 @@
 """
 Analytics utilities for admin dashboard
 """
-from django.db.models import Count, Q, Avg
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Q, Avg, Sum
 from django.utils import timezone
 from datetime import timedelta
-from .models import Attendance, Course, Student, Lecturer
+from .models import Attendance, Course, CourseEnrollment, Student, Lecturer, AnalyticsSnapshot
+from .organization_utils import filter_by_organization
+from .roster_utils import annotate_session_counts
+import logging
+import threading
+import time
 
+logger = logging.getLogger(__name__)
 
-def get_attendance_statistics(days=30):
+
+def get_attendance_statistics(days=30, organization=None):
     """
     Get attendance statistics for the last N days
     """
     start_date = timezone.now() - timedelta(days=days)
+    attendances = filter_by_organization(Attendance.objects.all(), organization)
     
     # Total attendance sessions
-    total_sessions = Attendance.objects.filter(
+    total_sessions = attendances.filter(
         created_at__gte=start_date
     ).count()
     
     # Active sessions
-    active_sessions = Attendance.objects.filter(
+    active_sessions = attendances.filter(
         is_active=True
     ).count()
     
+    # Check-ins and enrollment per session, in one query
+    session_counts = list(annotate_session_counts(
+        attendances.filter(created_at__gte=start_date)
+    ).values_list('present_count', 'enrolled_count'))
+
     # Total check-ins
-    total_checkins = sum(
-        att.present_students.count() 
-        for att in Attendance.objects.filter(created_at__gte=start_date)
-    )
+    total_checkins = sum(present for present, _ in session_counts)
     
     # Average attendance rate
-    attendance_data = []
-    for att in Attendance.objects.filter(created_at__gte=start_date):
-        enrolled_count = att.course.students.count()
-        checkin_count = att.present_students.count()
-        if enrolled_count > 0:
-            rate = (checkin_count / enrolled_count) * 100
-            attendance_data.append(rate)
+    attendance_data = [
+        (present / enrolled) * 100
+        for present, enrolled in session_counts
+        if enrolled > 0
+    ]
     
     avg_attendance_rate = sum(attendance_data) / len(attendance_data) if attendance_data else 0
     
@@ -49,19 +60,30 @@ def get_attendance_statistics(days=30):
     }
 
 
-def get_top_courses(limit=10):
+def get_top_courses(limit=10, organization=None):
     """
     Get courses with highest attendance rates
     """
-    courses = Course.objects.annotate(
+    courses = filter_by_organization(Course.objects.all(), organization).annotate(
         attendance_count=Count('attendances')
     ).order_by('-attendance_count')[:limit]
+    courses = list(courses)
+
+    # Check-ins and enrollment for every listed course in one query each
+    checkins = dict(
+        Attendance.present_students.through.objects.filter(
+            attendance__course__in=courses
+        ).values_list('attendance__course_id').annotate(total=Count('pk'))
+    )
+    enrollments = dict(
+        CourseEnrollment.objects.filter(course__in=courses).values_list('course_id').annotate(total=Count('pk'))
+    )
     
     course_data = []
     for course in courses:
-        enrolled = course.students.count()
-        sessions = course.attendances.count()
-        total_checkins = sum(att.present_students.count() for att in course.attendances.all())
+        enrolled = enrollments.get(course.id, 0)
+        sessions = course.attendance_count
+        total_checkins = checkins.get(course.id, 0)
         
         avg_rate = 0
         if sessions > 0 and enrolled > 0:
@@ -79,25 +101,26 @@ def get_top_courses(limit=10):
     return course_data
 
 
-def get_attendance_trends(days=30):
+def get_attendance_trends(days=30, organization=None):
     """
     Get daily attendance trends for the last N days
     """
     start_date = timezone.now() - timedelta(days=days)
-    trends = []
+    sessions = annotate_session_counts(filter_by_organization(Attendance.objects.all(), organization).filter(
+        created_at__gte=start_date,
+        created_at__lt=start_date + timedelta(days=days)
+    )).values_list('created_at', 'present_count')
+
+    # Bucket sessions into the same rolling 24h windows the trend reports
+    buckets = [[0, 0] for _ in range(days)]
+    for created_at, present_count in sessions:
+        bucket = buckets[int((created_at - start_date) // timedelta(days=1))]
+        bucket[0] += 1
+        bucket[1] += present_count
     
-    for i in range(days):
+    trends = []
+    for i, (session_count, total_checkins) in enumerate(buckets):
         day = start_date + timedelta(days=i)
-        next_day = day + timedelta(days=1)
-        
-        sessions = Attendance.objects.filter(
-            created_at__gte=day,
-            created_at__lt=next_day
-        )
-        
-        session_count = sessions.count()
-        total_checkins = sum(att.present_students.count() for att in sessions)
-        
         trends.append({
             'date': day.strftime('%Y-%m-%d'),
             'sessions': session_count,
@@ -107,11 +130,11 @@ def get_attendance_trends(days=30):
     return trends
 
 
-def get_student_participation():
+def get_student_participation(organization=None):
     """
     Get student participation statistics
     """
-    students = Student.objects.all()
+    students = filter_by_organization(Student.objects.all(), organization)
     
     participation_data = {
         'high_participation': 0,  # >80% attendance
@@ -120,29 +143,15 @@ def get_student_participation():
         'no_participation': 0  # 0% attendance
     }
     
-    for student in students:
-        # Get all courses student is enrolled in
-        enrolled_courses = student.courses.all()
-        if not enrolled_courses.exists():
-            continue
-        
-        # Count total sessions and student's check-ins
-        total_sessions = 0
-        total_checkins = 0
-        
-        for course in enrolled_courses:
-            course_sessions = Attendance.objects.filter(course=course)
-            total_sessions += course_sessions.count()
-            
-            for session in course_sessions:
-                if student in session.present_students.all():
-                    total_checkins += 1
-        
-        if total_sessions == 0:
-            continue
-        
+    # Sum the maintained enrollment counters per student in a single query
+    totals = students.annotate(
+        total_sessions=Sum('courseenrollment__sessions_held'),
+        total_checkins=Sum('courseenrollment__sessions_attended'),
+    ).filter(total_sessions__gt=0).values_list('total_sessions', 'total_checkins')
+    
+    for total_sessions, total_checkins in totals:
+        total_checkins = min(total_checkins, total_sessions)
         participation_rate = (total_checkins / total_sessions) * 100
-        
         if participation_rate == 0:
             participation_data['no_participation'] += 1
         elif participation_rate < 50:
@@ -155,11 +164,11 @@ def get_student_participation():
     return participation_data
 
 
-def get_lecturer_activity(limit=10):
+def get_lecturer_activity(limit=10, organization=None):
     """
     Get most active lecturers
     """
-    lecturers = Lecturer.objects.annotate(
+    lecturers = filter_by_organization(Lecturer.objects.all(), organization).annotate(
         session_count=Count('courses__attendances')
     ).order_by('-session_count')[:limit]
     
@@ -180,15 +189,197 @@ def get_lecturer_activity(limit=10):
     return lecturer_data
 
 
-def get_system_overview():
+def get_system_overview(organization=None):
     """
     Get overall system statistics
     """
+    courses = filter_by_organization(Course.objects.all(), organization)
+    attendances = filter_by_organization(Attendance.objects.all(), organization)
     return {
-        'total_students': Student.objects.count(),
-        'total_lecturers': Lecturer.objects.count(),
-        'total_courses': Course.objects.count(),
-        'active_courses': Course.objects.filter(is_active=True).count(),
-        'total_attendance_sessions': Attendance.objects.count(),
-        'active_sessions': Attendance.objects.filter(is_active=True).count()
+        'total_students': filter_by_organization(Student.objects.all(), organization).count(),
+        'total_lecturers': filter_by_organization(Lecturer.objects.all(), organization).count(),
+        'total_courses': courses.count(),
+        'active_courses': courses.filter(is_active=True).count(),
+        'total_attendance_sessions': attendances.count(),
+        'active_sessions': attendances.filter(is_active=True).count()
+    }
+
+
+# Dashboard sections served by AdminAnalyticsView, keyed by response field name
+ANALYTICS_SECTIONS = {
+    'system_overview': lambda days, org: get_system_overview(organization=org),
+    'attendance_statistics': lambda days, org: get_attendance_statistics(days=days, organization=org),
+    'top_courses': lambda days, org: get_top_courses(limit=10, organization=org),
+    'attendance_trends': lambda days, org: get_attendance_trends(days=days, organization=org),
+    'student_participation': lambda days, org: get_student_participation(organization=org),
+    'lecturer_activity': lambda days, org: get_lecturer_activity(limit=10, organization=org),
+}
+
+
+def _section_cache_key(name, days, organization):
+    org_key = organization.pk if organization else 'all'
+    return f'analytics:{name}:org={org_key}:days={days}'
+
+
+def _compute_section(name, days, organization):
+    """
+    Compute a section and store it with its freshness deadline
+    """
+    entry = {
+        'value': ANALYTICS_SECTIONS[name](days, organization),
+        'computed_at': timezone.now().isoformat(),
+        'fresh_until': time.time() + getattr(settings, 'ANALYTICS_CACHE_TTL', 300),
     }
+    cache.set(
+        _section_cache_key(name, days, organization),
+        entry,
+        getattr(settings, 'ANALYTICS_CACHE_STALE_TTL', 3600)
+    )
+    return entry
+
+
+def _spawn_refresh(name, days, organization, lock_key):
+    """
+    Recompute a stale section in a background thread, releasing the lock when done
+    """
+    def _run():
+        try:
+            _compute_section(name, days, organization)
+        except Exception:
+            logger.exception(f"Background refresh of analytics section {name} failed")
+        finally:
+            cache.delete(lock_key)
+            # Threads get their own DB connection; don't leak it
+            connection.close()
+
+    threading.Thread(target=_run, daemon=True).start()
+
+
+def get_analytics_section(name, days=30, organization=None, fresh=False):
+    """
+    Get a dashboard section using stale-while-revalidate caching.
+
+    Fresh entries are returned as-is. Stale entries are returned immediately
+    while a single background refresh recomputes them. On a miss only the
+    caller holding the lock computes; others wait briefly for its result.
+
+    Returns:
+        tuple: (section value, ISO timestamp of when it was computed)
+    """
+    key = _section_cache_key(name, days, organization)
+    lock_key = f'{key}:lock'
+    lock_timeout = getattr(settings, 'ANALYTICS_CACHE_LOCK_TIMEOUT', 120)
+
+    if fresh:
+        entry = _compute_section(name, days, organization)
+        return entry['value'], entry['computed_at']
+
+    entry = cache.get(key)
+    if entry is not None:
+        if entry['fresh_until'] <= time.time() and cache.add(lock_key, 1, lock_timeout):
+            _spawn_refresh(name, days, organization, lock_key)
+        return entry['value'], entry['computed_at']
+
+    if cache.add(lock_key, 1, lock_timeout):
+        try:
+            entry = _compute_section(name, days, organization)
+        finally:
+            cache.delete(lock_key)
+        return entry['value'], entry['computed_at']
+
+    # Another request is already computing this section; wait for it
+    deadline = time.time() + getattr(settings, 'ANALYTICS_CACHE_WAIT_SECONDS', 5)
+    while time.time() < deadline:
+        time.sleep(0.1)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['value'], entry['computed_at']
+
+    entry = _compute_section(name, days, organization)
+    return entry['value'], entry['computed_at']
+
+
+# Standard snapshot windows in days; 'term' is resolved at snapshot time
+ANALYTICS_SNAPSHOT_WINDOWS = {'7d': 7, '30d': 30, '90d': 90, 'term': None}
+
+
+def get_term_days():
+    """
+    Number of days in the current term window (ANALYTICS_TERM_START or a fixed length)
+    """
+    term_start = getattr(settings, 'ANALYTICS_TERM_START', None)
+    if term_start:
+        return max((timezone.now().date() - term_start).days, 1)
+    return getattr(settings, 'ANALYTICS_TERM_DAYS', 120)
+
+
+def window_for_days(days):
+    """
+    Map a days query parameter onto a standard snapshot window, if any
+    """
+    for window, window_days in ANALYTICS_SNAPSHOT_WINDOWS.items():
+        if window_days == days:
+            return window
+    return None
+
+
+def snapshot_deltas(current, previous):
+    """
+    Difference between numeric fields of dict sections in two snapshots
+    """
+    deltas = {}
+    for name, section in current.items():
+        old_section = previous.get(name)
+        if not isinstance(section, dict) or not isinstance(old_section, dict):
+            continue
+        changes = {
+            field: round(value - old_section[field], 2)
+            for field, value in section.items()
+            if isinstance(value, (int, float)) and isinstance(old_section.get(field), (int, float))
+        }
+        if changes:
+            deltas[name] = changes
+    return deltas
+
+
+def create_analytics_snapshot(window, organization=None):
+    """
+    Compute every dashboard section for a window and store it as the next version
+    """
+    days = ANALYTICS_SNAPSHOT_WINDOWS[window] or get_term_days()
+    data = {name: compute(days, organization) for name, compute in ANALYTICS_SECTIONS.items()}
+
+    previous = AnalyticsSnapshot.objects.filter(
+        organization=organization, window=window
+    ).order_by('-version').first()
+
+    snapshot = AnalyticsSnapshot.objects.create(
+        organization=organization,
+        window=window,
+        days=days,
+        version=previous.version + 1 if previous else 1,
+        data=data,
+        deltas=snapshot_deltas(data, previous.data) if previous else {},
+    )
+
+    # Keep only the most recent versions for trend comparisons
+    retention = getattr(settings, 'ANALYTICS_SNAPSHOT_RETENTION', 48)
+    AnalyticsSnapshot.objects.filter(
+        organization=organization, window=window, version__lte=snapshot.version - retention
+    ).delete()
+    return snapshot
+
+
+def get_latest_snapshot(window, organization=None):
+    """
+    Latest snapshot for a window, or None if missing or older than ANALYTICS_SNAPSHOT_MAX_AGE
+    """
+    snapshot = AnalyticsSnapshot.objects.filter(
+        organization=organization, window=window
+    ).order_by('-version').first()
+    if snapshot is None:
+        return None
+    max_age = getattr(settings, 'ANALYTICS_SNAPSHOT_MAX_AGE', 2 * 60 * 60)
+    if snapshot.computed_at < timezone.now() - timedelta(seconds=max_age):
+        return None
+    return snapshot
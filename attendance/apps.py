@@ -6,6 +6,9 @@ class AttendanceConfig(AppConfig):
     name = 'attendance'
 
     def ready(self):
+        # Keep conditional GET version counters in step with model changes
+        import attendance.signals  # noqa: F401
+
         # Register system checks
         try:
             import attendance.checks  # noqa: F401
@@ -0,0 +1,24 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from .identity_utils import IDENTITY_RELATED
+
+
+class IdentityTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that loads the user's student and lecturer profiles and
+    their organizations with the token, so get_identity() needs no query of its own
+    """
+
+    def authenticate_credentials(self, key):
+        model = self.get_model()
+        related = ['user'] + [f'user__{path}' for path in IDENTITY_RELATED]
+        try:
+            token = model.objects.select_related(*related).get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (token.user, token)
@@ -0,0 +1,255 @@
+"""
+Per-enrollment attendance counters (sessions held / sessions attended)
+"""
+from django.conf import settings
+from django.db import transaction
+from collections import Counter
+from django.db.models import Count, DateTimeField, ExpressionWrapper, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+from .models import Attendance, AtRiskStudent, Course, CourseEnrollment
+from .sync_utils import record_enrollments, record_presence, record_sessions
+from .version_utils import bump_course_list_version, bump_course_version, bump_version
+
+
+def mark_student_present(attendance, student):
+    """
+    Add a student to a session's present list and count it on their enrollment.
+
+    Returns:
+        bool: True if the student was newly marked present
+    """
+    presence = Attendance.present_students.through
+    with transaction.atomic():
+        _, created = presence.objects.get_or_create(attendance_id=attendance.pk, student_id=student.pk)
+        if created:
+            CourseEnrollment.objects.filter(
+                course_id=attendance.course_id, student_id=student.pk
+            ).update(sessions_attended=F('sessions_attended') + 1)
+            record_presence(attendance, [student.pk])
+    if created:
+        bump_course_version(attendance.course_id, attendance.organization_id)
+        bump_version('user', student.user_id)  # The student's attendance history
+    return created
+
+
+def adjust_attended_counters(course_students, delta):
+    """
+    Add `delta` to sessions_attended for each (course_id, student_id) pair,
+    once per occurrence; used for presence edits made outside mark_student_present
+    """
+    for (course_id, student_id), times in Counter(course_students).items():
+        CourseEnrollment.objects.filter(course_id=course_id, student_id=student_id).update(
+            sessions_attended=Greatest(F('sessions_attended') + delta * times, 0)
+        )
+
+
+def close_session(attendance, ended_at=None):
+    """
+    End an attendance session and count it against every enrollment that
+    existed on the session date. Safe against concurrent closes.
+
+    Returns:
+        bool: True if this call closed the session
+    """
+    now = timezone.now()
+    ended_at = ended_at or now
+    with transaction.atomic():
+        closed = Attendance.objects.filter(pk=attendance.pk, is_active=True).update(
+            is_active=False, ended_at=ended_at, updated_at=now
+        )
+        if closed:
+            CourseEnrollment.objects.filter(
+                course_id=attendance.course_id, enrolled_at__date__lte=attendance.date
+            ).update(sessions_held=F('sessions_held') + 1)
+            update_at_risk_students(attendance.course_id)
+            record_sessions([attendance])
+    if closed:
+        attendance.is_active = False
+        attendance.ended_at = ended_at
+        bump_course_version(attendance.course_id, attendance.organization_id)
+    return bool(closed)
+
+
+def close_expired_sessions():
+    """
+    Close sessions left open past their day or their ended_at, counting them
+    like any other close. Check-ins open a new session each day, so an
+    earlier day's session can no longer be attended.
+
+    Returns:
+        int: Number of sessions closed
+    """
+    now = timezone.now()
+    expired = Attendance.objects.filter(is_active=True).filter(
+        Q(date__lt=timezone.localdate()) | Q(ended_at__lte=now)
+    ).only('id', 'course_id', 'date', 'organization_id', 'is_active', 'ended_at')
+    return sum(close_session(attendance, attendance.ended_at) for attendance in expired.iterator())
+
+
+def annotate_expected_counters(enrollments):
+    """
+    Annotate enrollments with counter values recomputed from sessions and presence rows
+    """
+    presence = Attendance.present_students.through
+    held = Attendance.objects.filter(
+        course_id=OuterRef('course_id'),
+        is_active=False,
+        date__gte=TruncDate(ExpressionWrapper(OuterRef('enrolled_at'), output_field=DateTimeField())),
+    ).values('course_id').annotate(total=Count('pk')).values('total')
+    attended = presence.objects.filter(
+        student_id=OuterRef('student_id'),
+        attendance__course_id=OuterRef('course_id'),
+    ).values('student_id').annotate(total=Count('pk')).values('total')
+    return enrollments.annotate(
+        expected_held=Coalesce(Subquery(held, output_field=IntegerField()), Value(0)),
+        expected_attended=Coalesce(Subquery(attended, output_field=IntegerField()), Value(0)),
+    )
+
+
+def reconcile_enrollment_counters(enrollments=None, batch_size=500):
+    """
+    Rewrite counters that drifted from the underlying attendance data.
+
+    Returns:
+        int: Number of enrollments corrected
+    """
+    if enrollments is None:
+        enrollments = CourseEnrollment.objects.all()
+    mismatched = annotate_expected_counters(enrollments).exclude(
+        sessions_held=F('expected_held'), sessions_attended=F('expected_attended')
+    )
+
+    corrected = 0
+    batch = []
+    for enrollment in mismatched.iterator(chunk_size=batch_size):
+        enrollment.sessions_held = enrollment.expected_held
+        enrollment.sessions_attended = enrollment.expected_attended
+        batch.append(enrollment)
+        if len(batch) >= batch_size:
+            CourseEnrollment.objects.bulk_update(batch, ['sessions_held', 'sessions_attended'])
+            corrected += len(batch)
+            batch = []
+    if batch:
+        CourseEnrollment.objects.bulk_update(batch, ['sessions_held', 'sessions_attended'])
+        corrected += len(batch)
+    return corrected
+
+
+def update_at_risk_students(course_id):
+    """
+    Refresh the at-risk entries of one course from its enrollment counters.
+
+    Only this course's enrollments are read, so the cost of closing a session
+    is proportional to the class size rather than the student body.
+    """
+    threshold = getattr(settings, 'AT_RISK_THRESHOLD', 75.0)
+    min_sessions = getattr(settings, 'AT_RISK_MIN_SESSIONS', 3)
+    organization_id = Course.objects.filter(pk=course_id).values_list('organization_id', flat=True).first()
+
+    at_risk = []
+    enrollments = CourseEnrollment.objects.filter(course_id=course_id).values_list(
+        'student_id', 'sessions_held', 'sessions_attended'
+    )
+    for student_id, held, attended in enrollments:
+        if held < min_sessions:
+            continue
+        rate = round(min(attended, held) / held * 100, 2)
+        if rate < threshold:
+            at_risk.append(AtRiskStudent(
+                organization_id=organization_id,
+                student_id=student_id,
+                course_id=course_id,
+                attendance_rate=rate,
+                sessions_held=held,
+                sessions_attended=attended,
+            ))
+
+    with transaction.atomic():
+        AtRiskStudent.objects.filter(course_id=course_id).exclude(
+            student_id__in=[entry.student_id for entry in at_risk]
+        ).delete()
+        AtRiskStudent.objects.bulk_create(
+            at_risk,
+            update_conflicts=True,
+            unique_fields=['student', 'course'],
+            update_fields=['organization', 'attendance_rate', 'sessions_held', 'sessions_attended', 'updated_at'],
+        )
+    return len(at_risk)
+
+
+def rebuild_at_risk_students(course_ids=None):
+    """
+    Recompute at-risk entries for the given courses (all courses by default)
+    """
+    if course_ids is None:
+        course_ids = Course.objects.values_list('pk', flat=True)
+    return sum(update_at_risk_students(course_id) for course_id in course_ids)
+
+
+ROSTER_REPLACE = 'replace'
+ROSTER_ADD = 'add'
+ROSTER_REMOVE = 'remove'
+ROSTER_MODES = (ROSTER_REPLACE, ROSTER_ADD, ROSTER_REMOVE)
+
+
+def diff_course_roster(course, student_ids, mode=ROSTER_REPLACE):
+    """
+    Compare a roster against a course's enrollments (one query).
+
+    `replace` makes the enrollments exactly `student_ids`, `add` only inserts
+    and `remove` only deletes.
+
+    Returns:
+        tuple: (student ids to enroll, student ids to unenroll), both sorted
+    """
+    wanted = set(student_ids)
+    existing = set(CourseEnrollment.objects.filter(course=course).values_list('student_id', flat=True))
+    to_add = wanted - existing if mode in (ROSTER_REPLACE, ROSTER_ADD) else set()
+    if mode == ROSTER_REPLACE:
+        to_remove = existing - wanted
+    elif mode == ROSTER_REMOVE:
+        to_remove = existing & wanted
+    else:
+        to_remove = set()
+    return sorted(to_add), sorted(to_remove)
+
+
+def apply_course_roster(course, student_ids, mode=ROSTER_REPLACE, batch_size=1000):
+    """
+    Enroll and unenroll students set-wise: one diff query, batched inserts
+    and one delete, whatever the roster size. The course row is locked while
+    the diff is taken and applied, so concurrent roster edits of the same
+    course run one after the other instead of working from a stale diff.
+
+    Returns:
+        dict: Counts of students added, removed and left unchanged
+    """
+    with transaction.atomic():
+        course = Course.objects.select_for_update().get(pk=course.pk)
+        to_add, to_remove = diff_course_roster(course, student_ids, mode)
+        # Conflicts mean a concurrent enrollment got there first, which is the same outcome
+        CourseEnrollment.objects.bulk_create(
+            [CourseEnrollment(course=course, student_id=student_id) for student_id in to_add],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        if to_remove:
+            removed = CourseEnrollment.objects.filter(course=course, student_id__in=to_remove)
+            # Logged and bumped set-wise below rather than once per row by enrollment_changed
+            removed.sync_recorded = True
+            removed.delete()
+            AtRiskStudent.objects.filter(course=course, student_id__in=to_remove).delete()
+        # bulk_create sends no signals, so log for delta sync here
+        record_enrollments(course.pk, to_add)
+        record_enrollments(course.pk, to_remove, deleted=True)
+
+    if to_add or to_remove:
+        bump_course_version(course.pk, course.organization_id)
+        bump_course_list_version()
+    return {
+        'added': len(to_add),
+        'removed': len(to_remove),
+        # Requested students whose enrollment already matched
+        'unchanged': len(set(student_ids)) - (len(to_remove) if mode == ROSTER_REMOVE else len(to_add)),
+    }
@@ -0,0 +1,62 @@
+"""
+Conditional GET (ETag / Last-Modified) for read-heavy endpoints.
+
+Validators are built from the version counters in version_utils rather than
+a hash of the rendered body, so a request whose If-None-Match (or
+If-Modified-Since) still matches is answered with 304 Not Modified before
+the view runs any of its queries or serializers.
+"""
+from functools import wraps
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from .version_utils import get_versions
+import hashlib
+
+
+def version_validators(request, scopes, extra=None):
+    """
+    ETag and Last-Modified (a Unix timestamp) for a response that depends on
+    the given (scope, pk) version counters. The ETag also covers the URL,
+    requested media type and user, since the same versions render differently
+    for each.
+
+    Returns:
+        tuple: (etag, last_modified)
+    """
+    versions = get_versions(scopes)
+    key = (request.get_full_path(), request.META.get('HTTP_ACCEPT', ''), request.user.pk, scopes, versions, extra)
+    etag = f'W/"{hashlib.sha1(repr(key).encode()).hexdigest()}"'
+    last_modified = max(versions) // 1_000_000_000 if versions else None
+    return etag, last_modified
+
+
+def conditional_on_versions(scopes, extra=None):
+    """
+    Decorate a view method with version-based conditional GET.
+
+    `scopes(view, request, *args, **kwargs)` returns the (scope, pk) counters
+    the response depends on; `extra`, with the same signature, returns any
+    other value the response depends on (e.g. today's date). Responses are
+    marked private and must be revalidated, so browsers send If-None-Match on
+    every poll and get a 304 while nothing has changed.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            etag, last_modified = version_validators(
+                request,
+                list(scopes(view, request, *args, **kwargs)),
+                extra(view, request, *args, **kwargs) if extra else None,
+            )
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = method(view, request, *args, **kwargs)
+                if response.status_code == 200:
+                    response.headers.setdefault('ETag', etag)
+                    if last_modified is not None:
+                        response.headers.setdefault('Last-Modified', http_date(last_modified))
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('Authorization', 'Cookie'))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,235 @@
+"""
+Columnar (Parquet / Arrow IPC) export of attendance history for the data warehouse.
+
+A full export reads each table in primary-key order through .iterator() and
+writes it one record batch at a time, so memory stays flat. Every export
+returns a watermark (a timestamp); passing it back as `since` exports only
+what changed after it, read from the delta sync change log (SyncChange):
+
+- Each changed key is exported once with its current row, or as a tombstone
+  (deleted=true, key columns only) when the row no longer exists. Load every
+  table as upserts/deletes by key: id for sessions, (session_id, student_id)
+  for presence and (course_id, student_id) for enrollments.
+- Log entries are written as their transaction commits. The watermark
+  trails the clock by EXPORT_LAG_SECONDS, and the next export re-reads
+  EXPORT_OVERLAP_SECONDS before it, so an entry that became visible after
+  the previous export read the log is picked up by a later export instead
+  of being skipped. Keys seen twice are simply upserted again.
+- A watermark older than the change log's retention cannot be continued;
+  run a full export instead.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Attendance, Course, CourseEnrollment, SyncChange
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+EXPORT_FORMATS = {
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.file'),
+}
+
+# Column name, ORM lookup and Arrow type of each exported table, the change
+# log table it is tracked in, and its key as (ORM lookup, SyncChange field) pairs
+EXPORT_TABLES = {
+    'sessions': {
+        'queryset': lambda: Attendance.objects.all(),
+        'organization': 'organization_id',
+        'log_table': SyncChange.TABLE_SESSION,
+        'key': [('id', 'object_id')],
+        'columns': [
+            ('id', 'id', 'int64'),
+            ('course_id', 'course_id', 'int64'),
+            ('organization_id', 'organization_id', 'int64'),
+            ('date', 'date', 'date32'),
+            ('is_active', 'is_active', 'bool_'),
+            ('created_at', 'created_at', 'timestamp'),
+            ('ended_at', 'ended_at', 'timestamp'),
+            ('updated_at', 'updated_at', 'timestamp'),
+        ],
+    },
+    'presence': {
+        'queryset': lambda: Attendance.present_students.through.objects.all(),
+        'organization': 'attendance__organization_id',
+        'log_table': SyncChange.TABLE_PRESENCE,
+        'key': [('attendance_id', 'object_id'), ('student_id', 'student_id')],
+        'columns': [
+            ('id', 'id', 'int64'),
+            ('session_id', 'attendance_id', 'int64'),
+            ('student_id', 'student_id', 'int64'),
+            ('organization_id', 'attendance__organization_id', 'int64'),
+        ],
+    },
+    'enrollments': {
+        'queryset': lambda: CourseEnrollment.objects.all(),
+        'organization': 'course__organization_id',
+        'log_table': SyncChange.TABLE_ENROLLMENT,
+        'key': [('course_id', 'object_id'), ('student_id', 'student_id')],
+        'columns': [
+            ('id', 'id', 'int64'),
+            ('course_id', 'course_id', 'int64'),
+            ('student_id', 'student_id', 'int64'),
+            ('organization_id', 'course__organization_id', 'int64'),
+            ('enrolled_at', 'enrolled_at', 'timestamp'),
+        ],
+    },
+}
+
+
+def _arrow_type(name):
+    if name == 'timestamp':
+        return pa.timestamp('us', tz='UTC')
+    return getattr(pa, name)()
+
+
+def export_schema(table):
+    fields = [(column, _arrow_type(type_name)) for column, _, type_name in EXPORT_TABLES[table]['columns']]
+    return pa.schema(fields + [('deleted', pa.bool_())])
+
+
+def parse_watermark(value):
+    """Turn a watermark string back into a timestamp"""
+    if value in (None, ''):
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f'Invalid watermark: {value}')
+    return parsed
+
+
+def serialize_watermark(value):
+    if value is None:
+        return None
+    return value.isoformat()
+
+
+def export_queryset(table, organization_id=None):
+    """Every row of a table, oldest first"""
+    spec = EXPORT_TABLES[table]
+    queryset = spec['queryset']()
+    if organization_id:
+        queryset = queryset.filter(**{spec['organization']: organization_id})
+    return queryset.order_by('id')
+
+
+def export_window(since, now=None):
+    """
+    The change log window an export reads: (since - overlap, now - lag]. The
+    upper bound is the watermark the export returns.
+    """
+    now = now or timezone.now()
+    start = since - timedelta(seconds=getattr(settings, 'EXPORT_OVERLAP_SECONDS', 600)) if since else None
+    if start is not None and start < now - timedelta(days=getattr(settings, 'SYNC_LOG_RETENTION_DAYS', 30)):
+        raise ValueError('Watermark is older than the change log retention; run a full export')
+    return start, now - timedelta(seconds=getattr(settings, 'EXPORT_LAG_SECONDS', 60))
+
+
+def changed_keys(table, start, end):
+    """
+    Keys of a table's rows logged as changed in (start, end], once each in
+    change order, mapped to the course id logged with them
+    """
+    spec = EXPORT_TABLES[table]
+    fields = [field for _, field in spec['key']]
+    entries = SyncChange.objects.filter(
+        table=spec['log_table'], created_at__gt=start, created_at__lte=end
+    ).order_by('id').values_list('course_id', *fields)
+    keys = {}
+    for course_id, *key in entries.iterator():
+        keys.setdefault(tuple(key), course_id)
+    return keys
+
+
+def export_rows(table, organization_id=None, start=None, end=None, batch_size=10000):
+    """
+    Row tuples to export, each ending with its deleted flag: the whole table
+    when `start` is None, otherwise the current row or a tombstone for every
+    key logged as changed in (start, end]
+    """
+    spec = EXPORT_TABLES[table]
+    lookups = [lookup for _, lookup, _ in spec['columns']]
+    if start is None:
+        for row in export_queryset(table, organization_id).values_list(*lookups).iterator(chunk_size=batch_size):
+            yield row + (False,)
+        return
+
+    key_indexes = [lookups.index(lookup) for lookup, _ in spec['key']]
+    keys = changed_keys(table, start, end)
+    visible_courses = None
+    if organization_id:
+        # Tombstones outlive their rows; scope them by the course they were logged under
+        visible_courses = set(Course.objects.filter(organization_id=organization_id).values_list('pk', flat=True))
+
+    pending = list(keys)
+    for offset in range(0, len(pending), batch_size):
+        chunk = pending[offset:offset + batch_size]
+        rows = export_queryset(table, organization_id).filter(**{
+            f'{lookup}__in': {key[i] for key in chunk} for i, (lookup, _) in enumerate(spec['key'])
+        }).values_list(*lookups)
+        current = {tuple(row[i] for i in key_indexes): row for row in rows}
+        for key in chunk:
+            row = current.get(key)
+            if row is not None:
+                yield row + (False,)
+            elif visible_courses is None or keys[key] in visible_courses:
+                tombstone = [None] * len(lookups)
+                for index, value in zip(key_indexes, key):
+                    tombstone[index] = value
+                yield tuple(tombstone) + (True,)
+
+
+def write_export(table, output, file_format='parquet', organization_id=None, since=None, batch_size=None):
+    """
+    Write a table (or what changed in it after `since`) to a Parquet or Arrow IPC file.
+
+    Args:
+        table: One of EXPORT_TABLES
+        output: Path or binary file object
+        file_format: One of EXPORT_FORMATS
+        organization_id: Restrict the export to one organization
+        since: Watermark returned by the previous export
+
+    Returns:
+        tuple: (number of rows written, watermark to pass to the next export)
+    """
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError('pyarrow is required for columnar exports')
+    if batch_size is None:
+        batch_size = getattr(settings, 'EXPORT_BATCH_SIZE', 50000)
+
+    start, end = export_window(parse_watermark(since))
+    schema = export_schema(table)
+    rows = export_rows(table, organization_id, start, end, batch_size=min(batch_size, 10000))
+    if file_format == 'parquet':
+        writer = pq.ParquetWriter(output, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_file(output, schema)
+
+    total = 0
+    batch = []
+
+    def flush():
+        # Transpose row tuples into one array per column
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)]
+        writer.write_batch(pa.record_batch(arrays, schema=schema))
+
+    try:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush()
+                total += len(batch)
+                batch = []
+        if batch:
+            flush()
+            total += len(batch)
+    finally:
+        writer.close()
+    return total, serialize_watermark(end)
@@ -0,0 +1,106 @@
+"""
+Request-scoped identity: who is calling, as a student or lecturer, in which organization.
+
+get_identity(request) loads the user's student and lecturer profiles and
+their organizations in one joined query (none when IdentityTokenAuthentication
+already loaded them with the token) and caches the result on the request.
+The profiles are also cached on request.user itself, so code that still reads
+user.student / user.lecturer does not query again.
+"""
+from django.contrib.auth.models import User
+from django.http import Http404
+
+IDENTITY_RELATED = ('student__organization', 'lecturer__organization')
+
+
+class Identity:
+    def __init__(self, user, student=None, lecturer=None):
+        self.user = user
+        self.student = student
+        self.lecturer = lecturer
+
+    @property
+    def is_student(self):
+        return self.student is not None
+
+    @property
+    def is_lecturer(self):
+        return self.lecturer is not None
+
+    @property
+    def is_admin(self):
+        return self.user.is_staff or self.user.is_superuser
+
+    @property
+    def role(self):
+        """lecturer, student, admin or user (a lecturer who is also staff is a lecturer)"""
+        if self.is_lecturer:
+            return 'lecturer'
+        if self.is_student:
+            return 'student'
+        return 'admin' if self.is_admin else 'user'
+
+    @property
+    def profile(self):
+        return self.lecturer or self.student
+
+    @property
+    def organization(self):
+        """The organization of the user's lecturer profile, else their student profile"""
+        for profile in (self.lecturer, self.student):
+            if profile is not None and profile.organization_id:
+                return profile.organization
+        return None
+
+    @property
+    def organization_ids(self):
+        """Organizations of every profile the user has"""
+        return [p.organization_id for p in (self.student, self.lecturer) if p and p.organization_id]
+
+
+def _profiles_cached(user):
+    return User.student.related.is_cached(user) and User.lecturer.related.is_cached(user)
+
+
+def load_identity(user):
+    """Identity of a user, reading their profiles from the instance cache or one joined query"""
+    if not getattr(user, 'is_authenticated', False):
+        return Identity(user)
+    if not _profiles_cached(user):
+        loaded = User.objects.select_related(*IDENTITY_RELATED).get(pk=user.pk)
+        for descriptor in (User.student, User.lecturer):
+            profile = descriptor.related.get_cached_value(loaded)
+            if profile is not None:
+                # Point the profile back at the caller's instance, not the copy
+                profile.user = user
+            descriptor.related.set_cached_value(user, profile)
+    return Identity(
+        user,
+        student=User.student.related.get_cached_value(user),
+        lecturer=User.lecturer.related.get_cached_value(user),
+    )
+
+
+def get_identity(request):
+    """The request's Identity, loaded once per request"""
+    # DRF's Request wraps the HttpRequest; cache on the one middleware and views share
+    request = getattr(request, '_request', request)
+    identity = getattr(request, '_identity', None)
+    if identity is None or identity.user is not request.user:
+        identity = load_identity(request.user)
+        request._identity = identity
+    return identity
+
+
+def student_or_404(request):
+    student = get_identity(request).student
+    if student is None:
+        raise Http404('No Student matches the given query.')
+    return student
+
+
+def lecturer_or_404(request):
+    lecturer = get_identity(request).lecturer
+    if lecturer is None:
+        raise Http404('No Lecturer matches the given query.')
+    return lecturer
@@ -0,0 +1,95 @@
+import time
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from attendance.models import Attendance, Course, CourseEnrollment, Lecturer, Student
+from attendance.renderers import ORJSON_AVAILABLE, FastJSONRenderer
+from attendance.serializers import AttendanceSerializer
+from attendance.values_utils import attendance_history, session_roster_values
+from attendance.views import AttendanceViewSet
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Compares serializer + JSONRenderer with values-mode rows + FastJSONRenderer for session rosters '
+            'and history, on synthetic data that is rolled back afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=2000, help='Students enrolled in the synthetic course')
+        parser.add_argument('--sessions', type=int, default=30, help='Sessions held in the synthetic course')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement (best is reported)')
+
+    def seed(self, students, sessions):
+        """One course with `students` enrolled and `sessions` sessions, 90% attendance"""
+        lecturer = Lecturer.objects.create(
+            user=User.objects.create(username='benchmark-lecturer'), staff_id='BENCH', name='Benchmark Lecturer'
+        )
+        course = Course.objects.create(name='Benchmark Course', course_code='BENCH101', lecturer=lecturer)
+        users = User.objects.bulk_create([User(username=f'benchmark-student-{i}') for i in range(students)])
+        roster = Student.objects.bulk_create([
+            Student(user=user, student_id=f'B{i:07d}', name=f'Benchmark Student {i}') for i, user in enumerate(users)
+        ])
+        CourseEnrollment.objects.bulk_create([CourseEnrollment(course=course, student=student) for student in roster])
+        start = date(2024, 1, 1)
+        attendances = Attendance.objects.bulk_create([
+            Attendance(course=course, date=start + timedelta(days=day)) for day in range(sessions)
+        ])
+        presence = Attendance.present_students.through
+        for attendance in attendances:
+            presence.objects.bulk_create([
+                presence(attendance_id=attendance.pk, student_id=student.pk)
+                for i, student in enumerate(roster) if i % 10
+            ])
+        return course, attendances[-1]
+
+    def measure(self, build, renderer, repeat):
+        best_build = best_render = float('inf')
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                data = build()
+                built = time.perf_counter()
+            body = renderer.render(data)
+            rendered = time.perf_counter()
+            best_build = min(best_build, built - started)
+            best_render = min(best_render, rendered - built)
+        return best_build, best_render, len(queries), len(body)
+
+    def handle(self, *args, **options):
+        if not ORJSON_AVAILABLE:
+            self.stdout.write(self.style.WARNING('orjson is not installed; FastJSONRenderer falls back to JSONRenderer'))
+        try:
+            with transaction.atomic():
+                course, attendance = self.seed(options['students'], options['sessions'])
+                sessions = Attendance.objects.filter(course=course)
+                cases = [
+                    ('roster', 'serializer',
+                     lambda: AttendanceSerializer(AttendanceViewSet.queryset.get(pk=attendance.pk)).data, JSONRenderer()),
+                    ('roster', 'values',
+                     lambda: session_roster_values(Attendance.objects.get(pk=attendance.pk)), JSONRenderer()),
+                    ('roster', 'values+fast',
+                     lambda: session_roster_values(Attendance.objects.get(pk=attendance.pk)), FastJSONRenderer()),
+                    ('history', 'serializer',
+                     lambda: AttendanceSerializer(AttendanceViewSet.queryset.filter(course=course), many=True).data,
+                     JSONRenderer()),
+                    ('history', 'values', lambda: attendance_history(sessions), JSONRenderer()),
+                    ('history', 'values+fast', lambda: attendance_history(sessions), FastJSONRenderer()),
+                ]
+                self.stdout.write(
+                    f"{'endpoint':<8}  {'path':<11}  {'build ms':>9}  {'render ms':>9}  {'queries':>7}  {'KB':>8}"
+                )
+                for endpoint, path, build, renderer in cases:
+                    build_time, render_time, queries, size = self.measure(build, renderer, options['repeat'])
+                    self.stdout.write(
+                        f"{endpoint:<8}  {path:<11}  {build_time * 1000:>9.1f}  {render_time * 1000:>9.1f}  "
+                        f"{queries:>7}  {size / 1024:>8.0f}"
+                    )
+                raise Rollback
+        except Rollback:
+            pass
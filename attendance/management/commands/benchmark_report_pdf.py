@@ -0,0 +1,63 @@
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from attendance.report_utils import generate_attendance_pdf, write_attendance_pdf
+
+
+def synthetic_rows(count):
+    """Report rows shaped like iter_attendance_report_rows, without touching the database"""
+    start = date(2024, 1, 1)
+    for idx in range(count):
+        yield (
+            idx // 50,
+            start + timedelta(days=idx // 500),
+            f'CS{idx % 40:03d}',
+            f'Introduction to Course {idx % 40}',
+            f'Lecturer {idx % 25}',
+            f'S{idx:07d}',
+            f'Student Number {idx}',
+        )
+
+
+class Command(BaseCommand):
+    help = 'Compares the platypus table PDF renderer with the page-at-a-time canvas renderer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--table-max-rows', type=int, default=10000,
+                            help='Skip the platypus renderer above this many rows (it takes minutes at 100k)')
+        parser.add_argument('--memory', action='store_true',
+                            help='Also report peak Python memory (tracemalloc slows rendering several times over)')
+
+    def measure(self, render, count, memory=False):
+        if memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        with tempfile.TemporaryFile() as output:
+            render(synthetic_rows(count), output)
+            size = output.tell()
+        elapsed = time.perf_counter() - started
+        peak = None
+        if memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return elapsed, peak, size
+
+    def handle(self, *args, **options):
+        renderers = [
+            ('table', lambda rows, output: output.write(generate_attendance_pdf(rows, total=0).getvalue())),
+            ('canvas', lambda rows, output: write_attendance_pdf(rows, output, total=0)),
+        ]
+        self.stdout.write(f"{'rows':>8}  {'renderer':<8}  {'seconds':>8}  {'rows/s':>9}  {'peak MB':>8}  {'size KB':>8}")
+        for count in options['rows']:
+            for name, render in renderers:
+                if name == 'table' and count > options['table_max_rows']:
+                    self.stdout.write(f"{count:>8}  {name:<8}  {'skipped':>8}")
+                    continue
+                elapsed, peak, size = self.measure(render, count, options['memory'])
+                peak = f"{peak / 1024 / 1024:>8.1f}" if peak is not None else f"{'-':>8}"
+                self.stdout.write(
+                    f"{count:>8}  {name:<8}  {elapsed:>8.2f}  {count / elapsed:>9.0f}  {peak}  {size / 1024:>8.0f}"
+                )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from attendance.models import Lecturer, Student
+from attendance.thumbnail_utils import profile_picture_stale, refresh_profile_picture_urls
+
+
+class Command(BaseCommand):
+    help = 'Generates profile picture thumbnails and stores their URLs for lecturers and students missing them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Regenerate every picture, e.g. after changing PROFILE_THUMBNAIL_SIZES')
+
+    def handle(self, *args, **options):
+        generated = 0
+        for model in (Lecturer, Student):
+            pictured = model.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True)
+            for instance in pictured.only('pk', 'user_id', 'profile_picture', 'profile_picture_urls').iterator():
+                if options['all'] or profile_picture_stale(instance):
+                    if refresh_profile_picture_urls(instance) is not None:
+                        generated += 1
+        self.stdout.write(self.style.SUCCESS(f'Generated thumbnails for {generated} profile pictures'))
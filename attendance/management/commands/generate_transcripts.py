@@ -0,0 +1,47 @@
+import os
+import time
+from django.core.management.base import BaseCommand
+from attendance.transcript_utils import build_transcript_archive, generate_transcripts
+
+
+class Command(BaseCommand):
+    help = 'Generates one attendance transcript PDF per student, in parallel, into a zip archive or a directory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Path ending in .zip for an archive, otherwise a directory for per-student PDFs')
+        parser.add_argument('--course', type=int, help='Only students of this course id, and only that course')
+        parser.add_argument('--student', type=int, help='Only this student id')
+        parser.add_argument('--organization', type=int, help='Only students of this organization id')
+        parser.add_argument('--start-date', help='First session date to include (YYYY-MM-DD)')
+        parser.add_argument('--end-date', help='Last session date to include (YYYY-MM-DD)')
+        parser.add_argument('--workers', type=int, help='Worker processes (default: TRANSCRIPT_WORKERS or one per core)')
+        parser.add_argument('--batch-size', type=int, help='Students per batch')
+
+    def handle(self, *args, **options):
+        filters = {
+            'course_id': options.get('course'),
+            'student_id': options.get('student'),
+            'start_date': options.get('start_date'),
+            'end_date': options.get('end_date'),
+        }
+        output = options['output']
+        started = time.monotonic()
+
+        if output.endswith('.zip'):
+            count = build_transcript_archive(
+                output, filters, options.get('organization'), options.get('workers'), options.get('batch_size')
+            )
+        else:
+            os.makedirs(output, exist_ok=True)
+
+            def write(filename, data):
+                with open(os.path.join(output, filename), 'wb') as f:
+                    f.write(data)
+
+            count = generate_transcripts(
+                write, filters, options.get('organization'), options.get('workers'), options.get('batch_size')
+            )
+
+        elapsed = time.monotonic() - started
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f'Generated {count} transcripts in {elapsed:.1f}s ({rate:.0f}/s) to {output}'))
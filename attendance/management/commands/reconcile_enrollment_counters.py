@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from attendance.enrollment_utils import close_expired_sessions, reconcile_enrollment_counters, rebuild_at_risk_students
+from attendance.models import CourseEnrollment
+
+
+class Command(BaseCommand):
+    help = 'Recomputes per-enrollment session counters from attendance records and fixes any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, help='Only reconcile enrollments of this course id')
+
+    def handle(self, *args, **options):
+        # Sessions left open past their day never counted as held
+        expired = close_expired_sessions()
+        if expired:
+            self.stdout.write(self.style.WARNING(f'Closed {expired} expired sessions'))
+
+        enrollments = CourseEnrollment.objects.all()
+        if options.get('course'):
+            enrollments = enrollments.filter(course_id=options['course'])
+
+        corrected = reconcile_enrollment_counters(enrollments)
+        if corrected:
+            self.stdout.write(self.style.WARNING(f'Corrected counters on {corrected} enrollments'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All enrollment counters are consistent'))
+
+        # The at-risk table is derived from the counters, so rebuild it too
+        course_ids = [options['course']] if options.get('course') else None
+        at_risk = rebuild_at_risk_students(course_ids)
+        self.stdout.write(self.style.SUCCESS(f'{at_risk} enrollments flagged as at risk'))
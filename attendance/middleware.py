@@ -1,7 +1,15 @@
+from django.conf import settings
 from django.core.cache import cache
 from django.http import JsonResponse
-from functools import wraps
-import time
+from django.utils.cache import patch_vary_headers
+import re
+import zlib
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
 
 
 class RateLimitMiddleware:
@@ -50,3 +58,120 @@ class RateLimitMiddleware:
         else:
             ip = request.META.get('REMOTE_ADDR')
         return ip
+
+
+# Content types worth compressing, with their (gzip level, brotli quality).
+# JSON is rendered per request, so it gets a fast level; report streams are
+# large and repetitive, so a lower level still shrinks them most of the way
+# at a fraction of the CPU. Types not listed here (PNG, XLSX, ZIP, PDF,
+# Parquet/Arrow) are already compressed and pass through untouched. HTML
+# (the browsable API, which embeds CSRF tokens) is left alone because of BREACH.
+COMPRESSION_LEVELS = {
+    'application/json': (6, 5),
+    'text/plain': (6, 5),
+    'text/csv': (4, 4),
+    'application/x-ndjson': (4, 4),
+}
+
+
+def _accepted_encodings(request):
+    accepted = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = part.partition(';')
+        q = re.search(r'q\s*=\s*([0-9.]+)', params)
+        try:
+            if q and float(q.group(1)) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _compressor(encoding, level):
+    """(compress, finish) functions of an incremental gzip or brotli compressor"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, compressor.flush
+
+
+def _compress_stream(chunks, encoding, level):
+    compress, finish = _compressor(encoding, level)
+    for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def exempt_from_compression(response):
+    """Keep a response that carries secrets (tokens, credentials) out of CompressionMiddleware"""
+    response.compression_exempt = True
+    return response
+
+
+class CompressionMiddleware:
+    """
+    Compress API and report responses with brotli (when installed and
+    accepted) or gzip, using a level per content type.
+
+    Plain responses are compressed when at least COMPRESSION_MIN_SIZE bytes
+    and only if that makes them smaller; streaming responses (CSV/NDJSON
+    reports) are compressed on the fly unless they declare a smaller
+    Content-Length.
+
+    To keep secrets out of compressed bodies an attacker could probe (BREACH),
+    only GET and HEAD responses are compressed, never ones that set cookies
+    or are marked with exempt_from_compression(). Logins, registration and
+    password resets, which return tokens, are POSTs.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.status_code != 200 or response.has_header('Content-Encoding'):
+            return response
+        if request.method not in ('GET', 'HEAD') or response.cookies or getattr(response, 'compression_exempt', False):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        levels = COMPRESSION_LEVELS.get(content_type)
+        if levels is None:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = _accepted_encodings(request)
+        if BROTLI_AVAILABLE and getattr(settings, 'COMPRESSION_BROTLI', True) and 'br' in accepted:
+            encoding, level = 'br', levels[1]
+        elif 'gzip' in accepted:
+            encoding, level = 'gzip', levels[0]
+        else:
+            return response
+
+        min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        if response.streaming:
+            length = response.get('Content-Length')
+            if length is not None and int(length) < min_size:
+                return response
+            response.streaming_content = _compress_stream(response.streaming_content, encoding, level)
+            # The compressed size is not known until the stream ends
+            if response.has_header('Content-Length'):
+                del response['Content-Length']
+        else:
+            if len(response.content) < min_size:
+                return response
+            compress, finish = _compressor(encoding, level)
+            compressed = compress(response.content) + finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # The encoded body is not byte-identical to the one a strong ETag described
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'W/{etag}'
+        response['Content-Encoding'] = encoding
+        return response
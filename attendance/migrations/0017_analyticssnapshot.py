@@ -0,0 +1,31 @@
+# Generated by Django 5.0.7 on 2026-10-19 04:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0016_merge_20260128_1832'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(choices=[('7d', 'Last 7 days'), ('30d', 'Last 30 days'), ('90d', 'Last 90 days'), ('term', 'Current term')], max_length=10)),
+                ('days', models.PositiveIntegerField()),
+                ('version', models.PositiveIntegerField()),
+                ('data', models.JSONField()),
+                ('deltas', models.JSONField(blank=True, default=dict)),
+                ('computed_at', models.DateTimeField(auto_now_add=True)),
+                ('organization', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='analytics_snapshots', to='attendance.organization')),
+            ],
+            options={
+                'ordering': ['-computed_at'],
+                'unique_together': {('organization', 'window', 'version')},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.7 on 2026-10-19 04:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_attendance_organization(apps, schema_editor):
+    Attendance = apps.get_model('attendance', 'Attendance')
+    Course = apps.get_model('attendance', 'Course')
+    Attendance.objects.filter(organization__isnull=True).update(
+        organization=models.Subquery(
+            Course.objects.filter(pk=models.OuterRef('course_id')).values('organization')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0017_analyticssnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='organization',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attendances', to='attendance.organization'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['organization', 'created_at'], name='attendance__organiz_b317e1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['organization', 'date'], name='attendance__organiz_886ec1_idx'),
+        ),
+        migrations.RunPython(backfill_attendance_organization, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.7 on 2026-10-19 04:25
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def backfill_enrollment_counters(apps, schema_editor):
+    CourseEnrollment = apps.get_model('attendance', 'CourseEnrollment')
+    Attendance = apps.get_model('attendance', 'Attendance')
+    Presence = Attendance.present_students.through
+    held = Attendance.objects.filter(
+        course_id=models.OuterRef('course_id'),
+        is_active=False,
+        date__gte=TruncDate(models.ExpressionWrapper(models.OuterRef('enrolled_at'), output_field=models.DateTimeField())),
+    ).values('course_id').annotate(total=models.Count('pk')).values('total')
+    attended = Presence.objects.filter(
+        student_id=models.OuterRef('student_id'),
+        attendance__course_id=models.OuterRef('course_id'),
+    ).values('student_id').annotate(total=models.Count('pk')).values('total')
+    CourseEnrollment.objects.update(
+        sessions_held=Coalesce(models.Subquery(held, output_field=models.IntegerField()), models.Value(0)),
+        sessions_attended=Coalesce(models.Subquery(attended, output_field=models.IntegerField()), models.Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0018_attendance_organization'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courseenrollment',
+            name='sessions_attended',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='courseenrollment',
+            name='sessions_held',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_enrollment_counters, migrations.RunPython.noop),
+    ]
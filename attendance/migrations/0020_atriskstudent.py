@@ -0,0 +1,33 @@
+# Generated by Django 5.0.7 on 2026-10-19 04:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0019_courseenrollment_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AtRiskStudent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attendance_rate', models.FloatField()),
+                ('sessions_held', models.PositiveIntegerField()),
+                ('sessions_attended', models.PositiveIntegerField()),
+                ('flagged_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='at_risk_entries', to='attendance.course')),
+                ('organization', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='at_risk_students', to='attendance.organization')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='at_risk_entries', to='attendance.student')),
+            ],
+            options={
+                'ordering': ['attendance_rate', 'id'],
+                'indexes': [models.Index(fields=['organization', 'attendance_rate', 'id'], name='attendance__organiz_7f60d4_idx')],
+                'unique_together': {('student', 'course')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-19 04:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0022_reportcacheentry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reportjob',
+            name='format',
+            field=models.CharField(choices=[('pdf', 'PDF'), ('excel', 'Excel'), ('csv', 'CSV'), ('ndjson', 'NDJSON'), ('transcript', 'Student transcripts (zip)')], default='pdf', max_length=10),
+        ),
+    ]
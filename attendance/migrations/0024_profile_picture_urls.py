@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-19 05:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0023_reportjob_transcript_format'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lecturer',
+            name='profile_picture_urls',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='profile_picture_urls',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.7 on 2026-10-19 05:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0024_profile_picture_urls'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('table', models.CharField(choices=[('course', 'Course'), ('enrollment', 'Enrollment'), ('session', 'Session'), ('presence', 'Presence')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('course_id', models.BigIntegerField(null=True)),
+                ('student_id', models.BigIntegerField(null=True)),
+                ('lecturer_id', models.BigIntegerField(null=True)),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['course_id', 'id'], name='attendance__course__a15972_idx'), models.Index(fields=['student_id', 'id'], name='attendance__student_de55a0_idx'), models.Index(fields=['lecturer_id', 'id'], name='attendance__lecture_1d9686_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.7 on 2026-10-19 06:31
+
+import attendance.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0025_sync_change'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reportcacheentry',
+            name='artifact',
+            field=models.FileField(storage=attendance.models.report_storage, upload_to=attendance.models.report_cache_path),
+        ),
+        migrations.AlterField(
+            model_name='reportjob',
+            name='artifact',
+            field=models.FileField(blank=True, null=True, storage=attendance.models.report_storage, upload_to=attendance.models.report_artifact_path),
+        ),
+    ]
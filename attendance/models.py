@@ -5,7 +5,11 @@ from geopy.distance import geodesic
 from datetime import timedelta
 from django.utils import timezone
 from django.utils.text import slugify
+import os
 import secrets
+import uuid
+from .thumbnail_utils import profile_picture_stale, schedule_profile_thumbnails
+from .version_utils import bump_course_version
 
 
 class Organization(models.Model):
@@ -37,6 +41,8 @@ class Lecturer(models.Model):
     staff_id = models.CharField(max_length=10, unique=True)
     name = models.CharField(max_length=100)
     profile_picture = models.ImageField(upload_to='lecturer_pictures/', blank=True, null=True)
+    # Public URLs of the picture and its thumbnails, maintained by thumbnail_utils
+    profile_picture_urls = models.JSONField(default=dict, blank=True, editable=False)
     department = models.CharField(max_length=255, blank=True, null=True)
     phone_number = models.CharField(max_length=15, blank=True, null=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
@@ -46,6 +52,14 @@ class Lecturer(models.Model):
     def __str__(self):
         return f"{self.name} ({self.staff_id})"
 
+    def save(self, *args, **kwargs):
+        stale = profile_picture_stale(self)
+        if stale and not self.profile_picture:
+            self.profile_picture_urls = {}
+        super().save(*args, **kwargs)
+        if stale and self.profile_picture:
+            schedule_profile_thumbnails(self)
+
     def validate_coordinates(self):
         if self.latitude is not None and self.longitude is not None:
             if not (-90 <= self.latitude <= 90 and -180 <= self.longitude <= 180):
@@ -60,6 +74,8 @@ class Student(models.Model):
     student_id = models.CharField(max_length=10, unique=True)
     name = models.CharField(max_length=100)
     profile_picture = models.ImageField(upload_to='student_pictures/', blank=True, null=True)
+    # Public URLs of the picture and its thumbnails, maintained by thumbnail_utils
+    profile_picture_urls = models.JSONField(default=dict, blank=True, editable=False)
     programme_of_study = models.CharField(max_length=255, blank=True, null=True)
     year = models.CharField(max_length=2, blank=True, null=True)
     phone_number = models.CharField(max_length=15, blank=True, null=True)
@@ -68,6 +84,14 @@ class Student(models.Model):
     def __str__(self):
         return f"{self.name} ({self.student_id})"
 
+    def save(self, *args, **kwargs):
+        stale = profile_picture_stale(self)
+        if stale and not self.profile_picture:
+            self.profile_picture_urls = {}
+        super().save(*args, **kwargs)
+        if stale and self.profile_picture:
+            schedule_profile_thumbnails(self)
+
     def get_full_name(self):
         return f"{self.name} ({self.student_id})"
 
@@ -91,10 +115,20 @@ class CourseEnrollment(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     enrolled_at = models.DateTimeField(auto_now_add=True)
+    # Maintained by enrollment_utils; rebuild with `manage.py reconcile_enrollment_counters`
+    sessions_held = models.PositiveIntegerField(default=0)  # Closed sessions since enrollment
+    sessions_attended = models.PositiveIntegerField(default=0)
 
     class Meta:
         unique_together = ('course', 'student')
 
+    @property
+    def attendance_percentage(self):
+        if not self.sessions_held:
+            return None
+        # Check-ins to a still-open session count before the session does
+        return round(min(self.sessions_attended, self.sessions_held) / self.sessions_held * 100, 2)
+
 class Attendance(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='attendances')
     date = models.DateField()
@@ -108,17 +142,28 @@ class Attendance(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     allowed_radius_meters = models.IntegerField(default=100)  # Configurable radius
+    # Denormalized from course so per-tenant analytics can use the composite indexes below
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='attendances', null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['organization', 'created_at']),
+            models.Index(fields=['organization', 'date']),
+        ]
 
     def __str__(self):
         return f"{self.course.name} - {self.date} (Active: {self.is_active})"
 
     def save(self, *args, **kwargs):
+        if self.organization_id is None and self.course_id:
+            self.organization_id = self.course.organization_id
         if self.is_active:
             self.course.is_active = True
             self.course.save()
         if self.ended_at is not None:
             self.is_active = False
         super().save(*args, **kwargs)
+        bump_course_version(self.course_id, self.organization_id)
 
     def is_open(self):
         return self.is_active and (self.ended_at is None or self.ended_at > timezone.now())
@@ -225,6 +270,187 @@ class Feedback(models.Model):
         return f"Feedback({who}) - {self.rating}"
 
 
+class AtRiskStudent(models.Model):
+    """Enrollment whose attendance rate is below AT_RISK_THRESHOLD, maintained as sessions close."""
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='at_risk_students', null=True, blank=True)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='at_risk_entries')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='at_risk_entries')
+    attendance_rate = models.FloatField()
+    sessions_held = models.PositiveIntegerField()
+    sessions_attended = models.PositiveIntegerField()
+    flagged_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['attendance_rate', 'id']
+        unique_together = ('student', 'course')
+        indexes = [
+            models.Index(fields=['organization', 'attendance_rate', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.student} - {self.course.course_code} ({self.attendance_rate}%)"
+
+
+class AnalyticsSnapshot(models.Model):
+    """Precomputed admin analytics for one organization and reporting window."""
+    WINDOW_CHOICES = [
+        ('7d', 'Last 7 days'),
+        ('30d', 'Last 30 days'),
+        ('90d', 'Last 90 days'),
+        ('term', 'Current term'),
+    ]
+
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='analytics_snapshots', null=True, blank=True)
+    window = models.CharField(max_length=10, choices=WINDOW_CHOICES)
+    days = models.PositiveIntegerField()
+    version = models.PositiveIntegerField()
+    data = models.JSONField()
+    deltas = models.JSONField(default=dict, blank=True)  # Change against the previous version
+    computed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-computed_at']
+        unique_together = ('organization', 'window', 'version')
+
+    def __str__(self):
+        org = self.organization.name if self.organization else 'All organizations'
+        return f"{org} - {self.window} v{self.version}"
+
+
+def report_storage():
+    """
+    Storage for rendered reports. Media on S3 is public-read for profile
+    pictures, so reports get their own private copy of that storage: no ACL
+    grant and signed URLs only. Downloads still go through ReportJobDownloadView.
+    """
+    from django.core.files.storage import default_storage
+    try:
+        from storages.backends.s3boto3 import S3Boto3Storage
+    except ImportError:
+        return default_storage
+    if not isinstance(default_storage, S3Boto3Storage):
+        return default_storage
+    return S3Boto3Storage(default_acl='private', querystring_auth=True, custom_domain=None, file_overwrite=False)
+
+
+def _random_artifact_name(directory, filename):
+    extension = os.path.splitext(filename)[1]
+    return f"{timezone.now():{directory}}{uuid.uuid4().hex}{extension}"
+
+
+def report_artifact_path(instance, filename):
+    """reports/<year>/<month>/<random>.<ext>: keys must not be guessable from the job id"""
+    return _random_artifact_name('reports/%Y/%m/', filename)
+
+
+def report_cache_path(instance, filename):
+    """report_cache/<random>.<ext>: the cache key is derived from the filters, so it is not used as the name"""
+    return _random_artifact_name('report_cache/', filename)
+
+
+class ReportJob(models.Model):
+    """Attendance report rendered in the background and stored as a downloadable artifact."""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    FORMAT_CHOICES = [
+        ('pdf', 'PDF'),
+        ('excel', 'Excel'),
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+        ('transcript', 'Student transcripts (zip)'),
+    ]
+
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='report_jobs')
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='report_jobs', null=True, blank=True)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='pdf')
+    filters = models.JSONField(default=dict, blank=True)  # course_id, student_id, start_date, end_date
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    progress = models.PositiveSmallIntegerField(default=0)  # Percent of rows written
+    row_count = models.PositiveIntegerField(null=True, blank=True)
+    artifact = models.FileField(upload_to=report_artifact_path, storage=report_storage, blank=True, null=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)  # Artifact is deleted after this
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"ReportJob {self.pk} ({self.format}, {self.status})"
+
+    def is_downloadable(self):
+        return (
+            self.status == self.STATUS_COMPLETED
+            and bool(self.artifact)
+            and (self.expires_at is None or self.expires_at > timezone.now())
+        )
+
+
+class ReportCacheEntry(models.Model):
+    """Rendered report stored under a hash of its format, filters, tenant and data version."""
+    key = models.CharField(max_length=64, unique=True)
+    format = models.CharField(max_length=10)
+    artifact = models.FileField(upload_to=report_cache_path, storage=report_storage)
+    size = models.PositiveBigIntegerField(default=0)
+    row_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_accessed_at = models.DateTimeField(default=timezone.now, db_index=True)  # LRU eviction order
+
+    def __str__(self):
+        return f"{self.format} report {self.key[:12]}"
+
+
+class SyncChange(models.Model):
+    """
+    Append-only change log behind delta sync: one row per change to a course,
+    enrollment, session or presence row. The auto-incrementing id is the
+    change sequence number clients keep as their cursor; deleted rows leave a
+    tombstone. Audience columns are plain integers so tombstones outlive the
+    rows they describe. Written by sync_utils.record_changes.
+    """
+    TABLE_COURSE = 'course'
+    TABLE_ENROLLMENT = 'enrollment'  # object_id is the course id, student_id the student
+    TABLE_SESSION = 'session'
+    TABLE_PRESENCE = 'presence'  # object_id is the session id, student_id the student
+    TABLE_CHOICES = [
+        (TABLE_COURSE, 'Course'),
+        (TABLE_ENROLLMENT, 'Enrollment'),
+        (TABLE_SESSION, 'Session'),
+        (TABLE_PRESENCE, 'Presence'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    table = models.CharField(max_length=10, choices=TABLE_CHOICES)
+    object_id = models.BigIntegerField()
+    course_id = models.BigIntegerField(null=True)
+    student_id = models.BigIntegerField(null=True)
+    lecturer_id = models.BigIntegerField(null=True)
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['course_id', 'id']),
+            models.Index(fields=['student_id', 'id']),
+            models.Index(fields=['lecturer_id', 'id']),
+        ]
+
+    def __str__(self):
+        action = 'deleted' if self.deleted else 'changed'
+        return f"#{self.pk} {self.table} {self.object_id} {action}"
+
+
 class EmailVerificationToken(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     token = models.CharField(max_length=100, unique=True)
@@ -52,13 +52,10 @@ class OrganizationMiddleware(MiddlewareMixin):
 
 def get_user_organization(user):
     """
-    Get the organization for a given user
+    Get the organization for a given user (views use get_identity(request).organization)
     """
-    if hasattr(user, 'student'):
-        return user.student.organization
-    elif hasattr(user, 'lecturer'):
-        return user.lecturer.organization
-    return None
+    from .identity_utils import load_identity
+    return load_identity(user).organization
 
 
 def filter_by_organization(queryset, organization):
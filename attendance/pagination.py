@@ -0,0 +1,83 @@
+import json
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+class StableCursorPagination(CursorPagination):
+    """
+    Default pagination for list endpoints: keyset pages over the primary key,
+    newest first. Each page is a `WHERE id < <cursor>` range scan on the PK
+    index, so deep pages cost the same as the first and never need an OFFSET.
+    """
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 200)
+
+
+class KeysetCursorPagination(StableCursorPagination):
+    """
+    Keyset pages over a multi-column ordering whose last field is unique, e.g.
+    ('attendance_rate', 'id'). CursorPagination filters on the first field only
+    and skips ties with an offset, which drifts when tied rows come and go; here
+    the cursor holds every ordering value and pages start strictly after it.
+    """
+
+    def _get_position_from_instance(self, instance, ordering):
+        return json.dumps([getattr(instance, field.lstrip('-')) for field in ordering])
+
+    def _after(self, position, reverse):
+        """Rows strictly after `position` in the (possibly reversed) ordering"""
+        condition = None
+        for field, value in reversed(list(zip(self.ordering, json.loads(position)))):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            beyond = Q(**{f'{name}__{lookup}': value})
+            condition = beyond if condition is None else beyond | (Q(**{name: value}) & condition)
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse, current_position = (self.cursor.reverse, self.cursor.position) if self.cursor else (False, None)
+
+        if reverse:
+            queryset = queryset.order_by(*[f[1:] if f.startswith('-') else f'-{f}' for f in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if current_position is not None:
+            try:
+                queryset = queryset.filter(self._after(current_position, reverse))
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # Positions are unique, so cursors never need an offset; fetch one extra row to see if there is more
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.next_position = current_position is not None, current_position
+            self.has_previous, self.previous_position = following_position is not None, following_position
+        else:
+            self.has_next, self.next_position = following_position is not None, following_position
+            self.has_previous, self.previous_position = current_position is not None, current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+
+class AtRiskStudentPagination(KeysetCursorPagination):
+    """Page through the at-risk table, lowest attendance first (matches the table's index)."""
+    ordering = ('attendance_rate', 'id')
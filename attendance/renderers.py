@@ -0,0 +1,39 @@
+"""
+Fast JSON rendering for API responses.
+
+FastJSONRenderer encodes with orjson when it is installed and falls back to
+DRF's JSONRenderer when it is not, when an indented (browsable) response is
+requested, or when orjson cannot encode a value. Types orjson does not know
+(Decimal, lazy translation strings, querysets) go through DRF's encoder, so
+the output matches JSONRenderer's.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not ORJSON_AVAILABLE or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS,
+            )
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits; let the standard encoder handle or report them
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same JavaScript-safe escaping as JSONRenderer
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -0,0 +1,121 @@
+"""
+Bounded report concurrency per node and per organization.
+
+Report rendering is CPU-bound, so every web request or task that renders a
+report first takes a slot: one of REPORT_NODE_CONCURRENCY per host and one of
+REPORT_ORG_CONCURRENCY per organization. Slots are cache keys claimed with
+cache.add (shared across processes with Redis) and expire after
+REPORT_SLOT_TTL seconds in case a worker dies holding one. Requests that
+cannot get a slot are queued as background jobs, whose Celery priority puts
+small course reports ahead of institution-wide ones.
+"""
+from django.conf import settings
+from django.core.cache import cache
+import socket
+import time
+import uuid
+
+# Celery priorities for report jobs (Redis broker: 0 is served first)
+REPORT_PRIORITY_COURSE = 0
+REPORT_PRIORITY_INSTITUTION = 6
+REPORT_PRIORITY_TRANSCRIPTS = 9
+
+NODE_NAME = socket.gethostname()
+
+
+def report_priority(format_type, filters):
+    """Smaller reports (one course or student) jump ahead of institution-wide ones"""
+    if format_type == 'transcript':
+        return REPORT_PRIORITY_TRANSCRIPTS
+    if filters.get('course_id') or filters.get('student_id'):
+        return REPORT_PRIORITY_COURSE
+    return REPORT_PRIORITY_INSTITUTION
+
+
+def _scopes(organization_id):
+    scopes = [(f'node:{NODE_NAME}', getattr(settings, 'REPORT_NODE_CONCURRENCY', 2))]
+    if organization_id:
+        scopes.append((f'organization:{organization_id}', getattr(settings, 'REPORT_ORG_CONCURRENCY', 2)))
+    return scopes
+
+
+def _claim(scope, limit, token, ttl):
+    for slot in range(limit):
+        key = f'report_slot:{scope}:{slot}'
+        if cache.add(key, token, ttl):
+            return key
+    return None
+
+
+def acquire_report_slot(organization_id=None, wait=0):
+    """
+    Claim a node slot and an organization slot, polling for up to `wait` seconds.
+
+    Returns:
+        list: Claimed slot keys to pass to release_report_slot, or None if the
+        node or organization is at capacity
+    """
+    ttl = getattr(settings, 'REPORT_SLOT_TTL', 15 * 60)
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    while True:
+        claimed = []
+        for scope, limit in _scopes(organization_id):
+            key = _claim(scope, limit, token, ttl)
+            if key is None:
+                break
+            claimed.append(key)
+        else:
+            return [(key, token) for key in claimed]
+
+        # All or nothing, so a half-claimed request does not block others
+        release_report_slot([(key, token) for key in claimed])
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.1)
+
+
+def release_report_slot(slots):
+    for key, token in slots or []:
+        # Only free a slot we still own; an expired one may have been re-claimed
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+class SlotReleasingIterator:
+    """
+    Streaming response body that releases its report slots once exhausted or
+    closed. Unlike a generator's finally block, close() also runs when the
+    response is closed before the first chunk (client disconnected early).
+    """
+
+    def __init__(self, iterable, slots):
+        self.iterable = iterable
+        self.iterator = iter(iterable)
+        self.slots = slots
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.iterator)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        slots, self.slots = self.slots, None
+        if slots is None:
+            return
+        try:
+            close = getattr(self.iterable, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            release_report_slot(slots)
+
+
+def release_after(iterable, slots):
+    """Wrap a streaming response body so the slots are released when it finishes or is closed"""
+    return SlotReleasingIterator(iterable, slots)
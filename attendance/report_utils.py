@@ -3,29 +3,39 @@ from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.utils import get_column_letter
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
 from django.http import HttpResponse
+from django.utils import timezone
 from io import BytesIO
 from datetime import datetime
+import csv
+import hashlib
+import json
+import pickle
+import tempfile
 
 
-def generate_attendance_pdf(attendances, course=None, date_range=None):
-    """Generate PDF report for attendance records"""
+def generate_attendance_pdf(rows, course=None, date_range=None, total=None):
+    """
+    Generate PDF report from flattened report rows (REPORT_STREAM_COLUMNS order)
+    """
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter)
     elements = []
     
     # Styles
     styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#1976d2'),
-        spaceAfter=30,
-        alignment=1  # Center
-    )
+    title_style = _pdf_title_style()
     
     # Title
     title = f"Attendance Report"
@@ -39,28 +49,147 @@ def generate_attendance_pdf(attendances, course=None, date_range=None):
     if date_range:
         elements.append(Paragraph(f"Period: {date_range}", meta_style))
     elements.append(Paragraph(f"Generated: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}", meta_style))
-    elements.append(Paragraph(f"Total Records: {len(attendances)}", meta_style))
+    if total is not None:
+        elements.append(Paragraph(f"Total Records: {total}", meta_style))
     elements.append(Spacer(1, 0.3*inch))
     
     # Table data
-    data = [['#', 'Student', 'Student ID', 'Course', 'Lecturer', 'Date', 'Check-in Time']]
+    data = [ATTENDANCE_PDF_HEADERS]
+    data.extend(_attendance_pdf_cells(rows))
     
-    for idx, attendance in enumerate(attendances, 1):
-        student = attendance.student
-        course_obj = attendance.course
-        lecturer = course_obj.lecturer if course_obj else None
-        
-        data.append([
-            str(idx),
-            student.name if student else 'N/A',
-            student.student_id if student else 'N/A',
-            course_obj.name if course_obj else 'N/A',
-            lecturer.name if lecturer else 'N/A',
-            attendance.date.strftime('%Y-%m-%d') if attendance.date else 'N/A',
-            attendance.date.strftime('%I:%M %p') if attendance.date else 'N/A',
-        ])
+    elements.append(_pdf_table(data))
     
-    # Create table
+    # Build PDF
+    doc.build(elements)
+    buffer.seek(0)
+    return buffer
+
+
+ATTENDANCE_PDF_HEADERS = ['#', 'Student', 'Student ID', 'Course', 'Lecturer', 'Date']
+# Share of the usable page width given to each column of the fast renderer
+ATTENDANCE_PDF_COLUMN_WIDTHS = [0.07, 0.25, 0.14, 0.24, 0.18, 0.12]
+
+
+def _attendance_pdf_cells(rows):
+    for idx, (_, date, _, course_name, lecturer, student_id, student_name) in enumerate(rows, 1):
+        yield [
+            str(idx),
+            student_name,
+            student_id,
+            course_name,
+            lecturer or 'N/A',
+            date.strftime('%Y-%m-%d'),
+        ]
+
+
+def _fit_text(text, width, font, size):
+    """Truncate text with an ellipsis so it fits in width points"""
+    if stringWidth(text, font, size) <= width:
+        return text
+    while text and stringWidth(text + '...', font, size) > width:
+        text = text[:-1]
+    return text + '...'
+
+
+def write_attendance_pdf(rows, output, course=None, date_range=None, total=None):
+    """
+    Draw the attendance report straight onto a canvas, one page at a time.
+
+    Unlike generate_attendance_pdf there is no platypus layout pass: column
+    widths are fixed up front, cells are truncated to fit, and each page is
+    compressed as soon as it is finished. Rows are consumed lazily, so only
+    the finished pages (not the row data) are held until the file is saved.
+
+    Args:
+        rows: Flattened report rows (REPORT_STREAM_COLUMNS order)
+        output: Path or binary file object the PDF is written to
+    """
+    page_width, page_height = letter
+    margin = 0.6 * inch
+    row_height = 14
+    font, bold_font, font_size = 'Helvetica', 'Helvetica-Bold', 8
+    usable_width = page_width - 2 * margin
+    widths = [usable_width * share for share in ATTENDANCE_PDF_COLUMN_WIDTHS]
+    lefts = [margin + sum(widths[:idx]) for idx in range(len(widths))]
+    header_color = colors.HexColor('#1976d2')
+
+    pdf = canvas.Canvas(output, pagesize=letter, pageCompression=1)
+    pdf.setTitle('Attendance Report')
+    page_number = 0
+
+    def start_page():
+        nonlocal page_number
+        page_number += 1
+        y = page_height - margin
+        if page_number == 1:
+            title = "Attendance Report" + (f" - {course.name}" if course else "")
+            pdf.setFillColor(header_color)
+            pdf.setFont(bold_font, 20)
+            pdf.drawCentredString(page_width / 2, y - 20, title)
+            y -= 44
+            pdf.setFillColor(colors.black)
+            pdf.setFont(font, 10)
+            meta = []
+            if date_range:
+                meta.append(f"Period: {date_range}")
+            meta.append(f"Generated: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}")
+            if total is not None:
+                meta.append(f"Total Records: {total}")
+            for line in meta:
+                pdf.drawString(margin, y, line)
+                y -= 14
+            y -= 10
+
+        # Header row, repeated on every page
+        pdf.setFillColor(header_color)
+        pdf.rect(margin, y - row_height, usable_width, row_height, stroke=0, fill=1)
+        pdf.setFillColor(colors.whitesmoke)
+        pdf.setFont(bold_font, font_size)
+        for header, left, width in zip(ATTENDANCE_PDF_HEADERS, lefts, widths):
+            pdf.drawCentredString(left + width / 2, y - row_height + 4, header)
+        pdf.setFont(font, font_size)
+        pdf.drawCentredString(page_width / 2, margin / 2, f"Page {page_number}")
+        return y - row_height
+
+    def finish_page(table_top, y):
+        # Grid lines for the whole page at once instead of per cell
+        pdf.setStrokeColor(colors.black)
+        pdf.setLineWidth(0.5)
+        for left in lefts + [margin + usable_width]:
+            pdf.line(left, table_top + row_height, left, y)
+        pdf.line(margin, y, margin + usable_width, y)
+        pdf.showPage()
+
+    table_top = y = start_page()
+    for idx, cells in enumerate(_attendance_pdf_cells(rows)):
+        if y - row_height < margin:
+            finish_page(table_top, y)
+            table_top = y = start_page()
+        if idx % 2:
+            pdf.setFillColor(colors.lightgrey)
+            pdf.rect(margin, y - row_height, usable_width, row_height, stroke=0, fill=1)
+        pdf.setFillColor(colors.black)
+        for value, left, width in zip(cells, lefts, widths):
+            pdf.drawCentredString(left + width / 2, y - row_height + 4, _fit_text(value, width - 4, font, font_size))
+        pdf.line(margin, y, margin + usable_width, y)
+        y -= row_height
+    finish_page(table_top, y)
+    pdf.save()
+
+
+def _pdf_title_style():
+    return ParagraphStyle(
+        'CustomTitle',
+        parent=getSampleStyleSheet()['Heading1'],
+        fontSize=24,
+        textColor=colors.HexColor('#1976d2'),
+        spaceAfter=30,
+        alignment=1  # Center
+    )
+
+
+def _pdf_table(data):
+    """Report table with a styled header row repeated on every page"""
     table = Table(data, repeatRows=1)
     table.setStyle(TableStyle([
         ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1976d2')),
@@ -75,66 +204,394 @@ def generate_attendance_pdf(attendances, course=None, date_range=None):
         ('FONTSIZE', (0, 1), (-1, -1), 8),
         ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
     ]))
-    
-    elements.append(table)
-    
-    # Build PDF
+    return table
+
+
+SESSION_ROSTER_HEADERS = ['Student ID', 'Student Name', 'Date of Attendance', 'Status']
+
+
+def generate_session_roster_pdf(attendance, rows):
+    """Generate PDF of one session's present/absent roster (see roster_utils.session_roster_rows)"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    present = sum(1 for row in rows if row[3] == 'Present')
+
+    elements = [
+        Paragraph(f"Attendance - {attendance.course.name}", _pdf_title_style()),
+        Paragraph(f"Date: {attendance.date.strftime('%Y-%m-%d')}", styles['Normal']),
+        Paragraph(f"Present: {present} / {len(rows)}", styles['Normal']),
+        Spacer(1, 0.3*inch),
+        _pdf_table([SESSION_ROSTER_HEADERS] + [
+            [student_id, name, date.strftime('%Y-%m-%d'), status] for student_id, name, date, status in rows
+        ]),
+    ]
     doc.build(elements)
     buffer.seek(0)
     return buffer
 
 
-def generate_attendance_excel(attendances, course=None, date_range=None):
-    """Generate Excel report for attendance records"""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Attendance Report"
-    
-    # Headers
-    headers = ['#', 'Student Name', 'Student ID', 'Course', 'Course Code', 'Lecturer', 'Date', 'Check-in Time']
-    ws.append(headers)
-    
-    # Style headers
-    header_fill = PatternFill(start_color="1976D2", end_color="1976D2", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    for cell in ws[1]:
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    # Add data
-    for idx, attendance in enumerate(attendances, 1):
-        student = attendance.student
-        course_obj = attendance.course
-        lecturer = course_obj.lecturer if course_obj else None
-        
-        row = [
-            idx,
-            student.name if student else 'N/A',
-            student.student_id if student else 'N/A',
-            course_obj.name if course_obj else 'N/A',
-            course_obj.course_code if course_obj else 'N/A',
-            lecturer.name if lecturer else 'N/A',
-            attendance.date.strftime('%Y-%m-%d') if attendance.date else 'N/A',
-            attendance.date.strftime('%I:%M %p') if attendance.date else 'N/A',
-        ]
-        ws.append(row)
-    
-    # Auto-adjust column widths
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(cell.value)
-            except:
-                pass
-        adjusted_width = (max_length + 2)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Save to buffer
+TRANSCRIPT_HEADERS = ['Course Code', 'Course', 'Sessions Held', 'Sessions Attended', 'Attendance Rate']
+
+
+def generate_transcript_pdf(transcript):
+    """
+    Generate one student's attendance transcript PDF.
+
+    Takes the plain dict built by transcript_utils.get_transcripts and never
+    touches the database, so it can run in a worker process.
+    """
     buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    return buffer
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+
+    elements = [
+        Paragraph(f"Attendance Transcript - {transcript['name']}", _pdf_title_style()),
+        Paragraph(f"Student ID: {transcript['student_id']}", styles['Normal']),
+    ]
+    if transcript.get('period'):
+        elements.append(Paragraph(f"Period: {transcript['period']}", styles['Normal']))
+    elements.append(Paragraph(f"Generated: {datetime.now().strftime('%B %d, %Y')}", styles['Normal']))
+    elements.append(Spacer(1, 0.3*inch))
+
+    data = [TRANSCRIPT_HEADERS]
+    for course in transcript['courses']:
+        rate = course['rate']
+        data.append([
+            course['course_code'],
+            course['course_name'],
+            str(course['held']),
+            str(course['attended']),
+            f"{rate:.1f}%" if rate is not None else 'N/A',
+        ])
+    elements.append(_pdf_table(data))
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def write_excel_report(headers, rows, title="Attendance Report"):
+    """
+    Write rows to an .xlsx file with openpyxl's write-only (streaming) workbook.
+
+    Write-only sheets must declare column widths before any row, so rows are
+    spooled to a temporary file while their widths are tracked, then replayed
+    into the workbook. Memory use does not grow with the number of rows.
+
+    Returns:
+        A temporary file positioned at the start; it is deleted once closed
+    """
+    widths = [len(str(header)) for header in headers]
+    with tempfile.TemporaryFile() as spool:
+        for row in rows:
+            for idx, value in enumerate(row):
+                widths[idx] = max(widths[idx], len(str(value)) if value is not None else 0)
+            pickle.dump(row, spool, protocol=pickle.HIGHEST_PROTOCOL)
+        spool.seek(0)
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title)
+        for idx, width in enumerate(widths, 1):
+            ws.column_dimensions[get_column_letter(idx)].width = width + 2
+
+        # Style headers
+        header_fill = PatternFill(start_color="1976D2", end_color="1976D2", fill_type="solid")
+        header_font = Font(bold=True, color="FFFFFF")
+        header_cells = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.fill = header_fill
+            cell.font = header_font
+            cell.alignment = Alignment(horizontal='center', vertical='center')
+            header_cells.append(cell)
+        ws.append(header_cells)
+
+        while True:
+            try:
+                ws.append(pickle.load(spool))
+            except EOFError:
+                break
+
+        output = tempfile.TemporaryFile()
+        wb.save(output)
+    output.seek(0)
+    return output
+
+
+def generate_attendance_excel(rows, course=None, date_range=None):
+    """
+    Generate Excel report from flattened report rows (REPORT_STREAM_COLUMNS order)
+    """
+    headers = ['#', 'Student Name', 'Student ID', 'Course', 'Course Code', 'Lecturer', 'Date']
+
+    def excel_rows():
+        for idx, (_, date, course_code, course_name, lecturer, student_id, student_name) in enumerate(rows, 1):
+            yield [
+                idx,
+                student_name,
+                student_id,
+                course_name,
+                course_code,
+                lecturer or 'N/A',
+                date.strftime('%Y-%m-%d'),
+            ]
+
+    return write_excel_report(headers, excel_rows())
+
+
+# Columns of the flat one-row-per-check-in report streams
+REPORT_STREAM_COLUMNS = ['session_id', 'date', 'course_code', 'course_name', 'lecturer', 'student_id', 'student_name']
+
+
+def get_report_presence(course_id=None, student_id=None, start_date=None, end_date=None, organization_id=None,
+                        lecturer_id=None):
+    """Presence rows (one per session and present student) matching the report filters"""
+    from .models import Attendance
+
+    presence = Attendance.present_students.through.objects.all()
+    if organization_id:
+        presence = presence.filter(attendance__organization_id=organization_id)
+    if lecturer_id:
+        presence = presence.filter(attendance__course__lecturer_id=lecturer_id)
+    if course_id:
+        presence = presence.filter(attendance__course_id=course_id)
+    if student_id:
+        presence = presence.filter(student_id=student_id)
+    if start_date:
+        presence = presence.filter(attendance__date__gte=start_date)
+    if end_date:
+        presence = presence.filter(attendance__date__lte=end_date)
+    return presence
+
+
+def iter_attendance_report_rows(course_id=None, student_id=None, start_date=None, end_date=None, organization_id=None,
+                                lecturer_id=None):
+    """
+    Yield one tuple per (session, present student), in REPORT_STREAM_COLUMNS order.
+
+    This is the single source of the PDF, Excel, CSV and NDJSON reports.
+    Reads the presence table with a single joined query through
+    .iterator(), so rows are fetched in chunks (server-side cursor on
+    PostgreSQL) and memory stays flat however many rows match.
+    """
+    presence = get_report_presence(course_id, student_id, start_date, end_date, organization_id, lecturer_id)
+    rows = presence.order_by('-attendance__date', 'attendance_id', 'student__student_id').values_list(
+        'attendance_id',
+        'attendance__date',
+        'attendance__course__course_code',
+        'attendance__course__name',
+        'attendance__course__lecturer__name',
+        'student__student_id',
+        'student__name',
+    )
+    return rows.iterator(chunk_size=getattr(settings, 'REPORT_STREAM_CHUNK_SIZE', 2000))
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to the caller."""
+    def write(self, value):
+        return value
+
+
+def stream_attendance_csv(rows):
+    """Generate CSV lines for report rows, header first"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(REPORT_STREAM_COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_attendance_ndjson(rows):
+    """Generate one JSON object per line for report rows"""
+    for row in rows:
+        yield json.dumps(dict(zip(REPORT_STREAM_COLUMNS, row)), default=str) + '\n'
+
+
+# Report job formats: file extension and content type of the stored artifact
+REPORT_ARTIFACT_TYPES = {
+    'pdf': ('pdf', 'application/pdf'),
+    'excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('csv', 'text/csv'),
+    'ndjson': ('ndjson', 'application/x-ndjson'),
+    'transcript': ('zip', 'application/zip'),  # One PDF per student, see transcript_utils
+}
+
+# lecturer_id limits a report to one lecturer's courses; it is always set for lecturers' own reports
+REPORT_FILTER_KEYS = ('course_id', 'student_id', 'start_date', 'end_date', 'lecturer_id')
+
+
+def _report_progress(rows, total, progress):
+    """Pass rows through, reporting percent complete roughly every 1%"""
+    step = max(total // 100, 1)
+    for idx, row in enumerate(rows, 1):
+        yield row
+        if progress and idx % step == 0:
+            progress(min(int(idx * 100 / total), 99))
+
+
+def _date_range_label(start_date, end_date):
+    if start_date and end_date:
+        return f"{start_date} to {end_date}"
+    elif start_date:
+        return f"From {start_date}"
+    elif end_date:
+        return f"Until {end_date}"
+    return None
+
+
+def build_report_artifact(format_type, filters, progress=None, organization_id=None):
+    """
+    Render a report for the given filters into a temporary file.
+
+    Args:
+        format_type: One of REPORT_ARTIFACT_TYPES
+        filters: Dict with any of REPORT_FILTER_KEYS
+        progress: Optional callback receiving percent complete
+        organization_id: Restrict the report to one organization's sessions
+
+    Returns:
+        tuple: (temporary file positioned at the start, number of rows)
+    """
+    from .models import Course
+
+    filters = {key: filters.get(key) for key in REPORT_FILTER_KEYS}
+    total = get_report_presence(organization_id=organization_id, **filters).count()
+    rows = _report_progress(iter_attendance_report_rows(organization_id=organization_id, **filters), total, progress)
+
+    if format_type in ('pdf', 'excel'):
+        course = Course.objects.filter(id=filters['course_id']).first() if filters['course_id'] else None
+        date_range = _date_range_label(filters['start_date'], filters['end_date'])
+        if format_type == 'excel':
+            return generate_attendance_excel(rows, course, date_range), total
+        output = tempfile.TemporaryFile()
+        if total > getattr(settings, 'REPORT_PDF_TABLE_MAX_ROWS', 500):
+            # Platypus layout cost grows badly with table size; draw large reports directly
+            write_attendance_pdf(rows, output, course, date_range, total)
+        else:
+            output.write(generate_attendance_pdf(rows, course, date_range, total).getvalue())
+        output.seek(0)
+        return output, total
+
+    lines = stream_attendance_csv(rows) if format_type == 'csv' else stream_attendance_ndjson(rows)
+    output = tempfile.TemporaryFile()
+    for line in lines:
+        output.write(line.encode('utf-8'))
+    output.seek(0)
+    return output, total
+
+
+def report_cache_key(format_type, filters, organization_id=None):
+    """
+    Content address of a report: its format, filters and tenant plus the
+    current data version of the course (or of all data when unfiltered)
+    """
+    from .version_utils import get_version
+
+    filters = {key: str(filters[key]) for key in REPORT_FILTER_KEYS if filters.get(key)}
+    if filters.get('course_id'):
+        version = get_version('course', filters['course_id'])
+    elif organization_id:
+        version = get_version('organization', organization_id)
+    else:
+        version = get_version('organization', 'all')
+    payload = json.dumps([format_type, filters, organization_id, version], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_or_build_report_artifact(format_type, filters, organization_id=None, progress=None):
+    """
+    Return a cached report artifact if one matches, otherwise render and cache it.
+
+    Returns:
+        tuple: (file object positioned at the start, number of rows)
+    """
+    cached = get_cached_report_artifact(format_type, filters, organization_id)
+    if cached is not None:
+        return cached
+
+    output, row_count = build_report_artifact(format_type, filters, progress, organization_id)
+    _store_cached_report(report_cache_key(format_type, filters, organization_id), format_type, output, row_count)
+    output.seek(0)
+    return output, row_count
+
+
+def get_cached_report_artifact(format_type, filters, organization_id=None):
+    """
+    Open a cached report artifact without rendering anything.
+
+    Returns:
+        tuple: (file object, number of rows), or None on a cache miss
+    """
+    from .models import ReportCacheEntry
+
+    entry = ReportCacheEntry.objects.filter(key=report_cache_key(format_type, filters, organization_id)).first()
+    if entry is None:
+        return None
+    try:
+        output = entry.artifact.open('rb')
+    except OSError:
+        # The file went missing underneath the entry; rebuild it
+        entry.delete()
+        return None
+    ReportCacheEntry.objects.filter(pk=entry.pk).update(last_accessed_at=timezone.now())
+    return output, entry.row_count
+
+
+def _store_cached_report(key, format_type, output, row_count):
+    from .models import ReportCacheEntry
+
+    output.seek(0, 2)
+    entry = ReportCacheEntry(key=key, format=format_type, row_count=row_count, size=output.tell())
+    output.seek(0)
+    extension, _ = REPORT_ARTIFACT_TYPES[format_type]
+    entry.artifact.save(f"report.{extension}", File(output), save=False)
+    try:
+        with transaction.atomic():
+            entry.save()
+    except IntegrityError:
+        # A concurrent request cached the same report first
+        entry.artifact.delete(save=False)
+        return
+    evict_report_cache()
+
+
+def evict_report_cache(max_bytes=None):
+    """
+    Delete least recently used cached reports until the cache fits its disk budget
+
+    Returns:
+        int: Number of entries evicted
+    """
+    from .models import ReportCacheEntry
+
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'REPORT_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+    total = ReportCacheEntry.objects.aggregate(total=Sum('size'))['total'] or 0
+    evicted = 0
+    for entry in ReportCacheEntry.objects.order_by('last_accessed_at', 'id').iterator():
+        if total <= max_bytes:
+            break
+        entry.artifact.delete(save=False)
+        entry.delete()
+        total -= entry.size
+        evicted += 1
+    return evicted
+
+
+REPORT_DOWNLOAD_SALT = 'attendance.report-download'
+
+
+def make_report_download_token(job):
+    """Signed, timestamped token authorizing download of one report job's artifact"""
+    return signing.dumps(job.pk, salt=REPORT_DOWNLOAD_SALT)
+
+
+def check_report_download_token(job_id, token):
+    """True if the token was issued for this job and has not expired"""
+    try:
+        signed_id = signing.loads(
+            token, salt=REPORT_DOWNLOAD_SALT, max_age=getattr(settings, 'REPORT_DOWNLOAD_URL_TTL', 60 * 60)
+        )
+    except signing.BadSignature:
+        return False
+    return str(signed_id) == str(job_id)
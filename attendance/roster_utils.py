@@ -0,0 +1,82 @@
+"""
+Roster vs presence: who attended a session and who missed it, computed with
+set-based queries instead of per-student membership checks
+"""
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import Attendance, CourseEnrollment, Student
+
+PRESENT = 'Present'
+ABSENT = 'Absent'
+
+
+def _presence():
+    return Attendance.present_students.through.objects
+
+
+def present_students(attendance):
+    """Students checked in to a session (one query)"""
+    return Student.objects.filter(attended_classes=attendance)
+
+
+def absent_students(attendance):
+    """Students enrolled in the session's course who have not checked in (one anti-join query)"""
+    checked_in = _presence().filter(attendance_id=attendance.pk, student_id=OuterRef('pk'))
+    return Student.objects.filter(courseenrollment__course_id=attendance.course_id).exclude(Exists(checked_in))
+
+
+def is_student_present(attendance, student):
+    """Whether one student has checked in to a session, without loading the list"""
+    return _presence().filter(attendance_id=attendance.pk, student_id=student.pk).exists()
+
+
+def is_student_enrolled(course, student):
+    return CourseEnrollment.objects.filter(course=course, student=student).exists()
+
+
+def session_roster(attendance, fields=('student_id', 'name')):
+    """
+    Present and absent students of a session as sorted lists of value tuples.
+
+    Returns:
+        tuple: (present, absent)
+    """
+    present = list(present_students(attendance).order_by(*fields).values_list(*fields))
+    absent = list(absent_students(attendance).order_by(*fields).values_list(*fields))
+    return present, absent
+
+
+def session_roster_rows(attendance):
+    """
+    One row per student for a session export: student ID, name, date and
+    status, present students first
+    """
+    present, absent = session_roster(attendance)
+    rows = [[student_id, name, attendance.date, PRESENT] for student_id, name in present]
+    rows += [[student_id, name, attendance.date, ABSENT] for student_id, name in absent]
+    return rows
+
+
+def enrolled_count(course_ref='pk'):
+    """
+    Number of students enrolled in the course referenced by `course_ref`, as a
+    correlated subquery (unaffected by filters on the outer query's joins)
+    """
+    enrolled = CourseEnrollment.objects.filter(course_id=OuterRef(course_ref)).values('course_id').annotate(
+        total=Count('pk')
+    ).values('total')
+    return Coalesce(Subquery(enrolled, output_field=IntegerField()), Value(0))
+
+
+def annotate_session_counts(attendances):
+    """
+    Annotate sessions with present_count and enrolled_count using correlated
+    subqueries, so aggregating over many sessions stays a single query
+    """
+    present = _presence().filter(attendance_id=OuterRef('pk')).values('attendance_id').annotate(
+        total=Count('pk')
+    ).values('total')
+    return attendances.annotate(
+        present_count=Coalesce(Subquery(present, output_field=IntegerField()), Value(0)),
+        enrolled_count=enrolled_count('course_id'),
+    )
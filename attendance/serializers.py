@@ -1,5 +1,8 @@
 from rest_framework import serializers
-from .models import Organization, Lecturer, Student, Course, CourseEnrollment, Attendance, AttendanceToken, Feedback
+from .models import Organization, Lecturer, Student, Course, CourseEnrollment, Attendance, AttendanceToken, Feedback, AtRiskStudent, ReportJob
+from .report_utils import REPORT_FILTER_KEYS, make_report_download_token
+from .thumbnail_utils import absolute_media_url, thumbnail_sizes
+from django.urls import reverse
 from django.contrib.auth.models import User
 
 # Organization serializer
@@ -15,49 +18,116 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
 
+
+class ProfilePictureMixin(serializers.Serializer):
+    """
+    Profile picture and thumbnail URLs read from the precomputed
+    profile_picture_urls, with no storage backend call per row
+    """
+    profile_picture = serializers.SerializerMethodField()
+    profile_thumbnails = serializers.SerializerMethodField()
+
+    def get_profile_picture(self, obj):
+        if not obj.profile_picture:
+            return None
+        # Rows whose thumbnails have not been generated yet fall back to the storage URL
+        url = obj.profile_picture_urls.get('original') or obj.profile_picture.url
+        return absolute_media_url(self.context.get('request'), url)
+
+    def get_profile_thumbnails(self, obj):
+        if not obj.profile_picture:
+            return None
+        request = self.context.get('request')
+        urls = obj.profile_picture_urls
+        return {variant: absolute_media_url(request, urls.get(variant)) for variant in thumbnail_sizes()}
+
+
 # Lecturer serializer
-class LecturerSerializer(serializers.ModelSerializer):
+class LecturerSerializer(ProfilePictureMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     courses = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
-    profile_picture = serializers.SerializerMethodField()
     organization = OrganizationSerializer(read_only=True)
 
     class Meta:
         model = Lecturer
-        fields = ['id', 'user', 'staff_id', 'name', 'profile_picture', 'courses', 'department', 'phone_number', 'latitude', 'longitude', 'organization']
+        fields = ['id', 'user', 'staff_id', 'name', 'profile_picture', 'profile_thumbnails', 'courses', 'department', 'phone_number', 'latitude', 'longitude', 'organization']
 
-    def get_profile_picture(self, obj):
-        request = self.context.get('request')
-        if obj.profile_picture and request:
-            return request.build_absolute_uri(obj.profile_picture.url)
-        return None
 
 # Student serializer
-class StudentSerializer(serializers.ModelSerializer):
+class StudentSerializer(ProfilePictureMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     courses = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
-    profile_picture = serializers.SerializerMethodField()
     organization = OrganizationSerializer(read_only=True)
 
     class Meta:
         model = Student
-        fields = ['id', 'user', 'student_id', 'name', 'courses', 'profile_picture', 'programme_of_study', 'year', 'phone_number', 'organization']
+        fields = ['id', 'user', 'student_id', 'name', 'courses', 'profile_picture', 'profile_thumbnails', 'programme_of_study', 'year', 'phone_number', 'organization']
 
-    def get_profile_picture(self, obj):
+
+def parse_field_list(request, param):
+    """Comma-separated names from a query parameter (?fields=a,b or ?expand=a,b)"""
+    if request is None or not hasattr(request, 'query_params'):
+        return []
+    return [name.strip() for name in request.query_params.get(param, '').split(',') if name.strip()]
+
+
+class SparseFieldsetMixin:
+    """
+    Lets clients shape a response: ?fields=id,name keeps only those fields and
+    ?expand=students swaps in the richer serializer declared in
+    Meta.expandable_fields. Only applies to the serializer a view creates
+    (nested serializers are built without the request context).
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         request = self.context.get('request')
-        if obj.profile_picture and request:
-            return request.build_absolute_uri(obj.profile_picture.url)
-        return None
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        expanded = [name for name in parse_field_list(request, 'expand') if name in expandable]
+        for name in expanded:
+            serializer_class, options = expandable[name]
+            self.fields[name] = serializer_class(read_only=True, **options)
+
+        requested = parse_field_list(request, 'fields')
+        if requested:
+            for name in set(self.fields) - set(requested) - set(expanded):
+                self.fields.pop(name)
+
+
+# Compact nested representations for list endpoints
+class LecturerSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Lecturer
+        fields = ['id', 'staff_id', 'name']
+
+class StudentSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Student
+        fields = ['id', 'student_id', 'name']
 
 # Course serializer
-class CourseSerializer(serializers.ModelSerializer):
-    lecturer = LecturerSerializer(read_only=True)
-    students = StudentSerializer(many=True, read_only=True)
-    organization = OrganizationSerializer(read_only=True)
+class CourseSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Compact by default: the lecturer as id/staff_id/name, the organization as
+    an id and the roster as a count. ?expand=students,lecturer,organization
+    returns the nested objects.
+    """
+    lecturer = LecturerSummarySerializer(read_only=True)
+    student_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Course
-        fields = ['id', 'name', 'course_code', 'lecturer', 'students', 'organization']
+        fields = ['id', 'name', 'course_code', 'lecturer', 'student_count', 'organization']
+        read_only_fields = ['organization']
+        expandable_fields = {
+            'students': (StudentSummarySerializer, {'many': True}),
+            'lecturer': (LecturerSerializer, {}),
+            'organization': (OrganizationSerializer, {}),
+        }
+
+    def get_student_count(self, obj):
+        # Annotated by CourseViewSet; counted per course elsewhere
+        count = getattr(obj, 'student_count', None)
+        return count if count is not None else obj.students.count()
 
 # Course Enrollment serializer
 class CourseEnrollmentSerializer(serializers.ModelSerializer):
@@ -85,6 +155,38 @@ class AttendanceTokenSerializer(serializers.ModelSerializer):
         model = AttendanceToken
         fields = ['id', 'course', 'token', 'generated_at', 'expires_at', 'is_active']
 
+# At-risk student serializer
+class AtRiskStudentSerializer(serializers.ModelSerializer):
+    student_id = serializers.CharField(source='student.student_id', read_only=True)
+    student_name = serializers.CharField(source='student.name', read_only=True)
+    course_code = serializers.CharField(source='course.course_code', read_only=True)
+
+    class Meta:
+        model = AtRiskStudent
+        fields = ['id', 'student', 'student_id', 'student_name', 'course', 'course_code', 'attendance_rate', 'sessions_held', 'sessions_attended', 'flagged_at', 'updated_at']
+
+# Report job serializer
+class ReportJobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportJob
+        fields = ['id', 'format', 'filters', 'status', 'progress', 'row_count', 'error', 'created_at', 'started_at', 'completed_at', 'expires_at', 'download_url']
+        read_only_fields = ['status', 'progress', 'row_count', 'error', 'created_at', 'started_at', 'completed_at', 'expires_at']
+
+    def validate_filters(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError('Filters must be an object.')
+        return {key: value[key] for key in REPORT_FILTER_KEYS if value.get(key)}
+
+    def get_download_url(self, obj):
+        # Expiring link that works without an auth header (e.g. opened in a browser)
+        if not obj.is_downloadable():
+            return None
+        url = f"{reverse('report_job_download', args=[obj.pk])}?token={make_report_download_token(obj)}"
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
 # Logout serializer
 class LogoutSerializer(serializers.Serializer):
     pass
@@ -0,0 +1,217 @@
+"""
+Keep the data version counters behind conditional GET, and the delta sync
+change log, in step with the rows they describe. Session and check-in changes
+are bumped where they happen (Attendance.save, enrollment_utils); these
+receivers cover profiles, courses, enrollments, session deletes and presence
+edits, which are made from many places (admin, serializers, bulk imports).
+
+Queryset .update() and bulk_create() do not send signals; code using them on
+these models must bump versions and record sync changes itself.
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .enrollment_utils import adjust_attended_counters
+from .models import AtRiskStudent, Attendance, Course, CourseEnrollment, Lecturer, Organization, Student, SyncChange
+from .sync_utils import record_changes, record_course, record_course_handover, record_enrollments, record_sessions
+from .version_utils import bump_course_list_version, bump_course_version, bump_version
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    bump_version('user', instance.pk)
+
+
+def _bump_courses(courses):
+    """Bump the versions of (course_id, organization_id) pairs"""
+    for course_id, organization_id in set(courses):
+        bump_course_version(course_id, organization_id)
+
+
+def _bump_students(student_ids):
+    """Bump the user versions (attendance history, /me/) of these students"""
+    student_ids = set(student_ids)
+    if not student_ids:
+        return
+    for user_id in Student.objects.filter(pk__in=student_ids).values_list('user_id', flat=True):
+        bump_version('user', user_id)
+
+
+def _report_courses(profile):
+    """Courses whose attendance reports name a student or lecturer"""
+    if isinstance(profile, Lecturer):
+        return list(Course.objects.filter(lecturer=profile).values_list('pk', 'organization_id'))
+    return list(
+        Attendance.objects.filter(present_students=profile).values_list('course_id', 'organization_id').distinct()
+    )
+
+
+@receiver(pre_delete, sender=Student)
+@receiver(pre_delete, sender=Lecturer)
+def profile_deleting(sender, instance, **kwargs):
+    # The presence rows are gone by post_delete; remember whose reports change
+    instance._report_courses = _report_courses(instance)
+
+
+@receiver([post_save, post_delete], sender=Student)
+@receiver([post_save, post_delete], sender=Lecturer)
+def profile_changed(sender, instance, **kwargs):
+    bump_version('user', instance.user_id)
+    # Lecturers and students are nested in course lists, and named in reports
+    bump_course_list_version()
+    courses = getattr(instance, '_report_courses', None)
+    _bump_courses(courses if courses is not None else _report_courses(instance))
+
+
+@receiver([post_save, post_delete], sender=Organization)
+def organization_changed(sender, instance, **kwargs):
+    bump_course_list_version()
+    if kwargs['signal'] is post_save:
+        # /me/ nests the organization; deletes cascade to the profiles, which bump themselves
+        for model in (Student, Lecturer):
+            for user_id in model.objects.filter(organization=instance).values_list('user_id', flat=True):
+                bump_version('user', user_id)
+
+
+@receiver(pre_save, sender=Course)
+def course_saving(sender, instance, **kwargs):
+    # The previous lecturer needs a tombstone if the course changes hands, and
+    # the previous organization its rows moved if the course changes tenant
+    instance._previous_lecturer_id, instance._previous_organization_id = None, None
+    if instance.pk is not None:
+        instance._previous_lecturer_id, instance._previous_organization_id = (
+            Course.objects.filter(pk=instance.pk).values_list('lecturer_id', 'organization_id').first() or (None, None)
+        )
+
+
+def _move_course_organization(course, previous_organization_id):
+    """
+    Carry the organization denormalized on a course's sessions and at-risk
+    entries over to its new one. Queryset updates send no signals, so the
+    previous organization's versions and the export change log are kept here.
+    """
+    sessions = Attendance.objects.filter(course=course)
+    sessions.update(organization_id=course.organization_id)
+    AtRiskStudent.objects.filter(course=course).update(organization_id=course.organization_id)
+    bump_course_version(course.pk, previous_organization_id)
+    # Exported session, presence and enrollment rows carry the organization
+    record_changes(
+        SyncChange.TABLE_SESSION, [(pk, course.pk, None, None) for pk in sessions.values_list('pk', flat=True)]
+    )
+    presence = Attendance.present_students.through.objects.filter(attendance__course=course)
+    record_changes(
+        SyncChange.TABLE_PRESENCE,
+        [(attendance_id, course.pk, student_id, None) for attendance_id, student_id in presence.values_list('attendance_id', 'student_id')],
+    )
+    record_enrollments(course.pk, CourseEnrollment.objects.filter(course=course).values_list('student_id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Course)
+def course_changed(sender, instance, **kwargs):
+    bump_course_version(instance.pk, instance.organization_id)
+    bump_course_list_version()
+    previous = instance.__dict__.pop('_previous_lecturer_id', None)
+    previous_organization = instance.__dict__.pop('_previous_organization_id', None)
+    if kwargs['signal'] is post_save and previous is not None and previous != instance.lecturer_id:
+        record_course_handover(instance, previous)
+    if kwargs['signal'] is post_save and previous is not None and previous_organization != instance.organization_id:
+        _move_course_organization(instance, previous_organization)
+    record_course(instance, deleted=kwargs['signal'] is post_delete)
+
+
+@receiver([post_save, post_delete], sender=CourseEnrollment)
+def enrollment_changed(sender, instance, **kwargs):
+    # Counter updates go through .update() and do not land here
+    if getattr(kwargs.get('origin'), 'sync_recorded', False):
+        # A bulk delete whose caller bumps and logs the whole set (apply_course_roster)
+        return
+    bump_course_version(instance.course_id)
+    bump_course_list_version()
+    record_enrollments(instance.course_id, [instance.student_id], deleted=kwargs['signal'] is post_delete)
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def course_students_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """course.students.add() / student.courses.add() bulk-insert enrollments without saving them"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    course_ids = (pk_set or []) if reverse else [instance.pk]
+    for course_id in course_ids:
+        bump_course_version(course_id)
+    bump_course_list_version()
+    if action == 'post_add':
+        # Removals delete through CourseEnrollment rows one by one and are logged by enrollment_changed
+        if reverse:
+            record_changes(
+                SyncChange.TABLE_ENROLLMENT, [(course_id, course_id, instance.pk, None) for course_id in pk_set]
+            )
+        else:
+            record_enrollments(instance.pk, pk_set)
+
+
+@receiver(pre_save, sender=Attendance)
+@receiver(pre_delete, sender=Attendance)
+def session_saving(sender, instance, **kwargs):
+    # Present students' histories list the session's date: note whose change
+    instance._history_students = None
+    if instance.pk is None:
+        return
+    if kwargs['signal'] is pre_save:
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'date' not in update_fields:
+            return
+        previous = Attendance.objects.filter(pk=instance.pk).values_list('date', flat=True).first()
+        if previous is None or previous == instance.date:
+            return
+    instance._history_students = list(
+        Attendance.present_students.through.objects.filter(attendance_id=instance.pk).values_list('student_id', flat=True)
+    )
+
+
+@receiver([post_save, post_delete], sender=Attendance)
+def session_changed(sender, instance, **kwargs):
+    if kwargs['signal'] is post_delete:
+        # Attendance.save() bumps on writes; deletes (admin, querysets) land here
+        bump_course_version(instance.course_id, instance.organization_id)
+    _bump_students(instance.__dict__.pop('_history_students', None) or ())
+    # Session deletes take their presence rows with them; clients drop those without tombstones
+    record_sessions([instance], deleted=kwargs['signal'] is post_delete)
+
+
+@receiver(m2m_changed, sender=Attendance.present_students.through)
+def presence_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Presence edits outside mark_student_present (admin, scripts): keep the
+    enrollment counters, course versions and sync log in step
+    """
+    presence = Attendance.present_students.through.objects
+    if action in ('pre_remove', 'pre_clear'):
+        # remove() passes every requested id, present or not, so look up the rows that will go
+        rows = presence.filter(student_id=instance.pk) if reverse else presence.filter(attendance_id=instance.pk)
+        if action == 'pre_remove':
+            rows = rows.filter(**{'attendance_id__in' if reverse else 'student_id__in': pk_set or []})
+        instance._removed_presence = list(
+            rows.values_list('attendance_id', 'attendance__course_id', 'student_id', 'attendance__organization_id')
+        )
+        return
+    if action in ('post_remove', 'post_clear'):
+        rows = instance.__dict__.pop('_removed_presence', [])
+    elif action == 'post_add':
+        # pk_set holds only the rows actually inserted
+        if reverse:
+            sessions = Attendance.objects.filter(pk__in=pk_set or []).values_list('pk', 'course_id', 'organization_id')
+            rows = [(attendance_id, course_id, instance.pk, organization_id) for attendance_id, course_id, organization_id in sessions]
+        else:
+            rows = [(instance.pk, instance.course_id, student_id, instance.organization_id) for student_id in pk_set or []]
+    else:
+        return
+
+    added = action == 'post_add'
+    adjust_attended_counters([(course_id, student_id) for _, course_id, student_id, _ in rows], 1 if added else -1)
+    _bump_courses((course_id, organization_id) for _, course_id, _, organization_id in rows)
+    _bump_students(student_id for _, _, student_id, _ in rows)
+    record_changes(
+        SyncChange.TABLE_PRESENCE,
+        [(attendance_id, course_id, student_id, None) for attendance_id, course_id, student_id, _ in rows],
+        deleted=not added,
+    )
@@ -0,0 +1,273 @@
+"""
+Delta sync for mobile and web clients.
+
+Every change to a course, enrollment, session or presence row appends a
+SyncChange entry (see signals.py, plus explicit calls wherever rows are
+written with .update(), bulk_create() or raw deletes). A client keeps the
+cursor from its last sync and asks for everything it can see that changed
+after it: current rows for entries that still exist, and tombstones for
+deletions. A steady-state refresh is a handful of bytes.
+
+Rules clients follow when applying a response:
+- Rows are keyed by id (courses, sessions), (course_id, student_id)
+  (enrollments) and (attendance_id, student_id) (presence), and replace any
+  local copy.
+- A deleted session takes its presence rows with it.
+- For students, a deleted enrollment takes its course and sessions with it;
+  a new enrollment brings the course's full history in the same response.
+- For lecturers, a deleted course takes its sessions, enrollments and
+  presence with it; a course handed over to them brings its full history.
+- reset=true means the cursor is no longer usable (the log was pruned past
+  it); drop local state and apply the response, which is a full snapshot.
+
+Entries are written when the transaction that made the change commits, so
+an entry's sequence number is taken after the change is visible and a long
+transaction cannot slip in behind a cursor. Only the log inserts themselves
+(single-statement autocommit writes) can commit out of sequence order;
+entries younger than SYNC_SETTLE_SECONDS are held back to cover that. A
+process that dies between the commit and the log write loses those entries;
+the rows are still correct, and the next full snapshot picks them up.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from .models import Attendance, Course, CourseEnrollment, SyncChange
+
+COURSE_FIELDS = ('id', 'name', 'course_code', 'lecturer_id', 'organization_id', 'is_active')
+ENROLLMENT_FIELDS = ('course_id', 'student_id', 'enrolled_at')
+SESSION_FIELDS = ('id', 'course_id', 'date', 'is_active', 'ended_at')
+PRESENCE_FIELDS = ('attendance_id', 'student_id')
+
+RESPONSE_KEYS = {
+    SyncChange.TABLE_COURSE: 'courses',
+    SyncChange.TABLE_ENROLLMENT: 'enrollments',
+    SyncChange.TABLE_SESSION: 'sessions',
+    SyncChange.TABLE_PRESENCE: 'presence',
+}
+
+
+def _presence():
+    return Attendance.present_students.through.objects
+
+
+def record_changes(table, rows, deleted=False):
+    """
+    Append change log entries once the current transaction commits (at once
+    outside a transaction); `rows` are (object_id, course_id, student_id, lecturer_id) tuples
+    """
+    entries = [
+        SyncChange(
+            table=table, object_id=object_id, course_id=course_id,
+            student_id=student_id, lecturer_id=lecturer_id, deleted=deleted,
+        ) for object_id, course_id, student_id, lecturer_id in rows
+    ]
+    if entries:
+        transaction.on_commit(lambda: SyncChange.objects.bulk_create(entries))
+
+
+def record_course(course, deleted=False):
+    record_changes(SyncChange.TABLE_COURSE, [(course.pk, course.pk, None, course.lecturer_id)], deleted)
+
+
+def record_course_handover(course, previous_lecturer_id):
+    """
+    Log a course moving between lecturers. Both entries are addressed to one
+    lecturer only (no course_id): a tombstone for the previous lecturer, and
+    a marker that makes the new lecturer's next sync carry the course's history.
+    """
+    record_changes(SyncChange.TABLE_COURSE, [(course.pk, None, None, previous_lecturer_id)], deleted=True)
+    record_changes(SyncChange.TABLE_COURSE, [(course.pk, None, None, course.lecturer_id)])
+
+
+def record_sessions(attendances, deleted=False):
+    record_changes(SyncChange.TABLE_SESSION, [(a.pk, a.course_id, None, None) for a in attendances], deleted)
+
+
+def record_enrollments(course_id, student_ids, deleted=False):
+    record_changes(
+        SyncChange.TABLE_ENROLLMENT, [(course_id, course_id, student_id, None) for student_id in student_ids], deleted
+    )
+
+
+def record_presence(attendance, student_ids, deleted=False):
+    record_changes(
+        SyncChange.TABLE_PRESENCE,
+        [(attendance.pk, attendance.course_id, student_id, None) for student_id in student_ids],
+        deleted,
+    )
+
+
+def sync_audience(identity):
+    """
+    What a caller's client syncs: a filter over the change log, the course ids
+    it can see, and the student id for students (None for lecturers).
+
+    Returns:
+        tuple: (Q, set of course ids, student id) or None if the caller is
+        neither a student nor a lecturer
+    """
+    if identity.is_student:
+        student = identity.student.pk
+        course_ids = set(CourseEnrollment.objects.filter(student_id=student).values_list('course_id', flat=True))
+        log_filter = Q(table__in=(SyncChange.TABLE_COURSE, SyncChange.TABLE_SESSION), course_id__in=course_ids) | Q(
+            table__in=(SyncChange.TABLE_ENROLLMENT, SyncChange.TABLE_PRESENCE), student_id=student
+        )
+        return log_filter, course_ids, student
+    if identity.is_lecturer:
+        lecturer = identity.lecturer.pk
+        course_ids = set(Course.objects.filter(lecturer_id=lecturer).values_list('pk', flat=True))
+        return Q(course_id__in=course_ids) | Q(lecturer_id=lecturer), course_ids, None
+    return None
+
+
+def _empty():
+    return {key: [] for key in RESPONSE_KEYS.values()}
+
+
+def _rows(course_ids, session_ids, enrollment_keys, presence_keys, visible, student):
+    """Current rows for the given keys, restricted to what the audience can see"""
+    rows = _empty()
+    if course_ids:
+        rows['courses'] = list(Course.objects.filter(pk__in=course_ids & visible).values(*COURSE_FIELDS))
+    if session_ids:
+        rows['sessions'] = list(
+            Attendance.objects.filter(pk__in=session_ids, course_id__in=visible).values(*SESSION_FIELDS)
+        )
+    if enrollment_keys:
+        enrollments = CourseEnrollment.objects.filter(
+            course_id__in={course_id for course_id, _ in enrollment_keys},
+            student_id__in={student_id for _, student_id in enrollment_keys},
+        )
+        rows['enrollments'] = [
+            row for row in enrollments.values(*ENROLLMENT_FIELDS)
+            if (row['course_id'], row['student_id']) in enrollment_keys
+        ]
+    if presence_keys:
+        presence = _presence().filter(
+            attendance_id__in={attendance_id for attendance_id, _ in presence_keys},
+            student_id__in={student_id for _, student_id in presence_keys},
+        )
+        if student is None:
+            presence = presence.filter(attendance__course_id__in=visible)
+        rows['presence'] = [
+            row for row in presence.values(*PRESENCE_FIELDS)
+            if (row['attendance_id'], row['student_id']) in presence_keys
+        ]
+    return rows
+
+
+def sync_snapshot(visible, student):
+    """Every row the audience can see"""
+    enrollments = CourseEnrollment.objects.filter(course_id__in=visible)
+    presence = _presence().filter(attendance__course_id__in=visible)
+    if student is not None:
+        enrollments = enrollments.filter(student_id=student)
+        presence = presence.filter(student_id=student)
+    return {
+        'courses': list(Course.objects.filter(pk__in=visible).values(*COURSE_FIELDS)),
+        'enrollments': list(enrollments.values(*ENROLLMENT_FIELDS)),
+        'sessions': list(Attendance.objects.filter(course_id__in=visible).values(*SESSION_FIELDS)),
+        'presence': list(presence.values(*PRESENCE_FIELDS)),
+    }
+
+
+def _merge(rows, extra):
+    for key, values in extra.items():
+        seen = {tuple(sorted(row.items())) for row in rows[key]}
+        rows[key] += [row for row in values if tuple(sorted(row.items())) not in seen]
+
+
+def sync_changes(identity, cursor=0, limit=None):
+    """
+    Changes visible to a student or lecturer (an Identity) since `cursor`.
+
+    Returns:
+        dict: cursor (to send next time), has_more, reset, changes (current
+        rows by table) and deleted (tombstones by table), or None if the user
+        has nothing to sync
+    """
+    audience = sync_audience(identity)
+    if audience is None:
+        return None
+    log_filter, visible, student = audience
+    limit = limit or getattr(settings, 'SYNC_PAGE_SIZE', 1000)
+    settled = timezone.now() - timedelta(seconds=getattr(settings, 'SYNC_SETTLE_SECONDS', 2))
+    bounds = SyncChange.objects.aggregate(first=Min('id'), head=Max('id', filter=Q(created_at__lte=settled)))
+    head = bounds['head'] or 0
+    deleted = _empty()
+
+    # A cursor from before the oldest retained entry (pruned) or after the
+    # newest one (restored database) cannot be continued
+    reset = bool(cursor) and (cursor > head or (bounds['first'] is not None and cursor < bounds['first'] - 1))
+    if not cursor or reset:
+        return {
+            'cursor': head, 'has_more': False, 'reset': reset,
+            'changes': sync_snapshot(visible, student), 'deleted': deleted,
+        }
+
+    entries = list(
+        SyncChange.objects.filter(log_filter, id__gt=cursor, id__lte=head).order_by('id').values_list(
+            'id', 'table', 'object_id', 'course_id', 'student_id', 'deleted'
+        )[:limit]
+    )
+    has_more = len(entries) == limit
+
+    # Latest state per row wins
+    latest = {}
+    handed_over = set()
+    for _, table, object_id, course_id, student_id, is_deleted in entries:
+        latest[(table, object_id, student_id)] = is_deleted
+        if table == SyncChange.TABLE_COURSE and course_id is None and not is_deleted:
+            handed_over.add(object_id)
+
+    changed = {table: set() for table in RESPONSE_KEYS}
+    for (table, object_id, student_id), is_deleted in latest.items():
+        key = (object_id, student_id) if table in (SyncChange.TABLE_ENROLLMENT, SyncChange.TABLE_PRESENCE) else object_id
+        if not is_deleted:
+            changed[table].add(key)
+        elif table == SyncChange.TABLE_ENROLLMENT:
+            deleted['enrollments'].append({'course_id': object_id, 'student_id': student_id})
+        elif table == SyncChange.TABLE_PRESENCE:
+            deleted['presence'].append({'attendance_id': object_id, 'student_id': student_id})
+        else:
+            deleted[RESPONSE_KEYS[table]].append(object_id)
+
+    changes = _rows(
+        changed[SyncChange.TABLE_COURSE], changed[SyncChange.TABLE_SESSION],
+        changed[SyncChange.TABLE_ENROLLMENT], changed[SyncChange.TABLE_PRESENCE], visible, student,
+    )
+    if student is not None:
+        # A new enrollment brings the course's history, which predates the cursor
+        joined = {row['course_id'] for row in changes['enrollments']}
+        if joined:
+            _merge(changes, sync_snapshot(joined, student))
+    elif handed_over & visible:
+        # So does a course handed over to this lecturer
+        _merge(changes, sync_snapshot(handed_over & visible, None))
+
+    return {
+        'cursor': entries[-1][0] if has_more else head,
+        'has_more': has_more,
+        'reset': False,
+        'changes': changes,
+        'deleted': deleted,
+    }
+
+
+def prune_sync_log(retention_days=None):
+    """
+    Delete change log entries older than SYNC_LOG_RETENTION_DAYS. The newest
+    entry is always kept so stale cursors can still be detected.
+
+    Returns:
+        int: Entries deleted
+    """
+    retention_days = retention_days or getattr(settings, 'SYNC_LOG_RETENTION_DAYS', 30)
+    newest = SyncChange.objects.aggregate(newest=Max('id'))['newest']
+    if newest is None:
+        return 0
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    deleted, _ = SyncChange.objects.filter(created_at__lt=cutoff, id__lt=newest).delete()
+    return deleted
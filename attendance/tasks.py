@@ -5,9 +5,9 @@ from celery import shared_task
 from django.core.mail import send_mail
 from django.conf import settings
 from .email_utils import send_verification_email, send_password_reset_email, send_sms
-from .report_utils import generate_attendance_pdf, generate_attendance_excel
 from .models import User, Attendance
 import logging
+import tempfile
 
 logger = logging.getLogger(__name__)
 
@@ -81,25 +81,77 @@ def send_attendance_notification_async(self, student_name, course_name, email, p
 
 
 @shared_task(bind=True)
-def generate_attendance_report_async(self, attendance_ids, format_type='pdf'):
+def generate_report_job(self, job_id):
     """
-    Generate attendance report asynchronously
-    Note: This is a placeholder - actual report generation should save to storage
+    Render a ReportJob and store the artifact in the configured storage
+    (local media in development, S3 via django-storages in production)
     """
+    from django.core.files import File
+    from django.utils import timezone
+    from datetime import timedelta
+    from .models import ReportJob
+    from .report_limits import acquire_report_slot, release_report_slot, report_priority
+    from .report_utils import get_or_build_report_artifact, REPORT_ARTIFACT_TYPES
+
     try:
-        attendances = Attendance.objects.filter(id__in=attendance_ids)
-        
-        if format_type == 'pdf':
-            buffer = generate_attendance_pdf(attendances)
-        else:
-            buffer = generate_attendance_excel(attendances)
-        
-        logger.info(f"Generated {format_type} report for {len(attendance_ids)} attendances")
-        # In production, save buffer to cloud storage and return URL
-        return f"Report generated for {len(attendance_ids)} attendances"
-    except Exception as e:
-        logger.error(f"Error generating report: {str(e)}")
-        raise
+        job = ReportJob.objects.get(id=job_id)
+    except ReportJob.DoesNotExist:
+        logger.error(f"Report job {job_id} not found")
+        return f"Report job {job_id} not found"
+
+    # Respect the per-node and per-organization report limits; if they are
+    # exhausted, requeue at the same priority rather than hold a worker
+    slots = acquire_report_slot(job.organization_id)
+    if slots is None:
+        if not self.request.called_directly:
+            raise self.retry(
+                countdown=getattr(settings, 'REPORT_RETRY_AFTER', 5),
+                max_retries=None,
+                priority=report_priority(job.format, job.filters),
+            )
+        # Called directly (management shell, tests), never from a web request: wait for a slot
+        slots = acquire_report_slot(job.organization_id, wait=getattr(settings, 'REPORT_SLOT_TTL', 15 * 60))
+
+    try:
+        job.status = ReportJob.STATUS_RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+
+        def progress(percent):
+            ReportJob.objects.filter(pk=job.pk).update(progress=percent)
+
+        try:
+            if job.format == 'transcript':
+                from .transcript_utils import build_transcript_archive, transcript_job_workers
+                output = tempfile.TemporaryFile()
+                # Always 1 in a prefork child (daemonic processes cannot fork a pool)
+                row_count = build_transcript_archive(
+                    output, job.filters, job.organization_id, transcript_job_workers(), progress=progress
+                )
+                output.seek(0)
+            else:
+                output, row_count = get_or_build_report_artifact(job.format, job.filters, job.organization_id, progress)
+            extension, _ = REPORT_ARTIFACT_TYPES[job.format]
+            with output:
+                job.artifact.save(f"attendance_report.{extension}", File(output), save=False)
+
+            job.status = ReportJob.STATUS_COMPLETED
+            job.progress = 100
+            job.row_count = row_count
+            job.completed_at = timezone.now()
+            job.expires_at = job.completed_at + timedelta(seconds=getattr(settings, 'REPORT_ARTIFACT_TTL', 24 * 60 * 60))
+            job.save()
+            logger.info(f"Generated {job.format} report job {job.pk} with {row_count} rows")
+            return f"Report job {job.pk} completed"
+        except Exception as e:
+            logger.error(f"Error generating report job {job.pk}: {str(e)}")
+            job.status = ReportJob.STATUS_FAILED
+            job.error = str(e)
+            job.completed_at = timezone.now()
+            job.save(update_fields=['status', 'error', 'completed_at'])
+            return f"Report job {job.pk} failed"
+    finally:
+        release_report_slot(slots)
 
 
 @shared_task
@@ -132,19 +184,102 @@ def send_attendance_reminders():
     Periodic task to send attendance reminders for active sessions
     """
     from .email_utils import send_attendance_reminder
+    from .roster_utils import absent_students
     
-    active_attendances = Attendance.objects.filter(is_active=True)
+    active_attendances = Attendance.objects.filter(is_active=True).select_related('course')
     reminder_count = 0
     
     for attendance in active_attendances:
-        # Get students who haven't checked in yet
-        enrolled_students = attendance.course.students.all()
-        checked_in_student_ids = [s.id for s in attendance.present_students.all()]
-        
-        for student in enrolled_students:
-            if student.id not in checked_in_student_ids:
-                send_attendance_reminder(student, attendance)
-                reminder_count += 1
+        # Students who haven't checked in yet
+        for student in absent_students(attendance).select_related('user'):
+            send_attendance_reminder(student, attendance)
+            reminder_count += 1
     
     logger.info(f"Sent {reminder_count} attendance reminders")
     return f"Sent {reminder_count} reminders"
+
+
+@shared_task
+def compute_analytics_snapshots():
+    """
+    Periodic task to precompute admin analytics snapshots for each organization
+    (plus the global scope) and standard window
+    """
+    from .analytics_utils import ANALYTICS_SNAPSHOT_WINDOWS, create_analytics_snapshot
+    from .models import Organization
+
+    snapshot_count = 0
+    for organization in [None] + list(Organization.objects.filter(is_active=True)):
+        for window in ANALYTICS_SNAPSHOT_WINDOWS:
+            try:
+                create_analytics_snapshot(window, organization)
+                snapshot_count += 1
+            except Exception as e:
+                logger.error(f"Error computing {window} analytics snapshot for {organization or 'all organizations'}: {str(e)}")
+
+    logger.info(f"Computed {snapshot_count} analytics snapshots")
+    return f"Computed {snapshot_count} analytics snapshots"
+
+
+@shared_task
+def reconcile_attendance_counters():
+    """
+    Periodic task to close expired sessions, repair enrollment counter drift
+    and rebuild the at-risk table
+    """
+    from .enrollment_utils import close_expired_sessions, reconcile_enrollment_counters, rebuild_at_risk_students
+
+    expired = close_expired_sessions()
+    if expired:
+        logger.info(f"Closed {expired} expired attendance sessions")
+    corrected = reconcile_enrollment_counters()
+    at_risk = rebuild_at_risk_students()
+    logger.info(f"Corrected {corrected} enrollment counters, {at_risk} enrollments at risk")
+    return f"Corrected {corrected} enrollment counters, {at_risk} enrollments at risk"
+
+
+@shared_task
+def cleanup_expired_report_jobs():
+    """
+    Periodic task to delete report artifacts whose download window has passed
+    """
+    from .models import ReportJob
+    from django.utils import timezone
+
+    expired = ReportJob.objects.filter(expires_at__lt=timezone.now()).exclude(artifact='')
+    deleted = 0
+    for job in expired.iterator():
+        job.artifact.delete(save=True)
+        deleted += 1
+
+    logger.info(f"Deleted {deleted} expired report artifacts")
+    return f"Deleted {deleted} expired report artifacts"
+
+
+@shared_task
+def generate_profile_thumbnails(model_label, pk):
+    """
+    Generate profile picture thumbnails for a lecturer or student and store their URLs
+    """
+    from django.apps import apps
+    from .thumbnail_utils import profile_picture_stale, refresh_profile_picture_urls
+
+    instance = apps.get_model(model_label).objects.filter(pk=pk).first()
+    if instance is None or not profile_picture_stale(instance):
+        return f"Thumbnails for {model_label} {pk} are up to date"
+    if refresh_profile_picture_urls(instance) is None:
+        return f"Picture of {model_label} {pk} changed while its thumbnails were generated"
+    logger.info(f"Generated thumbnails for {model_label} {pk}")
+    return f"Generated thumbnails for {model_label} {pk}"
+
+
+@shared_task
+def prune_sync_log():
+    """
+    Periodic task to delete delta sync change log entries past their retention
+    """
+    from .sync_utils import prune_sync_log as prune
+
+    deleted = prune()
+    logger.info(f"Pruned {deleted} sync change log entries")
+    return f"Pruned {deleted} sync change log entries"
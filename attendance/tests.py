@@ -1,4 +1,4 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
 from rest_framework.authtoken.models import Token
@@ -214,3 +214,1566 @@ class FeedbackTests(TestCase):
             resp = self.client.post('/api/feedback/', {'rating': 4, 'comment': f'c{i}'}, format='json')
             results.append(resp.status_code)
         self.assertTrue(429 in results)
+
+
+class AdminAnalyticsCacheTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin1', password='pass123', is_staff=True)
+        self.client.force_authenticate(self.admin)
+
+    def test_sections_include_computed_at(self):
+        resp = self.client.get('/api/admin/analytics/?days=7')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('system_overview', resp.data)
+        self.assertEqual(set(resp.data['computed_at']), {
+            'system_overview', 'attendance_statistics', 'top_courses',
+            'attendance_trends', 'student_participation', 'lecturer_activity',
+        })
+
+    def test_cached_sections_are_reused_until_fresh_requested(self):
+        from unittest.mock import patch
+        self.client.get('/api/admin/analytics/?days=7')
+        with patch('attendance.analytics_utils.get_system_overview') as mock_overview:
+            mock_overview.return_value = {'total_students': 99}
+            resp = self.client.get('/api/admin/analytics/?days=7')
+            self.assertFalse(mock_overview.called)
+            self.assertNotEqual(resp.data['system_overview'], {'total_students': 99})
+
+            resp = self.client.get('/api/admin/analytics/?days=7&fresh=1')
+            self.assertTrue(mock_overview.called)
+            self.assertEqual(resp.data['system_overview'], {'total_students': 99})
+
+    def test_stale_section_served_while_single_refresh_runs(self):
+        from unittest.mock import patch
+        from .analytics_utils import get_analytics_section
+        with self.settings(ANALYTICS_CACHE_TTL=0):
+            first, computed_at = get_analytics_section('system_overview', days=7)
+            with patch('attendance.analytics_utils._spawn_refresh') as mock_refresh:
+                value, stale_computed_at = get_analytics_section('system_overview', days=7)
+                get_analytics_section('system_overview', days=7)
+        self.assertEqual(value, first)
+        self.assertEqual(stale_computed_at, computed_at)
+        # The refresh lock stops the second stale read from spawning another refresh
+        self.assertEqual(mock_refresh.call_count, 1)
+
+
+class AnalyticsSnapshotTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin2', password='pass123', is_staff=True)
+        self.client.force_authenticate(self.admin)
+
+    def test_task_creates_versioned_snapshots_with_deltas(self):
+        from .models import AnalyticsSnapshot
+        from .tasks import compute_analytics_snapshots
+        compute_analytics_snapshots()
+        Student.objects.create(
+            user=User.objects.create_user(username='snapstudent', password='pass123'),
+            student_id='S5001', name='Snap Student'
+        )
+        compute_analytics_snapshots()
+
+        latest = AnalyticsSnapshot.objects.filter(window='30d').order_by('-version').first()
+        self.assertEqual(latest.version, 2)
+        self.assertEqual(latest.deltas['system_overview']['total_students'], 1)
+        self.assertEqual(AnalyticsSnapshot.objects.filter(window='term').count(), 2)
+
+    def test_view_serves_latest_snapshot_for_standard_window(self):
+        from unittest.mock import patch
+        from .tasks import compute_analytics_snapshots
+        compute_analytics_snapshots()
+        with patch('attendance.views.get_analytics_section') as mock_section:
+            resp = self.client.get('/api/admin/analytics/?days=30')
+            self.assertFalse(mock_section.called)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['snapshot']['window'], '30d')
+        self.assertIn('system_overview', resp.data)
+
+
+class TenantAnalyticsTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import Organization
+        cache.clear()
+        self.org_a = Organization.objects.create(name='University A')
+        self.org_b = Organization.objects.create(name='University B')
+        for idx, org in enumerate([self.org_a, self.org_b, self.org_b]):
+            user = User.objects.create_user(username=f'tenantlect{idx}', password='pass123')
+            lecturer = Lecturer.objects.create(user=user, staff_id=f'TL{idx}', name=f'Lecturer {idx}', organization=org)
+            course = Course.objects.create(name=f'Course {idx}', course_code=f'TEN{idx}', lecturer=lecturer, organization=org)
+            Attendance.objects.create(course=course, date=timezone.now().date())
+
+    def test_sessions_inherit_course_organization(self):
+        self.assertEqual(Attendance.objects.filter(organization=self.org_b).count(), 2)
+
+    def test_moving_a_course_moves_its_sessions(self):
+        from .analytics_utils import get_system_overview
+        from .version_utils import get_version
+        course = Course.objects.get(course_code='TEN0')
+        version = get_version('organization', self.org_a.id)
+        course.organization = self.org_b
+        course.save()
+        self.assertEqual(Attendance.objects.filter(organization=self.org_b).count(), 3)
+        self.assertEqual(get_system_overview(organization=self.org_a)['total_attendance_sessions'], 0)
+        self.assertGreater(get_version('organization', self.org_a.id), version)
+
+        course.name = 'Renamed'
+        with self.assertNumQueries(2):  # The pre_save lookup and the update, no resync
+            course.save()
+
+    def test_overview_is_scoped_to_organization(self):
+        from .analytics_utils import get_system_overview, get_attendance_statistics
+        self.assertEqual(get_system_overview(organization=self.org_a)['total_attendance_sessions'], 1)
+        self.assertEqual(get_system_overview(organization=self.org_b)['total_courses'], 2)
+        self.assertEqual(get_system_overview()['total_attendance_sessions'], 3)
+        self.assertEqual(get_attendance_statistics(days=7, organization=self.org_b)['total_sessions'], 2)
+
+    def test_staff_can_select_organization(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='tenantadmin', password='pass123', is_staff=True))
+        resp = client.get(f'/api/admin/analytics/?days=14&organization={self.org_a.id}')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['system_overview']['total_courses'], 1)
+
+
+class EnrollmentCounterTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = APIClient()
+        self.student_user = User.objects.create_user(username='counterstudent', password='pass123')
+        self.student = Student.objects.create(user=self.student_user, student_id='S6001', name='Counter Student')
+        self.lecturer_user = User.objects.create_user(username='counterlect', password='pass123')
+        self.lecturer = Lecturer.objects.create(user=self.lecturer_user, staff_id='L6001', name='Counter Lecturer')
+        self.course = Course.objects.create(name='Chemistry', course_code='CHEM101', lecturer=self.lecturer)
+        self.course.students.add(self.student)
+        AttendanceToken.objects.create(course=self.course, token='CNT123')
+
+    def _enrollment(self):
+        from .models import CourseEnrollment
+        return CourseEnrollment.objects.get(course=self.course, student=self.student)
+
+    def test_check_in_and_close_update_counters_once(self):
+        self.client.force_authenticate(self.student_user)
+        for _ in range(2):
+            resp = self.client.post('/api/courses/take_attendance/', {'token': 'CNT123'}, format='json')
+            self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self._enrollment().sessions_attended, 1)
+
+        self.client.force_authenticate(self.lecturer_user)
+        resp = self.client.post('/api/attendances/end_attendance/', {'course_id': self.course.id}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        enrollment = self._enrollment()
+        self.assertEqual(enrollment.sessions_held, 1)
+        self.assertEqual(enrollment.attendance_percentage, 100.0)
+
+        self.client.force_authenticate(self.student_user)
+        resp = self.client.get('/api/api/student-attendance-summary/')
+        self.assertEqual(resp.data[0]['course_code'], 'CHEM101')
+        self.assertEqual(resp.data[0]['attendance_percentage'], 100.0)
+
+    def test_reconcile_command_repairs_drift(self):
+        from django.core.management import call_command
+        from io import StringIO
+        attendance = Attendance.objects.create(course=self.course, date=timezone.now().date(), is_active=False)
+        attendance.present_students.add(self.student)
+        Attendance.objects.create(course=self.course, date=timezone.now().date() + timezone.timedelta(days=1), is_active=False)
+
+        call_command('reconcile_enrollment_counters', stdout=StringIO())
+        enrollment = self._enrollment()
+        self.assertEqual((enrollment.sessions_held, enrollment.sessions_attended), (2, 1))
+        self.assertEqual(enrollment.attendance_percentage, 50.0)
+
+    def test_update_closes_through_close_session(self):
+        attendance = Attendance.objects.create(course=self.course, date=timezone.now().date())
+        self.client.force_authenticate(self.lecturer_user)
+        resp = self.client.patch(f'/api/attendances/{attendance.id}/', {'is_active': False}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(resp.data['is_active'])
+        self.assertIsNotNone(resp.data['ended_at'])
+        self.assertEqual(self._enrollment().sessions_held, 1)
+
+    def test_presence_edits_adjust_attended_counter(self):
+        from .enrollment_utils import mark_student_present
+        other = Student.objects.create(
+            user=User.objects.create_user(username='counterother', password='pass123'), student_id='S6002', name='Other'
+        )
+        attendance = Attendance.objects.create(course=self.course, date=timezone.now().date())
+        mark_student_present(attendance, self.student)
+        attendance.present_students.remove(self.student, other)
+        self.assertEqual(self._enrollment().sessions_attended, 0)
+        attendance.present_students.add(self.student)
+        self.assertEqual(self._enrollment().sessions_attended, 1)
+        attendance.present_students.clear()
+        attendance.present_students.remove(self.student)
+        self.assertEqual(self._enrollment().sessions_attended, 0)
+
+    def test_reconcile_closes_expired_sessions(self):
+        from django.core.management import call_command
+        from io import StringIO
+        from .enrollment_utils import mark_student_present
+        from .models import CourseEnrollment
+        CourseEnrollment.objects.filter(course=self.course).update(enrolled_at=timezone.now() - timezone.timedelta(days=2))
+        yesterday = Attendance.objects.create(course=self.course, date=timezone.now().date() - timezone.timedelta(days=1))
+        today = Attendance.objects.create(course=self.course, date=timezone.now().date())
+        mark_student_present(yesterday, self.student)
+
+        call_command('reconcile_enrollment_counters', stdout=StringIO())
+        yesterday.refresh_from_db()
+        today.refresh_from_db()
+        self.assertEqual((yesterday.is_active, today.is_active), (False, True))
+        enrollment = self._enrollment()
+        self.assertEqual((enrollment.sessions_held, enrollment.sessions_attended), (1, 1))
+
+    def test_participation_buckets_read_counters(self):
+        from .analytics_utils import get_student_participation
+        from .models import CourseEnrollment
+        CourseEnrollment.objects.filter(student=self.student).update(sessions_held=10, sessions_attended=6)
+        self.assertEqual(get_student_participation()['medium_participation'], 1)
+
+
+class AtRiskStudentTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = APIClient()
+        self.lecturer_user = User.objects.create_user(username='risklect', password='pass123')
+        self.lecturer = Lecturer.objects.create(user=self.lecturer_user, staff_id='L7001', name='Risk Lecturer')
+        self.course = Course.objects.create(name='Biology', course_code='BIO101', lecturer=self.lecturer)
+        self.regular = Student.objects.create(
+            user=User.objects.create_user(username='regular', password='pass123'), student_id='S7001', name='Regular'
+        )
+        self.absent = Student.objects.create(
+            user=User.objects.create_user(username='absentee', password='pass123'), student_id='S7002', name='Absentee'
+        )
+        self.course.students.add(self.regular, self.absent)
+
+    def _run_sessions(self, count, present):
+        from .enrollment_utils import mark_student_present, close_session
+        for offset in range(count):
+            attendance = Attendance.objects.create(course=self.course, date=timezone.now().date() + timezone.timedelta(days=offset))
+            for student in present:
+                mark_student_present(attendance, student)
+            close_session(attendance)
+
+    def test_closing_sessions_flags_and_clears_students(self):
+        from .models import AtRiskStudent
+        with self.settings(AT_RISK_MIN_SESSIONS=3, AT_RISK_THRESHOLD=75):
+            self._run_sessions(3, [self.regular])
+            entry = AtRiskStudent.objects.get()
+            self.assertEqual(entry.student, self.absent)
+            self.assertEqual(entry.attendance_rate, 0.0)
+
+            self._run_sessions(9, [self.regular, self.absent])
+            self.assertFalse(AtRiskStudent.objects.exists())
+
+    def test_lecturer_pages_through_at_risk_students(self):
+        with self.settings(AT_RISK_MIN_SESSIONS=1):
+            self._run_sessions(2, [])
+        self.client.force_authenticate(self.lecturer_user)
+        resp = self.client.get('/api/api/at-risk-students/?page_size=1')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data['results']), 1)
+        self.assertIsNotNone(resp.data['next'])
+        first = resp.data['results'][0]['id']
+        resp = self.client.get(resp.data['next'])
+        self.assertEqual(len(resp.data['results']), 1)
+        self.assertIsNone(resp.data['next'])
+        second = resp.data['results'][0]['id']
+        self.assertLess(first, second)  # Tied rates fall back to id
+
+        # A new row tied with the first one lands before the cursor, not on the next page
+        from .models import AtRiskStudent
+        late = AtRiskStudent.objects.get(pk=second)
+        late.pk = None
+        late.student = Student.objects.create(
+            user=User.objects.create_user(username='late-absentee', password='pass123'), student_id='S7003', name='Late'
+        )
+        late.save()
+        resp = self.client.get(resp.data['previous'])
+        self.assertEqual([row['id'] for row in resp.data['results']], [first])
+        resp = self.client.get(resp.data['next'])
+        self.assertEqual([row['id'] for row in resp.data['results']], [second])
+        resp = self.client.get(resp.data['next'])
+        self.assertEqual([row['id'] for row in resp.data['results']], [late.pk])
+
+        resp = self.client.get('/api/api/at-risk-students/?course_id=abc')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('course_id', resp.data)
+
+        self.client.force_authenticate(self.regular.user)
+        resp = self.client.get('/api/api/at-risk-students/')
+        self.assertEqual(resp.data['results'], [])
+
+
+class AttendanceReportStreamingTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = APIClient()
+        lecturer = Lecturer.objects.create(
+            user=User.objects.create_user(username='reportlect', password='pass123'), staff_id='L8001', name='Report Lecturer'
+        )
+        self.course = Course.objects.create(name='History', course_code='HIS101', lecturer=lecturer)
+        self.students = [
+            Student.objects.create(
+                user=User.objects.create_user(username=f'reportstudent{i}', password='pass123'),
+                student_id=f'S800{i}', name=f'Report Student {i}'
+            ) for i in range(3)
+        ]
+        self.attendance = Attendance.objects.create(course=self.course, date=timezone.now().date())
+        self.attendance.present_students.add(*self.students[:2])
+        self.client.force_authenticate(lecturer.user)
+
+    def test_csv_streams_one_row_per_check_in(self):
+        resp = self.client.get(f'/api/attendance-report/?format=csv&course_id={self.course.id}')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        lines = b''.join(resp.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'session_id,date,course_code,course_name,lecturer,student_id,student_name')
+        self.assertEqual(len(lines), 3)
+        self.assertIn('S8000', lines[1])
+
+    def test_ndjson_filters_by_student(self):
+        import json
+        resp = self.client.get(f'/api/attendance-report/?format=ndjson&student_id={self.students[1].id}')
+        self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in b''.join(resp.streaming_content).decode().splitlines()]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['student_id'], 'S8001')
+        self.assertEqual(records[0]['course_code'], 'HIS101')
+
+    def test_excel_and_pdf_list_each_check_in(self):
+        import tempfile
+        from io import BytesIO
+        from openpyxl import load_workbook
+        with tempfile.TemporaryDirectory() as media, self.settings(MEDIA_ROOT=media):
+            resp = self.client.get(f'/api/attendance-report/?format=excel&course_id={self.course.id}')
+            self.assertEqual(resp.status_code, 200)
+            ws = load_workbook(BytesIO(b''.join(resp.streaming_content))).active
+            self.assertEqual([row[2] for row in ws.iter_rows(min_row=2, values_only=True)], ['S8000', 'S8001'])
+
+            resp = self.client.get(f'/api/attendance-report/?format=pdf&course_id={self.course.id}')
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(b''.join(resp.streaming_content).startswith(b'%PDF'))
+
+    def test_large_pdf_uses_canvas_renderer(self):
+        from unittest.mock import patch
+        from . import report_utils
+        with self.settings(REPORT_PDF_TABLE_MAX_ROWS=1), \
+                patch.object(report_utils, 'generate_attendance_pdf') as table_renderer:
+            output, rows = report_utils.build_report_artifact('pdf', {'course_id': self.course.id})
+        table_renderer.assert_not_called()
+        self.assertEqual(rows, 2)
+        self.assertTrue(output.read().startswith(b'%PDF'))
+
+    def test_report_is_scoped_to_users_organization(self):
+        from .models import Organization
+        org = Organization.objects.create(name='Report Org', slug='report-org')
+        other = Organization.objects.create(name='Other Org', slug='other-org')
+        self.course.lecturer.organization = org
+        self.course.lecturer.save()
+        foreign_course = Course.objects.create(name='Latin', course_code='LAT101', lecturer=self.course.lecturer, organization=other)
+        Attendance.objects.create(course=foreign_course, date=timezone.now().date()).present_students.add(self.students[2])
+        Attendance.objects.filter(course=self.course).update(organization=org)
+
+        resp = self.client.get('/api/attendance-report/?format=csv')
+        body = b''.join(resp.streaming_content).decode()
+        self.assertIn('HIS101', body)
+        self.assertNotIn('LAT101', body)
+
+
+class ExcelReportTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = APIClient()
+        lecturer = Lecturer.objects.create(
+            user=User.objects.create_user(username='excellect', password='pass123'), staff_id='L9001', name='Excel Lecturer'
+        )
+        self.course = Course.objects.create(name='Geography', course_code='GEO101', lecturer=lecturer)
+        self.present = Student.objects.create(
+            user=User.objects.create_user(username='excelpresent', password='pass123'), student_id='S9001', name='Present Student With A Long Name'
+        )
+        self.absent = Student.objects.create(
+            user=User.objects.create_user(username='excelabsent', password='pass123'), student_id='S9002', name='Absent'
+        )
+        self.course.students.add(self.present, self.absent)
+        self.attendance = Attendance.objects.create(course=self.course, date=timezone.now().date())
+        self.attendance.present_students.add(self.present)
+        self.client.force_authenticate(lecturer.user)
+
+    def test_write_excel_report_sizes_columns(self):
+        from openpyxl import load_workbook
+        from .report_utils import write_excel_report
+        output = write_excel_report(['ID', 'Name'], ([i, f'name-{i:05d}'] for i in range(500)))
+        ws = load_workbook(output).active
+        self.assertEqual(ws.max_row, 501)
+        self.assertEqual(ws['A2'].value, 0)
+        self.assertEqual(ws.column_dimensions['B'].width, len('name-00000') + 2)
+
+    def test_generate_excel_lists_present_then_absent(self):
+        from io import BytesIO
+        from openpyxl import load_workbook
+        resp = self.client.get(f'/api/attendances/generate_excel/?attendance_id={self.attendance.id}')
+        self.assertEqual(resp.status_code, 200)
+        ws = load_workbook(BytesIO(b''.join(resp.streaming_content))).active
+        rows = list(ws.iter_rows(min_row=2, values_only=True))
+        self.assertEqual([(row[0], row[3]) for row in rows], [('S9001', 'Present'), ('S9002', 'Absent')])
+
+    def test_session_roster_query_count_does_not_grow_with_class_size(self):
+        from .roster_utils import session_roster
+        for i in range(20):
+            self.course.students.add(Student.objects.create(
+                user=User.objects.create_user(username=f'rosterstudent{i}', password='pass123'),
+                student_id=f'S93{i:02d}', name=f'Roster Student {i}'
+            ))
+        with self.assertNumQueries(2):
+            present, absent = session_roster(self.attendance)
+        self.assertEqual(present, [('S9001', 'Present Student With A Long Name')])
+        self.assertEqual(len(absent), 21)
+
+    def test_generate_pdf_renders_roster(self):
+        resp = self.client.get(f'/api/attendances/generate_pdf/?attendance_id={self.attendance.id}')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(b''.join(resp.streaming_content).startswith(b'%PDF'))
+
+
+class ReportJobTests(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.core.cache import cache
+        cache.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.client = APIClient()
+        self.lecturer_user = User.objects.create_user(username='joblect', password='pass123')
+        lecturer = Lecturer.objects.create(user=self.lecturer_user, staff_id='L1101', name='Job Lecturer')
+        self.course = Course.objects.create(name='Economics', course_code='ECO101', lecturer=lecturer)
+        student = Student.objects.create(
+            user=User.objects.create_user(username='jobstudent', password='pass123'), student_id='S1101', name='Job Student'
+        )
+        attendance = Attendance.objects.create(course=self.course, date=timezone.now().date())
+        attendance.present_students.add(student)
+        self.client.force_authenticate(self.lecturer_user)
+
+    def _run_inline(self):
+        from unittest.mock import patch
+        from .tasks import generate_report_job
+        return patch.object(generate_report_job, 'apply_async', side_effect=lambda args, **kwargs: generate_report_job(*args))
+
+    def test_job_runs_and_artifact_downloads_with_signed_link(self):
+        with self.settings(MEDIA_ROOT=self.media.name), self._run_inline():
+            with self.captureOnCommitCallbacks(execute=True):
+                resp = self.client.post('/api/report-jobs/', {'format': 'csv', 'filters': {'course_id': self.course.id}}, format='json')
+            self.assertEqual(resp.status_code, 201)
+
+            poll = self.client.get(f"/api/report-jobs/{resp.data['id']}/")
+            self.assertEqual(poll.data['status'], 'completed')
+            self.assertEqual(poll.data['progress'], 100)
+            self.assertEqual(poll.data['row_count'], 1)
+
+            anonymous = APIClient()
+            download = anonymous.get(poll.data['download_url'])
+            self.assertEqual(download.status_code, 200)
+            self.assertIn(b'S1101', b''.join(download.streaming_content))
+
+            tampered = anonymous.get(f"/api/report-jobs/{resp.data['id']}/download/?token=bogus")
+            self.assertEqual(tampered.status_code, 403)
+
+            # The stored key is random; the job id only appears in the download filename
+            from .models import ReportJob
+            name = ReportJob.objects.get(pk=resp.data['id']).artifact.name
+            self.assertRegex(name, r'^reports/\d{4}/\d{2}/[0-9a-f]{32}\.csv$')
+            self.assertIn(f'attendance_report_{resp.data["id"]}.csv', download['Content-Disposition'])
+
+    def test_artifacts_use_private_storage_on_s3(self):
+        from unittest.mock import patch
+        from storages.backends.s3boto3 import S3Boto3Storage
+        from .models import report_storage
+        with patch('django.core.files.storage.default_storage', S3Boto3Storage(default_acl='public-read', querystring_auth=False)):
+            storage = report_storage()
+        self.assertEqual(storage.default_acl, 'private')
+        self.assertTrue(storage.querystring_auth)
+        self.assertIsNone(storage.custom_domain)
+
+    def test_async_report_request_returns_job(self):
+        with self.settings(MEDIA_ROOT=self.media.name), self._run_inline():
+            with self.captureOnCommitCallbacks(execute=True):
+                resp = self.client.get(f'/api/attendance-report/?format=excel&async=1&course_id={self.course.id}')
+        self.assertEqual(resp.status_code, 202)
+        from .models import ReportJob
+        job = ReportJob.objects.get(pk=resp.data['id'])
+        self.assertEqual(job.status, ReportJob.STATUS_COMPLETED)
+        self.assertEqual(job.filters, {'course_id': str(self.course.id), 'lecturer_id': self.course.lecturer_id})
+
+
+class ReportAuthorizationTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import Organization
+        cache.clear()
+        self.client = APIClient()
+        self.organization = Organization.objects.create(name='Auth Org', slug='auth-org')
+        self.lecturer = Lecturer.objects.create(
+            user=User.objects.create(username='authlect'), staff_id='L1701', name='Auth Lecturer',
+            organization=self.organization,
+        )
+        other = Lecturer.objects.create(user=User.objects.create(username='authother'), staff_id='L1702', name='Other')
+        self.course = Course.objects.create(
+            name='Law', course_code='LAW101', lecturer=self.lecturer, organization=self.organization
+        )
+        self.foreign = Course.objects.create(name='Art', course_code='ART101', lecturer=other)
+        self.student = Student.objects.create(user=User.objects.create(username='authstudent'), student_id='S1701', name='Auth Student')
+        for course in (self.course, self.foreign):
+            Attendance.objects.create(course=course, date=timezone.now().date()).present_students.add(self.student)
+
+    def get(self, user, query):
+        self.client.force_authenticate(user)
+        return self.client.get(f'/api/attendance-report/?{query}')
+
+    def test_students_and_unlinked_staff_are_forbidden(self):
+        self.assertEqual(self.get(self.student.user, f'format=csv&student_id={self.student.id}').status_code, 403)
+        staff = User.objects.create(username='authstaff', is_staff=True)
+        self.assertEqual(self.get(staff, 'format=csv').status_code, 403)
+        self.client.force_authenticate(self.student.user)
+        resp = self.client.post('/api/report-jobs/', {'format': 'pdf', 'filters': {}}, format='json')
+        self.assertEqual(resp.status_code, 403)
+
+    def test_lecturers_only_see_their_own_courses(self):
+        self.assertEqual(self.get(self.lecturer.user, f'format=csv&course_id={self.foreign.id}').status_code, 403)
+        resp = self.get(self.lecturer.user, f'format=csv&student_id={self.student.id}')
+        body = b''.join(resp.streaming_content).decode()
+        resp.close()
+        self.assertIn('LAW101', body)
+        self.assertNotIn('ART101', body)
+        self.assertEqual(self.get(self.lecturer.user, 'format=csv&course_id=abc').status_code, 400)
+
+        resp = self.client.post('/api/report-jobs/', {'format': 'pdf', 'filters': {'course_id': self.foreign.id}}, format='json')
+        self.assertEqual(resp.status_code, 403)
+
+    def test_staff_only_see_their_organizations_jobs(self):
+        from .models import Organization, ReportJob
+        job = ReportJob.objects.create(format='csv', filters={}, organization_id=self.organization.id)
+        other_org = Organization.objects.create(name='Other Org', slug='other-org')
+        outsider = User.objects.create(username='authoutsider', is_staff=True)
+        Student.objects.create(user=outsider, student_id='S1702', name='Outsider', organization=other_org)
+        self.client.force_authenticate(outsider)
+        self.assertEqual(self.client.get('/api/report-jobs/').data['results'], [])
+        self.assertEqual(self.client.get(f'/api/report-jobs/{job.id}/').status_code, 404)
+
+        insider = User.objects.create(username='authinsider', is_staff=True)
+        Student.objects.create(user=insider, student_id='S1703', name='Insider', organization=self.organization)
+        self.client.force_authenticate(insider)
+        self.assertEqual(self.client.get(f'/api/report-jobs/{job.id}/').status_code, 200)
+        self.client.force_authenticate(User.objects.create(username='authroot', is_staff=True, is_superuser=True))
+        self.assertEqual(self.client.get(f'/api/report-jobs/{job.id}/').status_code, 200)
+
+    def test_transcripts_are_staff_only(self):
+        self.client.force_authenticate(self.lecturer.user)
+        resp = self.client.post('/api/report-jobs/', {'format': 'transcript', 'filters': {'course_id': self.course.id}}, format='json')
+        self.assertEqual(resp.status_code, 403)
+
+
+class ReportCacheTests(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.core.cache import cache
+        cache.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        lecturer = Lecturer.objects.create(
+            user=User.objects.create_user(username='cachelect', password='pass123'), staff_id='L1201', name='Cache Lecturer'
+        )
+        self.course = Course.objects.create(name='Statistics', course_code='STA101', lecturer=lecturer)
+        self.student = Student.objects.create(
+            user=User.objects.create_user(username='cachestudent', password='pass123'), student_id='S1201', name='Cache Student'
+        )
+        self.attendance = Attendance.objects.create(course=self.course, date=timezone.now().date())
+        self.filters = {'course_id': self.course.id}
+
+    def _build_calls(self):
+        from unittest.mock import patch
+        from . import report_utils
+        return patch.object(report_utils, 'build_report_artifact', wraps=report_utils.build_report_artifact)
+
+    def test_repeat_report_is_served_from_cache(self):
+        from .report_utils import get_or_build_report_artifact
+        with self.settings(MEDIA_ROOT=self.media.name), self._build_calls() as build:
+            first, _ = get_or_build_report_artifact('csv', self.filters)
+            second, _ = get_or_build_report_artifact('csv', self.filters)
+            self.assertEqual(first.read(), second.read())
+            first.close()
+            second.close()
+        self.assertEqual(build.call_count, 1)
+
+    def test_check_in_invalidates_cached_report(self):
+        from .enrollment_utils import mark_student_present
+        from .report_utils import get_or_build_report_artifact
+        with self.settings(MEDIA_ROOT=self.media.name), self._build_calls() as build:
+            get_or_build_report_artifact('csv', self.filters)[0].close()
+            mark_student_present(self.attendance, self.student)
+            output, rows = get_or_build_report_artifact('csv', self.filters)
+            self.assertIn(b'S1201', output.read())
+            output.close()
+        self.assertEqual(build.call_count, 2)
+        self.assertEqual(rows, 1)
+
+    def test_removed_check_in_and_rename_invalidate_cached_report(self):
+        from .enrollment_utils import mark_student_present
+        from .report_utils import get_or_build_report_artifact
+        mark_student_present(self.attendance, self.student)
+        with self.settings(MEDIA_ROOT=self.media.name), self._build_calls() as build:
+            get_or_build_report_artifact('csv', self.filters)[0].close()
+            self.student.name = 'Renamed Student'
+            self.student.save()
+            output, rows = get_or_build_report_artifact('csv', self.filters)
+            self.assertIn(b'Renamed Student', output.read())
+            output.close()
+            self.attendance.present_students.remove(self.student)
+            output, rows = get_or_build_report_artifact('csv', self.filters)
+            output.close()
+        self.assertEqual(build.call_count, 3)
+        self.assertEqual(rows, 0)
+
+    def test_deleted_session_invalidates_cached_report(self):
+        from .enrollment_utils import mark_student_present
+        from .report_utils import get_or_build_report_artifact
+        mark_student_present(self.attendance, self.student)
+        with self.settings(MEDIA_ROOT=self.media.name), self._build_calls() as build:
+            get_or_build_report_artifact('csv', self.filters)[0].close()
+            Attendance.objects.filter(pk=self.attendance.pk).delete()
+            output, rows = get_or_build_report_artifact('csv', self.filters)
+            output.close()
+        self.assertEqual(build.call_count, 2)
+        self.assertEqual(rows, 0)
+
+    def test_eviction_keeps_cache_within_budget(self):
+        from .models import ReportCacheEntry
+        from .report_utils import get_or_build_report_artifact, evict_report_cache
+        with self.settings(MEDIA_ROOT=self.media.name):
+            get_or_build_report_artifact('csv', self.filters)[0].close()
+            get_or_build_report_artifact('ndjson', self.filters)[0].close()
+            newest = ReportCacheEntry.objects.get(format='ndjson')
+            evicted = evict_report_cache(max_bytes=newest.size)
+        self.assertEqual(evicted, 1)
+        self.assertEqual(list(ReportCacheEntry.objects.values_list('format', flat=True)), ['ndjson'])
+
+
+@override_settings(EXPORT_LAG_SECONDS=0, EXPORT_OVERLAP_SECONDS=0)
+class WarehouseExportTests(TestCase):
+    def setUp(self):
+        from unittest.mock import patch
+        # TestCase never commits; write change log entries at once, as autocommit views do
+        on_commit = patch('attendance.sync_utils.transaction.on_commit', side_effect=lambda callback: callback())
+        on_commit.start()
+        self.addCleanup(on_commit.stop)
+        lecturer = Lecturer.objects.create(
+            user=User.objects.create_user(username='exportlect', password='pass123'), staff_id='L1301', name='Export Lecturer'
+        )
+        self.course = Course.objects.create(name='Philosophy', course_code='PHI101', lecturer=lecturer)
+        self.students = [
+            Student.objects.create(
+                user=User.objects.create_user(username=f'exportstudent{i}', password='pass123'),
+                student_id=f'S130{i}', name=f'Export Student {i}'
+            ) for i in range(3)
+        ]
+        self.course.students.add(*self.students)
+        self.attendance = Attendance.objects.create(course=self.course, date=timezone.now().date())
+        self.attendance.present_students.add(*self.students[:2])
+
+    def test_incremental_export_only_writes_new_rows(self):
+        import pyarrow.parquet as pq
+        from io import BytesIO
+        from .export_utils import write_export
+        first = BytesIO()
+        rows, watermark = write_export('presence', first, batch_size=1)
+        self.assertEqual(rows, 2)
+        table = pq.read_table(BytesIO(first.getvalue()))
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(set(table.column('student_id').to_pylist()), {s.id for s in self.students[:2]})
+
+        self.attendance.present_students.add(self.students[2])
+        second = BytesIO()
+        rows, _ = write_export('presence', second, since=watermark)
+        self.assertEqual(rows, 1)
+        self.assertEqual(pq.read_table(BytesIO(second.getvalue())).column('student_id').to_pylist(), [self.students[2].id])
+
+    def test_incremental_export_carries_tombstones_and_late_commits(self):
+        import pyarrow.parquet as pq
+        from datetime import timedelta
+        from io import BytesIO
+        from .export_utils import write_export
+        from .models import CourseEnrollment, SyncChange
+        _, watermark = write_export('presence', BytesIO())
+        _, enrollment_watermark = write_export('enrollments', BytesIO())
+
+        self.attendance.present_students.remove(self.students[0])
+        self.attendance.present_students.add(self.students[2])
+        # Logged before the watermark, committed after the export read the log
+        SyncChange.objects.filter(table=SyncChange.TABLE_PRESENCE, student_id=self.students[2].id).update(
+            created_at=timezone.now() - timedelta(seconds=30)
+        )
+        CourseEnrollment.objects.get(course=self.course, student=self.students[1]).delete()
+
+        output = BytesIO()
+        with self.settings(EXPORT_OVERLAP_SECONDS=60):
+            rows, _ = write_export('presence', output, since=watermark)
+        table = pq.read_table(BytesIO(output.getvalue())).to_pydict()
+        # The overlap re-reads the first export's rows too; each key appears once
+        self.assertEqual(rows, 3)
+        self.assertEqual(
+            sorted(zip(table['student_id'], table['deleted'])),
+            sorted([(self.students[0].id, True), (self.students[1].id, False), (self.students[2].id, False)]),
+        )
+
+        output = BytesIO()
+        rows, _ = write_export('enrollments', output, since=enrollment_watermark)
+        table = pq.read_table(BytesIO(output.getvalue())).to_pydict()
+        self.assertEqual(rows, 1)
+        self.assertEqual(
+            (table['course_id'], table['student_id'], table['deleted'], table['id']),
+            ([self.course.id], [self.students[1].id], [True], [None]),
+        )
+
+    def test_admin_endpoint_returns_arrow_with_watermark(self):
+        import pyarrow as pa
+        admin = User.objects.create_superuser(username='exportadmin', password='pass123')
+        client = APIClient()
+        client.force_authenticate(admin)
+        resp = client.get('/api/admin/export/?table=sessions&format=arrow')
+        self.assertEqual(resp.status_code, 200)
+        table = pa.ipc.open_file(pa.py_buffer(b''.join(resp.streaming_content))).read_all()
+        self.assertEqual(table.column('id').to_pylist(), [self.attendance.id])
+        self.assertEqual(resp['X-Export-Rows'], '1')
+
+        resp = client.get('/api/admin/export/', {'table': 'sessions', 'format': 'arrow', 'since': resp['X-Export-Watermark']})
+        self.assertEqual(resp['X-Export-Rows'], '0')
+
+
+class TranscriptTests(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        lecturer = Lecturer.objects.create(
+            user=User.objects.create_user(username='translect', password='pass123'), staff_id='L1401', name='Transcript Lecturer'
+        )
+        self.course = Course.objects.create(name='Chemistry', course_code='CHE101', lecturer=lecturer)
+        self.students = [
+            Student.objects.create(
+                user=User.objects.create_user(username=f'transstudent{i}', password='pass123'),
+                student_id=f'S140{i}', name=f'Transcript Student {i}'
+            ) for i in range(3)
+        ]
+        self.course.students.add(*self.students)
+        today = timezone.now().date()
+        for offset, present in ((1, self.students[:2]), (0, self.students[:1])):
+            session = Attendance.objects.create(course=self.course, date=today + timedelta(days=offset), is_active=False)
+            session.present_students.add(*present)
+
+    def test_transcript_data_is_loaded_in_bulk(self):
+        from .transcript_utils import get_transcripts
+        with self.assertNumQueries(4):
+            transcripts = get_transcripts([s.id for s in self.students])
+        self.assertEqual(
+            [(t['student_id'], t['courses'][0]['attended'], t['courses'][0]['held']) for t in transcripts],
+            [('S1400', 2, 2), ('S1401', 1, 2), ('S1402', 0, 2)],
+        )
+
+    def test_archive_has_one_pdf_per_student(self):
+        import zipfile
+        from io import BytesIO
+        from .transcript_utils import build_transcript_archive
+        output = BytesIO()
+        count = build_transcript_archive(output, {'course_id': self.course.id}, workers=1, batch_size=2)
+        self.assertEqual(count, 3)
+        with zipfile.ZipFile(output) as archive:
+            self.assertEqual(sorted(archive.namelist()), ['S1400.pdf', 'S1401.pdf', 'S1402.pdf'])
+            self.assertTrue(archive.read('S1400.pdf').startswith(b'%PDF'))
+
+
+    def test_archive_renders_on_a_process_pool(self):
+        import zipfile
+        from io import BytesIO
+        from .transcript_utils import build_transcript_archive
+        output = BytesIO()
+        count = build_transcript_archive(output, {'course_id': self.course.id}, workers=2, batch_size=1)
+        self.assertEqual(count, 3)
+        with zipfile.ZipFile(output) as archive:
+            self.assertEqual(sorted(archive.namelist()), ['S1400.pdf', 'S1401.pdf', 'S1402.pdf'])
+            self.assertTrue(all(archive.read(name).startswith(b'%PDF') for name in archive.namelist()))
+
+    def test_job_workers_are_capped_and_pool_skipped_in_daemon_workers(self):
+        from unittest.mock import patch
+        from . import transcript_utils
+        with self.settings(TRANSCRIPT_WORKERS=0, TRANSCRIPT_MAX_WORKERS=2), patch('os.cpu_count', return_value=64):
+            self.assertEqual(transcript_utils.transcript_workers(), 64)
+            self.assertEqual(transcript_utils.transcript_job_workers(), 2)
+            with patch.object(transcript_utils, '_in_daemon_process', return_value=True):
+                self.assertEqual(transcript_utils.transcript_workers(), 1)
+                self.assertEqual(transcript_utils.transcript_job_workers(), 1)
+
+
+class ReportConcurrencyTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = APIClient()
+        lecturer = Lecturer.objects.create(
+            user=User.objects.create_user(username='limitlect', password='pass123'), staff_id='L1501', name='Limit Lecturer'
+        )
+        self.course = Course.objects.create(name='Music', course_code='MUS101', lecturer=lecturer)
+        self.client.force_authenticate(lecturer.user)
+
+    def test_slots_are_bounded_and_released_after_streaming(self):
+        from .report_limits import acquire_report_slot, release_report_slot
+        with self.settings(REPORT_NODE_CONCURRENCY=1):
+            held = acquire_report_slot()
+            self.assertIsNotNone(held)
+            self.assertIsNone(acquire_report_slot())
+            release_report_slot(held)
+
+            resp = self.client.get(f'/api/attendance-report/?format=csv&course_id={self.course.id}')
+            self.assertIsNone(acquire_report_slot())
+            b''.join(resp.streaming_content)
+            resp.close()
+            self.assertIsNotNone(acquire_report_slot())
+
+    def test_report_is_queued_with_priority_when_at_capacity(self):
+        from unittest.mock import patch
+        from .models import ReportJob
+        from .report_limits import REPORT_PRIORITY_COURSE, acquire_report_slot
+        from .tasks import generate_report_job
+        with self.settings(REPORT_NODE_CONCURRENCY=1, REPORT_SLOT_WAIT=0), \
+                patch.object(generate_report_job, 'apply_async') as apply_async:
+            acquire_report_slot()
+            with self.captureOnCommitCallbacks(execute=True):
+                resp = self.client.get(f'/api/attendance-report/?format=excel&course_id={self.course.id}')
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(ReportJob.objects.get(pk=resp.data['id']).status, ReportJob.STATUS_PENDING)
+        self.assertEqual(apply_async.call_args.kwargs['priority'], REPORT_PRIORITY_COURSE)
+
+    def test_slot_is_released_when_stream_is_closed_unread(self):
+        from .report_limits import acquire_report_slot
+        with self.settings(REPORT_NODE_CONCURRENCY=1):
+            resp = self.client.get(f'/api/attendance-report/?format=csv&course_id={self.course.id}')
+            self.assertIsNone(acquire_report_slot())
+            resp.close()
+            self.assertIsNotNone(acquire_report_slot())
+
+    def test_broker_outage_fails_job_without_rendering_inline(self):
+        from unittest.mock import patch
+        from .models import ReportJob
+        from .report_limits import acquire_report_slot
+        from .tasks import generate_report_job
+        with self.settings(REPORT_NODE_CONCURRENCY=1, REPORT_SLOT_WAIT=0, REPORT_RETRY_AFTER=7), \
+                patch.object(generate_report_job, 'apply_async', side_effect=ConnectionError('broker down')), \
+                patch.object(generate_report_job, 'run') as run, \
+                patch('attendance.views.transaction.on_commit', side_effect=lambda func, *args, **kwargs: func()):
+            # Views run in autocommit, where on_commit callbacks fire immediately
+            acquire_report_slot()
+            resp = self.client.get(f'/api/attendance-report/?format=excel&course_id={self.course.id}')
+        run.assert_not_called()
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp['Retry-After'], '7')
+        self.assertEqual(ReportJob.objects.get(pk=resp.data['id']).status, ReportJob.STATUS_FAILED)
+
+    def test_course_reports_outrank_institution_reports(self):
+        from .report_limits import report_priority
+        self.assertLess(report_priority('pdf', {'course_id': '1'}), report_priority('pdf', {}))
+        self.assertLess(report_priority('pdf', {}), report_priority('transcript', {}))
+
+
+class CourseSerializerPayloadTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.lecturer = Lecturer.objects.create(
+            user=User.objects.create_user(username='payloadlect', password='pass123'), staff_id='L1601', name='Payload Lecturer'
+        )
+        self.students = [
+            Student.objects.create(
+                user=User.objects.create_user(username=f'payloadstudent{i}', password='pass123'),
+                student_id=f'S16{i:02d}', name=f'Payload Student {i}'
+            ) for i in range(30)
+        ]
+        for i in range(3):
+            self.add_course(i)
+        self.client.force_authenticate(self.lecturer.user)
+
+    def add_course(self, i):
+        course = Course.objects.create(name=f'Course {i}', course_code=f'PAY{i:03d}', lecturer=self.lecturer)
+        course.students.add(*self.students)
+        return course
+
+    def list_queries(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return resp, len(queries)
+
+    def test_list_is_compact_and_query_count_is_constant(self):
+        compact, compact_queries = self.list_queries('/api/courses/')
+        course = compact.data['results'][0]
+        self.assertEqual(course['student_count'], 30)
+        self.assertNotIn('students', course)
+        self.assertEqual(set(course['lecturer']), {'id', 'staff_id', 'name'})
+
+        expanded, expanded_queries = self.list_queries('/api/courses/?expand=students')
+        self.assertEqual(len(expanded.data['results'][0]['students']), 30)
+        self.assertLess(len(compact.content) * 5, len(expanded.content))
+
+        for i in range(3, 8):
+            self.add_course(i)
+        self.assertEqual(self.list_queries('/api/courses/')[1], compact_queries)
+        self.assertEqual(self.list_queries('/api/courses/?expand=students')[1], expanded_queries)
+
+    def test_sparse_fieldsets(self):
+        resp = self.client.get('/api/courses/?fields=id,course_code')
+        self.assertEqual(set(resp.data['results'][0]), {'id', 'course_code'})
+        resp = self.client.get('/api/lecturers/my-courses/?fields=id&expand=organization')
+        self.assertEqual(set(resp.data[0]), {'id', 'organization'})
+
+    def test_student_enrolled_courses_counts_whole_roster(self):
+        self.client.force_authenticate(self.students[0].user)
+        from django.urls import reverse
+        resp = self.client.get(reverse('student_enrolled_courses'))
+        self.assertEqual([course['student_count'] for course in resp.data['results']], [30, 30, 30])
+
+
+class ListQueryBudgetTests(TestCase):
+    """
+    Query budget harness: every list endpoint must run the same number of
+    queries whatever the number of rows, and stay within its budget.
+    """
+    budgets = {
+        '/api/lecturers/': 2,
+        '/api/students/': 2,
+        '/api/courses/': 1,
+        '/api/attendances/': 4,
+        '/api/attendance-tokens/': 2,
+        '/api/feedback/': 1,
+    }
+
+    def setUp(self):
+        from .models import Organization
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser(username='budgetadmin', password='pass123'))
+        self.organization = Organization.objects.create(name='Budget Org', slug='budget-org')
+        self.rows = 0
+
+    def grow(self, count):
+        from .models import Feedback
+        for _ in range(count):
+            i = self.rows = self.rows + 1
+            lecturer = Lecturer.objects.create(
+                user=User.objects.create_user(username=f'budgetlect{i}', password='pass123'),
+                staff_id=f'LB{i:03d}', name=f'Budget Lecturer {i}', organization=self.organization
+            )
+            course = Course.objects.create(
+                name=f'Budget Course {i}', course_code=f'BUD{i:03d}', lecturer=lecturer, organization=self.organization
+            )
+            students = [
+                Student.objects.create(
+                    user=User.objects.create_user(username=f'budgetstudent{i}_{j}', password='pass123'),
+                    student_id=f'SB{i:03d}{j}', name=f'Budget Student {i}.{j}', organization=self.organization
+                ) for j in range(2)
+            ]
+            course.students.add(*students)
+            attendance = Attendance.objects.create(course=course, date=timezone.now().date())
+            attendance.present_students.add(*students)
+            AttendanceToken.objects.create(course=course, token=f'B{i:05d}', expires_at=timezone.now())
+            Feedback.objects.create(user=lecturer.user, rating=5, comment='ok')
+
+    def count_queries(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200, url)
+        return len(queries)
+
+    def test_list_endpoints_stay_within_query_budget(self):
+        self.grow(2)
+        small = {url: self.count_queries(url) for url in self.budgets}
+        self.grow(5)
+        for url, budget in self.budgets.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), small[url], f'{url} query count grows with rows')
+                self.assertLessEqual(small[url], budget)
+
+    def test_lists_are_cursor_paginated_without_offset(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.grow(5)
+        seen = []
+        url = '/api/students/?page_size=4'
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                resp = self.client.get(url)
+                self.assertEqual(resp.status_code, 200)
+                self.assertLessEqual(len(resp.data['results']), 4)
+                seen += [student['id'] for student in resp.data['results']]
+                url = resp.data['next']
+        self.assertEqual(seen, sorted(Student.objects.values_list('id', flat=True), reverse=True))
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+
+        from unittest.mock import patch
+        from .pagination import StableCursorPagination
+        with patch.object(StableCursorPagination, 'max_page_size', 3):
+            resp = self.client.get('/api/students/?page_size=1000')
+        self.assertEqual(len(resp.data['results']), 3)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.lecturer = Lecturer.objects.create(
+            user=User.objects.create_user(username='etaglect', password='pass123'), staff_id='L1801', name='ETag Lecturer'
+        )
+        self.student = Student.objects.create(
+            user=User.objects.create_user(username='etagstudent', password='pass123'), student_id='S1801', name='ETag Student'
+        )
+        self.course = Course.objects.create(name='Caching', course_code='ETG101', lecturer=self.lecturer)
+        self.course.students.add(self.student)
+        self.client.force_authenticate(self.lecturer.user)
+
+    def revalidate(self, url, **headers):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url, **headers)
+        return resp, len(queries)
+
+    def test_unchanged_data_short_circuits_with_304(self):
+        for url in ('/api/me/', '/api/courses/', '/api/lecturers/my-courses/',
+                    f'/api/courses/{self.course.id}/live_attendance/'):
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                self.assertEqual(first.status_code, 200)
+                self.assertIn('private', first['Cache-Control'])
+                resp, queries = self.revalidate(url, HTTP_IF_NONE_MATCH=first['ETag'])
+                self.assertEqual(resp.status_code, 304)
+                self.assertLessEqual(queries, 1)  # At most the lecturer's course ids, never the serializer's
+                resp = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+                self.assertEqual(resp.status_code, 304)
+
+    def test_changes_produce_a_new_etag(self):
+        from .enrollment_utils import mark_student_present
+        live = f'/api/courses/{self.course.id}/live_attendance/'
+        courses = self.client.get('/api/courses/')['ETag']
+        me = self.client.get('/api/me/')['ETag']
+        roster = self.client.get(live)['ETag']
+
+        attendance = Attendance.objects.create(course=self.course, date=timezone.now().date(), is_active=True)
+        mark_student_present(attendance, self.student)
+        resp = self.client.get(live, HTTP_IF_NONE_MATCH=roster)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['present_count'], 1)
+
+        other = Student.objects.create(
+            user=User.objects.create_user(username='etagstudent2', password='pass123'), student_id='S1802', name='Late Joiner'
+        )
+        self.course.students.add(other)
+        resp = self.client.get('/api/courses/', HTTP_IF_NONE_MATCH=courses)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['results'][0]['student_count'], 2)
+        self.assertEqual(self.client.get('/api/me/', HTTP_IF_NONE_MATCH=me).status_code, 304)
+
+        self.client.patch('/api/me/', {'first_name': 'Ada'}, format='json')
+        self.assertEqual(self.client.get('/api/me/', HTTP_IF_NONE_MATCH=me).status_code, 200)
+
+    def test_history_and_me_follow_presence_sessions_and_organization(self):
+        from .enrollment_utils import mark_student_present
+        from .models import Organization
+        self.client.force_authenticate(self.student.user)
+        history = '/api/api/student-attendance-history/'
+
+        def changed(url, etag):
+            return self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+        attendance = Attendance.objects.create(course=self.course, date=timezone.now().date())
+        mark_student_present(attendance, self.student)
+        etag = self.client.get(history)['ETag']
+        attendance.present_students.remove(self.student)
+        self.assertTrue(changed(history, etag))
+
+        attendance.present_students.add(self.student)
+        etag = self.client.get(history)['ETag']
+        attendance.date -= timezone.timedelta(days=1)
+        attendance.save()
+        self.assertTrue(changed(history, etag))
+
+        etag = self.client.get(history)['ETag']
+        attendance.delete()
+        self.assertTrue(changed(history, etag))
+
+        organization = Organization.objects.create(name='ETag Org', slug='etag-org')
+        self.student.organization = organization
+        self.student.save()
+        me = self.client.get('/api/me/')['ETag']
+        organization.name = 'ETag Organization'
+        organization.save()
+        resp = self.client.get('/api/me/', HTTP_IF_NONE_MATCH=me)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_etag_is_per_user(self):
+        etag = self.client.get('/api/courses/')['ETag']
+        self.client.force_authenticate(self.student.user)
+        self.assertEqual(self.client.get('/api/courses/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ValuesModeReadTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.lecturer = Lecturer.objects.create(
+            user=User.objects.create_user(username='valueslect', password='pass123'), staff_id='L1901', name='Values Lecturer'
+        )
+        self.students = [
+            Student.objects.create(
+                user=User.objects.create_user(username=f'valuesstudent{i}', password='pass123'),
+                student_id=f'S19{i:02d}', name=f'Values Student {i}'
+            ) for i in range(3)
+        ]
+        self.course = Course.objects.create(name='Values', course_code='VAL101', lecturer=self.lecturer)
+        self.course.students.add(*self.students)
+        self.attendance = Attendance.objects.create(course=self.course, date=timezone.now().date(), is_active=True)
+        self.attendance.present_students.add(self.students[0])
+
+    def test_fast_renderer_matches_json_renderer(self):
+        import json
+        from decimal import Decimal
+        from django.utils.translation import gettext_lazy
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import FastJSONRenderer
+        data = {
+            'when': timezone.now(), 'day': timezone.now().date(), 'amount': Decimal('1.50'),
+            'label': gettext_lazy('Present'), 'nested': [{'id': 1, 'name': 'Line\u2028break'}], 'none': None,
+        }
+        fast = FastJSONRenderer().render(data)
+        self.assertEqual(json.loads(fast), json.loads(JSONRenderer().render(data)))
+        self.assertNotIn(b'\xe2\x80\xa8', fast)
+        self.assertEqual(FastJSONRenderer().render({'big': 2 ** 70}), b'{"big":1180591620717411303424}')
+
+    def test_roster_is_built_from_values(self):
+        self.client.force_authenticate(self.lecturer.user)
+        with self.assertNumQueries(3):
+            resp = self.client.get(f'/api/attendances/{self.attendance.id}/roster/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([s['student_id'] for s in resp.data['present']], ['S1900'])
+        self.assertEqual([s['student_id'] for s in resp.data['absent']], ['S1901', 'S1902'])
+        self.assertEqual((resp.data['present_count'], resp.data['enrolled_count']), (1, 3))
+
+    def test_history_is_grouped_by_course(self):
+        self.client.force_authenticate(self.students[0].user)
+        resp = self.client.get('/api/api/student-attendance-history/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), [
+            {'course_code': 'VAL101', 'attendances': [{'date': self.attendance.date.isoformat()}]}
+        ])
+
+
+class CompressionMiddlewareTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = APIClient()
+        lecturer = Lecturer.objects.create(
+            user=User.objects.create_user(username='gziplect', password='pass123'), staff_id='L2001', name='Gzip Lecturer'
+        )
+        self.course = Course.objects.create(name='Compression', course_code='ZIP101', lecturer=lecturer)
+        students = [
+            Student.objects.create(
+                user=User.objects.create(username=f'gzipstudent{i}'),
+                student_id=f'S20{i:02d}', name=f'Gzip Student {i}'
+            ) for i in range(40)
+        ]
+        self.course.students.add(*students)
+        attendance = Attendance.objects.create(course=self.course, date=timezone.now().date())
+        attendance.present_students.add(*students)
+        self.client.force_authenticate(lecturer.user)
+
+    def test_large_json_is_gzipped(self):
+        import gzip
+        import json
+        plain = self.client.get('/api/courses/?expand=students')
+        self.assertNotIn('Content-Encoding', plain)
+        resp = self.client.get('/api/courses/?expand=students', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', resp['Vary'])
+        self.assertLess(len(resp.content), len(plain.content))
+        self.assertEqual(json.loads(gzip.decompress(resp.content)), json.loads(plain.content))
+
+        small = self.client.get('/api/me/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', small)
+        refused = self.client.get('/api/courses/?expand=students', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', refused)
+
+    def test_brotli_is_preferred_when_installed(self):
+        from .middleware import BROTLI_AVAILABLE
+        if not BROTLI_AVAILABLE:
+            self.skipTest('Brotli is not installed')
+        import brotli
+        resp = self.client.get('/api/courses/?expand=students', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(resp['Content-Encoding'], 'br')
+        self.assertIn(b'Gzip Student 39', brotli.decompress(resp.content))
+        with self.settings(COMPRESSION_BROTLI=False):
+            resp = self.client.get('/api/courses/?expand=students', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+
+    def test_report_streams_are_compressed_and_xlsx_is_not(self):
+        import gzip
+        resp = self.client.get(f'/api/attendance-report/?format=csv&course_id={self.course.id}', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(b''.join(resp.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 41)
+
+        import tempfile
+        with tempfile.TemporaryDirectory() as media, self.settings(MEDIA_ROOT=media):
+            resp = self.client.get(f'/api/attendance-report/?format=excel&course_id={self.course.id}', HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(resp.status_code, 200)
+            self.assertNotIn('Content-Encoding', resp)
+            resp.close()
+
+    def test_secret_bearing_responses_are_not_compressed(self):
+        from .models import AttendanceToken
+        for i in range(40):
+            AttendanceToken.objects.create(course=self.course, token=f'SECRET{i:02d}', is_active=True)
+        resp = self.client.get('/api/attendance-tokens/?page_size=40', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertGreater(len(resp.content), 1024)
+        self.assertNotIn('Content-Encoding', resp)
+
+        html = self.client.get('/api/courses/?expand=students', HTTP_ACCEPT='text/html', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(html.status_code, 200)
+        self.assertNotIn('Content-Encoding', html)
+
+        login = APIClient().post(
+            '/api/api/login/staff/', {'username': 'gziplect', 'password': 'pass123', 'staff_id': 'L2001'},
+            format='json', HTTP_ACCEPT_ENCODING='gzip',
+        )
+        self.assertIn('token', login.data)
+        self.assertNotIn('Content-Encoding', login)
+
+
+class ProfileThumbnailTests(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = self.settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.client = APIClient()
+        self.student = Student.objects.create(
+            user=User.objects.create(username='thumbstudent'), student_id='S2101', name='Thumb Student'
+        )
+
+    def upload(self, size=(400, 300)):
+        from io import BytesIO
+        from unittest.mock import patch
+        from PIL import Image
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .tasks import generate_profile_thumbnails
+        buffer = BytesIO()
+        Image.new('RGBA', size, (200, 0, 0, 128)).save(buffer, 'PNG')
+        self.student.profile_picture = SimpleUploadedFile('face.png', buffer.getvalue(), content_type='image/png')
+        with patch.object(generate_profile_thumbnails, 'delay', side_effect=ConnectionError), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.student.save()
+        self.student.refresh_from_db()
+
+    def test_upload_generates_square_jpeg_variants(self):
+        from PIL import Image
+        from django.core.files.storage import default_storage
+        from .thumbnail_utils import THUMBNAIL_SIZES, thumbnail_name
+        self.upload()
+        urls = self.student.profile_picture_urls
+        self.assertEqual(urls['source'], self.student.profile_picture.name)
+        for variant, size in THUMBNAIL_SIZES.items():
+            with default_storage.open(thumbnail_name(self.student.profile_picture.name, variant)) as f:
+                image = Image.open(f)
+                self.assertEqual((image.format, image.size), ('JPEG', (size, size)))
+            self.assertTrue(urls[variant].endswith(f'_{variant}.jpg'))
+
+    def test_serializers_emit_stored_urls_without_storage_calls(self):
+        from unittest.mock import patch
+        from django.core.files.storage import default_storage
+        self.upload()
+        self.client.force_authenticate(User.objects.create_superuser(username='thumbadmin', password='pass123'))
+        with patch.object(default_storage, 'url', side_effect=AssertionError('storage URL built per row')):
+            resp = self.client.get('/api/students/')
+        student = resp.data['results'][0]
+        self.assertEqual(student['profile_picture'], f"http://testserver{self.student.profile_picture_urls['original']}")
+        self.assertTrue(student['profile_thumbnails']['small'].startswith('http://testserver/media/student_pictures/thumbnails/'))
+
+    def test_clearing_the_picture_clears_urls(self):
+        self.upload()
+        self.student.profile_picture = None
+        self.student.save()
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.profile_picture_urls, {})
+
+    def test_slow_refresh_does_not_overwrite_a_newer_picture(self):
+        from .thumbnail_utils import refresh_profile_picture_urls
+        self.upload()
+        stale = Student.objects.get(pk=self.student.pk)
+        self.upload(size=(200, 200))
+        self.assertIsNone(refresh_profile_picture_urls(stale))
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.profile_picture_urls['source'], self.student.profile_picture.name)
+        self.assertNotEqual(stale.profile_picture.name, self.student.profile_picture.name)
+
+
+class BulkEnrollmentTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser(username='bulkadmin', password='pass123'))
+        lecturer = Lecturer.objects.create(
+            user=User.objects.create(username='bulklect'), staff_id='L2201', name='Bulk Lecturer'
+        )
+        self.course = Course.objects.create(name='Bulk', course_code='BLK101', lecturer=lecturer)
+        users = User.objects.bulk_create([User(username=f'bulkstudent{i}') for i in range(60)])
+        self.students = Student.objects.bulk_create([
+            Student(user=user, student_id=f'S22{i:02d}', name=f'Bulk Student {i}') for i, user in enumerate(users)
+        ])
+        self.course.students.add(*self.students[:30])
+        from django.urls import reverse
+        self.url = reverse('admin_bulk_enroll')
+
+    def enrolled(self):
+        from .models import CourseEnrollment
+        return set(CourseEnrollment.objects.filter(course=self.course).values_list('student__student_id', flat=True))
+
+    def test_replace_applies_diff_in_constant_queries(self):
+        from .models import AtRiskStudent
+        AtRiskStudent.objects.create(
+            student=self.students[0], course=self.course, attendance_rate=10, sessions_held=5, sessions_attended=0
+        )
+        roster = [student.student_id for student in self.students[20:]]
+        with self.assertNumQueries(12), self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(self.url, {'course_id': self.course.id, 'student_ids': roster}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual((resp.data['added'], resp.data['removed'], resp.data['unchanged']), (30, 20, 10))
+        self.assertEqual(self.enrolled(), set(roster))
+        self.assertFalse(AtRiskStudent.objects.exists())
+
+    def test_csv_add_and_dry_run(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        body = 'student_id,name\nS2230,Bulk Student 30\nS2200,Bulk Student 0\n'
+        resp = self.client.post(self.url, {
+            'course_id': self.course.id, 'mode': 'add', 'dry_run': 'true',
+            'file': SimpleUploadedFile('roster.csv', body.encode(), content_type='text/csv'),
+        })
+        self.assertEqual((resp.data['added'], resp.data['removed']), (1, 0))
+        self.assertNotIn('S2230', self.enrolled())
+
+        resp = self.client.post(self.url, {
+            'course_id': self.course.id, 'mode': 'add',
+            'file': SimpleUploadedFile('roster.csv', body.encode(), content_type='text/csv'),
+        })
+        self.assertEqual(resp.data['added'], 1)
+        self.assertEqual(len(self.enrolled()), 31)
+
+    def test_unknown_ids_apply_nothing(self):
+        resp = self.client.post(self.url, {'course_id': self.course.id, 'student_ids': ['S2200', 'NOPE']}, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.data['not_found'], ['NOPE'])
+        self.assertEqual(len(self.enrolled()), 30)
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class DeltaSyncTests(TestCase):
+    url = '/api/sync/'
+
+    def setUp(self):
+        from unittest.mock import patch
+        # TestCase never commits; write change log entries at once, as autocommit views do
+        self.on_commit = patch('attendance.sync_utils.transaction.on_commit', side_effect=lambda callback: callback())
+        self.on_commit.start()
+        self.addCleanup(self.on_commit.stop)
+        self.client = APIClient()
+        self.lecturer = Lecturer.objects.create(
+            user=User.objects.create(username='sync-lecturer'), staff_id='SL1', name='Sync Lecturer'
+        )
+        self.student = Student.objects.create(user=User.objects.create(username='sync-student'), student_id='SS1', name='Sync Student')
+        self.other = Student.objects.create(user=User.objects.create(username='sync-other'), student_id='SS2', name='Other Student')
+        self.course = Course.objects.create(name='Sync', course_code='SYNC101', lecturer=self.lecturer)
+        self.course.students.add(self.student, self.other)
+        self.session = Attendance.objects.create(course=self.course, date=timezone.now().date())
+
+    def sync(self, user, cursor=None):
+        self.client.force_authenticate(user)
+        resp = self.client.get(self.url, {} if cursor is None else {'cursor': cursor})
+        self.assertEqual(resp.status_code, 200)
+        return resp.data
+
+    def test_snapshot_then_empty_delta(self):
+        data = self.sync(self.student.user)
+        self.assertFalse(data['reset'])
+        self.assertEqual([row['id'] for row in data['changes']['courses']], [self.course.id])
+        self.assertEqual([row['student_id'] for row in data['changes']['enrollments']], [self.student.id])
+        self.assertEqual([row['id'] for row in data['changes']['sessions']], [self.session.id])
+
+        data = self.sync(self.student.user, data['cursor'])
+        self.assertEqual(sum(len(rows) for rows in data['changes'].values()), 0)
+        self.assertFalse(data['has_more'])
+
+    def test_delta_carries_rows_and_tombstones_the_user_can_see(self):
+        from .enrollment_utils import close_session, mark_student_present
+        cursor = self.sync(self.student.user)['cursor']
+        lecturer_cursor = self.sync(self.lecturer.user)['cursor']
+
+        mark_student_present(self.session, self.student)
+        mark_student_present(self.session, self.other)
+        close_session(self.session)
+        data = self.sync(self.student.user, cursor)
+        self.assertEqual(data['changes']['presence'], [{'attendance_id': self.session.id, 'student_id': self.student.id}])
+        self.assertFalse(data['changes']['sessions'][0]['is_active'])
+
+        self.course.students.remove(self.student)
+        data = self.sync(self.student.user, data['cursor'])
+        self.assertEqual(data['deleted']['enrollments'], [{'course_id': self.course.id, 'student_id': self.student.id}])
+
+        data = self.sync(self.lecturer.user, lecturer_cursor)
+        self.assertEqual(len(data['changes']['presence']), 2)
+        self.assertEqual(len(data['deleted']['enrollments']), 1)
+
+    def test_new_enrollment_backfills_course_history(self):
+        newcomer = Student.objects.create(user=User.objects.create(username='sync-new'), student_id='SS3', name='New')
+        cursor = self.sync(newcomer.user)['cursor']
+        self.course.students.add(newcomer)
+        data = self.sync(newcomer.user, cursor)
+        self.assertEqual([row['id'] for row in data['changes']['courses']], [self.course.id])
+        self.assertEqual([row['id'] for row in data['changes']['sessions']], [self.session.id])
+
+    def test_course_handover_moves_it_between_lecturers(self):
+        successor = Lecturer.objects.create(user=User.objects.create(username='sync-successor'), staff_id='SL2', name='Successor')
+        cursor = self.sync(self.lecturer.user)['cursor']
+        successor_cursor = self.sync(successor.user)['cursor']
+        self.course.lecturer = successor
+        self.course.save()
+
+        data = self.sync(self.lecturer.user, cursor)
+        self.assertEqual(data['deleted']['courses'], [self.course.id])
+        self.assertEqual(data['changes']['courses'], [])
+        data = self.sync(successor.user, successor_cursor)
+        self.assertEqual(data['deleted']['courses'], [])
+        self.assertEqual([row['id'] for row in data['changes']['courses']], [self.course.id])
+        self.assertEqual([row['id'] for row in data['changes']['sessions']], [self.session.id])
+        self.assertEqual(len(data['changes']['enrollments']), 2)
+
+    def test_log_entries_are_written_on_commit(self):
+        from django.db import transaction
+        from .models import SyncChange
+        self.on_commit.stop()
+        before = SyncChange.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Attendance.objects.create(course=self.course, date=timezone.now().date(), is_active=False)
+                self.assertEqual(SyncChange.objects.count(), before)
+            try:
+                with transaction.atomic():
+                    Attendance.objects.create(course=self.course, date=timezone.now().date(), is_active=False)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        # Only the committed session is logged
+        self.assertEqual(SyncChange.objects.count(), before + 1)
+
+    def test_paging_and_pruned_cursor(self):
+        from .models import SyncChange
+        from .sync_utils import prune_sync_log
+        cursor = self.sync(self.lecturer.user)['cursor']
+        for i in range(3):
+            Attendance.objects.create(course=self.course, date=timezone.now().date() - timezone.timedelta(days=i + 1))
+        sessions, pages, data = set(), 0, {'cursor': cursor, 'has_more': True}
+        with override_settings(SYNC_PAGE_SIZE=2):
+            while data['has_more']:
+                data = self.sync(self.lecturer.user, data['cursor'])
+                sessions |= {row['id'] for row in data['changes']['sessions']}
+                pages += 1
+        self.assertGreater(pages, 1)
+        self.assertEqual(len(sessions), 3)
+
+        SyncChange.objects.update(created_at=timezone.now() - timezone.timedelta(days=60))
+        self.assertGreater(prune_sync_log(), 0)
+        self.assertEqual(SyncChange.objects.count(), 1)
+        data = self.sync(self.lecturer.user, cursor)
+        self.assertTrue(data['reset'])
+        self.assertEqual(len(data['changes']['sessions']), 4)
+
+    def test_admin_and_bad_cursor_rejected(self):
+        self.client.force_authenticate(User.objects.create(username='sync-admin', is_staff=True))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_authenticate(self.student.user)
+        self.assertEqual(self.client.get(self.url, {'cursor': 'x'}).status_code, 400)
+
+
+class IdentityTests(TestCase):
+    def setUp(self):
+        from .models import Organization
+        self.client = APIClient()
+        self.organization = Organization.objects.create(name='Identity University', slug='identity-u')
+        self.student = Student.objects.create(
+            user=User.objects.create(username='identity-student'), student_id='SI1', name='Identity Student',
+            organization=self.organization,
+        )
+        self.token = Token.objects.create(user=self.student.user)
+
+    def test_token_request_loads_profile_with_the_token(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        with self.assertNumQueries(1):
+            resp = self.client.get('/api/me/')
+        self.assertEqual(resp.data['role'], 'student')
+        self.assertEqual(resp.data['student_id'], 'SI1')
+        self.assertEqual(resp.data['organization']['name'], 'Identity University')
+
+    def test_identity_is_loaded_once_and_primes_the_user(self):
+        from django.test import RequestFactory
+        from .identity_utils import get_identity
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(pk=self.student.user_id)
+        with self.assertNumQueries(1):
+            identity = get_identity(request)
+            self.assertIs(get_identity(request), identity)
+            self.assertEqual(identity.organization, self.organization)
+            self.assertEqual(request.user.student, self.student)
+            self.assertFalse(hasattr(request.user, 'lecturer'))
+        self.assertEqual((identity.role, identity.organization_ids), ('student', [self.organization.id]))
+
+    def test_user_without_profile(self):
+        from .identity_utils import load_identity
+        identity = load_identity(User.objects.create(username='identity-admin', is_staff=True))
+        self.assertEqual((identity.role, identity.organization, identity.profile), ('admin', None, None))
+        self.client.force_authenticate(identity.user)
+        self.assertEqual(self.client.get('/api/api/student-attendance-summary/').status_code, 404)
+
+    def test_location_check_in_queues_notification_for_the_student(self):
+        from unittest.mock import patch
+        from .tasks import send_attendance_notification_async
+        self.student.user.email = 'identity@example.com'
+        self.student.user.save()
+        lecturer = Lecturer.objects.create(user=User.objects.create(username='identity-lect'), staff_id='LI1', name='Identity Lecturer')
+        course = Course.objects.create(name='Identity', course_code='ID101', lecturer=lecturer)
+        course.students.add(self.student)
+        AttendanceToken.objects.create(course=course, token='IDT123')
+        Attendance.objects.create(course=course, date=timezone.now().date())
+
+        self.client.force_authenticate(self.student.user)
+        with patch.object(send_attendance_notification_async, 'delay') as delay, \
+                patch('attendance.email_utils.send_attendance_notification') as fallback:
+            resp = self.client.post('/api/api/submit-location/', {
+                'latitude': 1.0, 'longitude': 1.0, 'attendance_token': 'IDT123',
+            }, format='json')
+        self.assertEqual(resp.status_code, 200)
+        delay.assert_called_once_with('Identity Student', 'Identity', 'identity@example.com', self.student.phone_number)
+        fallback.assert_not_called()
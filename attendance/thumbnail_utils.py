@@ -0,0 +1,132 @@
+"""
+Profile picture thumbnails and precomputed media URLs.
+
+When a lecturer or student gets a new profile picture, fixed-size square
+JPEG variants are generated with Pillow (in a Celery task, inline if the
+broker is unavailable) and saved next to the original. The public URLs of the
+original and every variant are stored on the row in `profile_picture_urls`,
+so serializers emit plain strings instead of asking the storage backend
+(S3 in production) for a URL on every row.
+"""
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+from .version_utils import bump_course_list_version, bump_version
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Variant name -> edge length in pixels
+THUMBNAIL_SIZES = {
+    'small': 64,    # Lists and rosters
+    'medium': 256,  # Profile pages
+}
+THUMBNAIL_QUALITY = 85
+
+
+def thumbnail_sizes():
+    return getattr(settings, 'PROFILE_THUMBNAIL_SIZES', THUMBNAIL_SIZES)
+
+
+def thumbnail_name(name, variant):
+    """Storage name of a variant: <dir>/thumbnails/<stem>_<variant>.jpg"""
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'thumbnails', f'{stem}_{variant}.jpg')
+
+
+def render_thumbnail(image, size):
+    """A size x size JPEG of the centre of an image, upright and on white where transparent"""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    output = BytesIO()
+    thumbnail.save(output, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def generate_thumbnails(field_file):
+    """
+    Save every thumbnail variant of an image field's file.
+
+    Returns:
+        dict: Public URLs keyed 'original' and by variant name, plus the
+        'source' file name they were generated from
+    """
+    storage = field_file.storage
+    urls = {'source': field_file.name, 'original': storage.url(field_file.name)}
+    with field_file.open('rb') as f:
+        image = Image.open(f)
+        image.load()
+    for variant, size in thumbnail_sizes().items():
+        name = thumbnail_name(field_file.name, variant)
+        if storage.exists(name):
+            storage.delete(name)
+        name = storage.save(name, ContentFile(render_thumbnail(image, size)))
+        urls[variant] = storage.url(name)
+    return urls
+
+
+def profile_picture_stale(instance):
+    """Whether an instance's stored URLs describe a different picture than the one it has now"""
+    return (instance.profile_picture.name or None) != (instance.profile_picture_urls or {}).get('source')
+
+
+def refresh_profile_picture_urls(instance):
+    """
+    Generate thumbnails for an instance's current picture and store their URLs on the row.
+
+    Returns:
+        dict: The stored URLs, or None if the picture was replaced meanwhile
+        (the save that replaced it schedules its own thumbnails)
+    """
+    if instance.profile_picture:
+        try:
+            urls = generate_thumbnails(instance.profile_picture)
+        except (OSError, Image.DecompressionBombError) as e:
+            # Not a readable image: serve the original only
+            logger.warning(f"Could not generate thumbnails for {instance.profile_picture.name}: {e}")
+            urls = {'source': instance.profile_picture.name, 'original': instance.profile_picture.url}
+    else:
+        urls = {}
+    # .update() so this does not re-trigger save(), and only while the row still has
+    # the picture these URLs were made from, so a slow run cannot overwrite a newer
+    # picture's URLs. It sends no signals, so move the versions conditional GET relies on here
+    current = Q(profile_picture=instance.profile_picture.name or '')
+    if not instance.profile_picture:
+        current |= Q(profile_picture__isnull=True)
+    if not type(instance).objects.filter(current, pk=instance.pk).update(profile_picture_urls=urls):
+        return None
+    instance.profile_picture_urls = urls
+    bump_version('user', instance.user_id)
+    bump_course_list_version()
+    return urls
+
+
+def schedule_profile_thumbnails(instance):
+    """Generate thumbnails once the current transaction commits"""
+    def enqueue():
+        from .tasks import generate_profile_thumbnails
+        label = instance._meta.label_lower
+        try:
+            generate_profile_thumbnails.delay(label, instance.pk)
+        except Exception:
+            generate_profile_thumbnails(label, instance.pk)
+    transaction.on_commit(enqueue)
+
+
+def absolute_media_url(request, url):
+    """Make a stored URL absolute (local MEDIA_URL paths are relative) without touching storage"""
+    if url and request is not None and url.startswith('/'):
+        return request.build_absolute_uri(url)
+    return url
@@ -0,0 +1,202 @@
+"""
+Term transcripts: one attendance PDF per student, rendered across a process pool.
+
+The parent process loads each batch of students with a handful of bulk
+queries and turns it into plain dicts; workers only run ReportLab, which is
+CPU-bound, so throughput scales with the number of cores.
+"""
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.utils import timezone
+from .models import Attendance, CourseEnrollment, Student
+from .report_utils import generate_transcript_pdf, _date_range_label
+import logging
+import multiprocessing
+import os
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+
+def _in_daemon_process():
+    """Whether this is a daemonic process (a Celery prefork child), which may not start a pool"""
+    if multiprocessing.current_process().daemon:
+        return True
+    try:
+        import billiard
+    except ImportError:
+        return False
+    return bool(billiard.current_process().daemon)
+
+
+def transcript_workers(workers=None):
+    """
+    Pool size for a transcript run: `workers`, else TRANSCRIPT_WORKERS (0 means
+    one per core). 1 inside a daemonic worker process.
+    """
+    if workers is None:
+        workers = getattr(settings, 'TRANSCRIPT_WORKERS', None) or os.cpu_count() or 1
+    if workers > 1 and _in_daemon_process():
+        logger.info("Rendering transcripts in-process: daemonic workers cannot start a process pool")
+        return 1
+    return max(workers, 1)
+
+
+def transcript_job_workers():
+    """
+    Pool size for a transcript report job, capped at TRANSCRIPT_MAX_WORKERS
+    because the whole job holds a single report slot.
+
+    Under the Celery prefork pool (the default) every task runs in a daemonic
+    child, so this is always 1 there and the job renders in-process; only
+    solo/threads workers get a pool. Large runs belong in `manage.py
+    generate_transcripts`, which is not capped.
+    """
+    workers = getattr(settings, 'TRANSCRIPT_WORKERS', None) or os.cpu_count() or 1
+    return transcript_workers(min(workers, getattr(settings, 'TRANSCRIPT_MAX_WORKERS', 2)))
+
+
+def transcript_student_ids(course_id=None, student_id=None, organization_id=None, **_):
+    """Primary keys of the students to produce transcripts for, in a stable order"""
+    students = Student.objects.all()
+    if organization_id:
+        students = students.filter(organization_id=organization_id)
+    if course_id:
+        students = students.filter(courseenrollment__course_id=course_id)
+    if student_id:
+        students = students.filter(pk=student_id)
+    return list(students.order_by('pk').values_list('pk', flat=True))
+
+
+def get_transcripts(student_ids, course_id=None, start_date=None, end_date=None, session_dates=None):
+    """
+    Build transcript dicts for a batch of students with four bulk queries.
+
+    Args:
+        session_dates: Optional dict of course id -> sorted closed-session dates,
+            shared between batches so each course's sessions are read once
+    """
+    if session_dates is None:
+        session_dates = {}
+
+    students = Student.objects.filter(pk__in=student_ids).order_by('pk').values_list('pk', 'student_id', 'name')
+    enrollments = CourseEnrollment.objects.filter(student_id__in=student_ids)
+    if course_id:
+        enrollments = enrollments.filter(course_id=course_id)
+    enrollments = list(enrollments.order_by('course__course_code').values_list(
+        'student_id', 'course_id', 'enrolled_at', 'course__course_code', 'course__name'
+    ))
+
+    # Closed sessions of every course not seen in an earlier batch
+    missing = {row[1] for row in enrollments} - set(session_dates)
+    if missing:
+        for course in missing:
+            session_dates[course] = []
+        sessions = Attendance.objects.filter(course_id__in=missing, is_active=False)
+        if start_date:
+            sessions = sessions.filter(date__gte=start_date)
+        if end_date:
+            sessions = sessions.filter(date__lte=end_date)
+        for course, date in sessions.order_by('date').values_list('course_id', 'date'):
+            session_dates[course].append(date)
+
+    presence = Attendance.present_students.through.objects.filter(student_id__in=student_ids)
+    if course_id:
+        presence = presence.filter(attendance__course_id=course_id)
+    if start_date:
+        presence = presence.filter(attendance__date__gte=start_date)
+    if end_date:
+        presence = presence.filter(attendance__date__lte=end_date)
+    attended = Counter(presence.values_list('student_id', 'attendance__course_id'))
+
+    courses_by_student = defaultdict(list)
+    for student, course, enrolled_at, code, name in enrollments:
+        dates = session_dates[course]
+        # Same rule as the enrollment counters: sessions on or after the enrollment date
+        held = len(dates) - bisect_left(dates, timezone.localtime(enrolled_at).date())
+        present = attended[(student, course)]
+        courses_by_student[student].append({
+            'course_code': code,
+            'course_name': name,
+            'held': held,
+            'attended': present,
+            'rate': round(min(present, held) / held * 100, 2) if held else None,
+        })
+
+    period = _date_range_label(start_date, end_date)
+    return [
+        {'student_id': code, 'name': name, 'period': period, 'courses': courses_by_student[pk]}
+        for pk, code, name in students
+    ]
+
+
+def render_transcript_batch(transcripts):
+    """Worker entry point: render a batch of transcripts to (filename, pdf bytes)"""
+    return [(f"{t['student_id']}.pdf", generate_transcript_pdf(t)) for t in transcripts]
+
+
+def generate_transcripts(write, filters=None, organization_id=None, workers=None, batch_size=None, progress=None):
+    """
+    Render a transcript for every matching student and hand each PDF to write(filename, data).
+
+    Batches are rendered on a pool of `workers` processes (see
+    transcript_workers); workers=1 renders in this process. At most two
+    batches per worker are in flight, which bounds memory.
+
+    Returns:
+        int: Number of transcripts written
+    """
+    filters = filters or {}
+    workers = transcript_workers(workers)
+    if batch_size is None:
+        batch_size = getattr(settings, 'TRANSCRIPT_BATCH_SIZE', 200)
+
+    student_ids = transcript_student_ids(organization_id=organization_id, **filters)
+    batches = [student_ids[i:i + batch_size] for i in range(0, len(student_ids), batch_size)]
+    session_dates = {}
+
+    def load(batch):
+        return get_transcripts(
+            batch, filters.get('course_id'), filters.get('start_date'), filters.get('end_date'), session_dates
+        )
+
+    written = 0
+
+    def collect(results):
+        nonlocal written
+        for filename, data in results:
+            write(filename, data)
+        written += len(results)
+        if progress and student_ids:
+            progress(min(int(written * 100 / len(student_ids)), 99))
+
+    if workers <= 1:
+        for batch in batches:
+            collect(render_transcript_batch(load(batch)))
+        return written
+
+    pending = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for batch in batches:
+            if len(pending) >= workers * 2:
+                collect(pending.pop(0).result())
+            pending.append(executor.submit(render_transcript_batch, load(batch)))
+        for future in pending:
+            collect(future.result())
+    return written
+
+
+def build_transcript_archive(output, filters=None, organization_id=None, workers=None, batch_size=None, progress=None):
+    """
+    Write every matching transcript into a zip archive.
+
+    PDFs are stored uncompressed: their page streams are already compressed,
+    and deflating again would make the single writer process the bottleneck.
+
+    Returns:
+        int: Number of transcripts in the archive
+    """
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) as archive:
+        return generate_transcripts(archive.writestr, filters, organization_id, workers, batch_size, progress)
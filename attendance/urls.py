@@ -13,28 +13,35 @@ router.register(r'courses', views.CourseViewSet, basename='course')
 router.register(r'attendances', views.AttendanceViewSet, basename='attendance')
 router.register(r'attendance-tokens', views.AttendanceTokenViewSet, basename='attendance-token')
 router.register(r'feedback', views.FeedbackViewSet, basename='feedback')
+router.register(r'report-jobs', views.ReportJobViewSet, basename='report-job')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('me/', views.MeView.as_view(), name='me'),
+    path('sync/', views.SyncView.as_view(), name='sync'),
     path('register/', registration_views.RegisterView.as_view(), name='register'),
     path('password-requirements/', views.PasswordRequirementsView.as_view(), name='password_requirements'),
     path('request-password-reset/', views.RequestPasswordResetView.as_view(), name='request_password_reset'),
     path('reset-password/', views.ResetPasswordView.as_view(), name='reset_password'),
     path('verify-email/', views.VerifyEmailView.as_view(), name='verify_email'),
     path('attendance-report/', views.AttendanceReportView.as_view(), name='attendance_report'),
+    path('report-jobs/<int:pk>/download/', views.ReportJobDownloadView.as_view(), name='report_job_download'),
     path('admin/analytics/', views.AdminAnalyticsView.as_view(), name='admin_analytics'),
+    path('admin/export/', views.AdminWarehouseExportView.as_view(), name='admin_warehouse_export'),
     path('admin/create-student/', views.AdminCreateStudentView.as_view(), name='admin_create_student'),
     path('admin/create-lecturer/', views.AdminCreateLecturerView.as_view(), name='admin_create_lecturer'),
     path('admin/import-students/', views.AdminBulkImportStudentsView.as_view(), name='admin_import_students'),
     path('admin/import-lecturers/', views.AdminBulkImportLecturersView.as_view(), name='admin_import_lecturers'),
     path('admin/assign-lecturer/', views.AdminAssignLecturerView.as_view(), name='admin_assign_lecturer'),
     path('admin/enroll-student/', views.AdminEnrollStudentView.as_view(), name='admin_enroll_student'),
+    path('admin/enroll-students/', views.AdminBulkEnrollView.as_view(), name='admin_bulk_enroll'),
     path('api/studentenrolledcourses/', views.StudentEnrolledCoursesView.as_view(), name='student_enrolled_courses'),
     path('api/login/student/', views.StudentLoginView.as_view(), name='student_login'),
     path('api/login/staff/', views.StaffLoginView.as_view(), name='staff_login'),
     path('api/logout/', views.LogoutView.as_view(), name='api_logout'),
     path('api/submit-location/', views.SubmitLocationView.as_view(), name='submit_location'),
+    path('api/at-risk-students/', views.AtRiskStudentListView.as_view(), name='at_risk_students'),
+    path('api/student-attendance-summary/', views.StudentAttendanceSummaryView.as_view(), name='student_attendance_summary'),
     path('api/student-attendance-history/', views.StudentAttendanceHistoryView.as_view(), name='student_attendance_history'),
     path('api/lecturer-attendance-history/', views.LecturerAttendanceHistoryView.as_view(), name='lecturer_attendance_history'),
     path('api/lecturer-location/', views.LecturerLocationView.as_view(), name='lecturer_location'),
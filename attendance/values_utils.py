@@ -0,0 +1,60 @@
+"""
+Values-mode read paths for hot read endpoints.
+
+Response rows are built straight from .values() / .values_list() tuples, so no
+model instances or per-row serializers are created. Use these for large or
+frequently polled responses whose shape is fixed (histories, rosters, live
+counts); writable and nested resources stay on their serializers. Compare
+both paths with `manage.py benchmark_read_paths`.
+"""
+from collections import defaultdict
+from .models import Attendance
+from .roster_utils import absent_students, present_students
+
+ROSTER_FIELDS = ('id', 'student_id', 'name')
+
+
+def attendance_history(attendances):
+    """
+    Session dates grouped by course code, most recent first (one query).
+
+    Returns:
+        list: [{'course_code': ..., 'attendances': [{'date': 'YYYY-MM-DD'}, ...]}, ...]
+    """
+    grouped = defaultdict(list)
+    for course_code, date in attendances.order_by('-date').values_list('course__course_code', 'date'):
+        grouped[course_code].append({'date': date.isoformat()})
+    return [{'course_code': course_code, 'attendances': dates} for course_code, dates in grouped.items()]
+
+
+def session_roster_values(attendance):
+    """Present and absent students of a session as dicts (two queries)"""
+    present = list(present_students(attendance).order_by('name', 'id').values(*ROSTER_FIELDS))
+    absent = list(absent_students(attendance).order_by('name', 'id').values(*ROSTER_FIELDS))
+    return {
+        'attendance_id': attendance.pk,
+        'course_id': attendance.course_id,
+        'date': attendance.date,
+        'is_active': attendance.is_active,
+        'present_count': len(present),
+        'enrolled_count': len(present) + len(absent),
+        'present': present,
+        'absent': absent,
+    }
+
+
+def live_attendance_counts(course, date, recent=5):
+    """Check-in count, roster size and the latest check-ins for a course's session on `date`"""
+    attendance = Attendance.objects.filter(course=course, date=date).only('pk').first()
+    if attendance is None:
+        present_count, recent_names = 0, []
+    else:
+        present = present_students(attendance)
+        present_count = present.count()
+        recent_names = list(present.order_by('-id').values_list('name', flat=True)[:recent])
+    return {
+        'present_count': present_count,
+        'total_enrolled': course.students.count(),
+        # Timestamp would need M2M through model with timestamp
+        'recent_attendees': [{'name': name, 'time': 'Just now'} for name in recent_names],
+    }
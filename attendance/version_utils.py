@@ -0,0 +1,68 @@
+"""
+Cheap data version counters kept in the cache.
+
+Versions are nanosecond timestamps that only move forward, so a version also
+tells when its object last changed (used for Last-Modified). A counter that
+is missing (never set, evicted or flushed) is re-seeded from the clock, so
+losing one only ever looks like a change, never like stale data.
+"""
+from django.core.cache import cache
+import time
+
+VERSION_TIMEOUT = None  # Never expire; eviction is handled by re-seeding
+
+
+def _version_key(scope, pk):
+    return f'data_version:{scope}:{pk}'
+
+
+def get_version(scope, pk):
+    """
+    Current version of an object (e.g. scope='course', pk=12)
+    """
+    key = _version_key(scope, pk)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(scopes):
+    """
+    Current versions of several (scope, pk) objects in one cache round trip
+    """
+    keys = [_version_key(scope, pk) for scope, pk in scopes]
+    found = cache.get_many(keys)
+    return [found[key] if key in found else get_version(scope, pk) for key, (scope, pk) in zip(keys, scopes)]
+
+
+def bump_version(scope, pk):
+    """
+    Advance an object's version so anything keyed on the old one is bypassed
+    """
+    key = _version_key(scope, pk)
+    version = time.time_ns()
+    current = cache.get(key)
+    if current is not None and current >= version:
+        version = current + 1
+    cache.set(key, version, VERSION_TIMEOUT)
+    return version
+
+
+def bump_course_version(course_id, organization_id=None):
+    """
+    Record a change to a course's attendance data (check-in, session opened or closed).
+    Organization-wide versions move too, for reports that span courses.
+    """
+    bump_version('course', course_id)
+    bump_version('organization', organization_id or 'none')
+    bump_version('organization', 'all')
+
+
+def bump_course_list_version():
+    """
+    Record a change to what course lists show: a course, its enrollments, or
+    the lecturer, students or organization nested in it
+    """
+    bump_version('courses', 'all')
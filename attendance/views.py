@@ -1,40 +1,37 @@
 from django.shortcuts import get_object_or_404
-from rest_framework import viewsets, generics, status
+from rest_framework import viewsets, generics, mixins, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from django.contrib.auth import authenticate, logout
+from django.db import transaction
+from django.db.models import Prefetch
 from django.utils import timezone
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from rest_framework.views import APIView
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.exceptions import PermissionDenied, Throttled, ValidationError
 import csv
-from openpyxl import Workbook
 from django.utils.dateparse import parse_date
-from collections import defaultdict
 import io
 import base64
 import random
 import string
 import qrcode
 import threading
+import tempfile
 try:
     import requests
 except Exception:
     requests = None
 from .throttles import AttendanceTokenBurstThrottle
-from .analytics_utils import (
-    get_attendance_statistics,
-    get_top_courses,
-    get_attendance_trends,
-    get_student_participation,
-    get_lecturer_activity,
-    get_system_overview
-)
+from .analytics_utils import ANALYTICS_SECTIONS, get_analytics_section, get_latest_snapshot, window_for_days
+from .identity_utils import get_identity, lecturer_or_404, student_or_404
 
 from django.conf import settings
-from .models import Lecturer, Student, Course, CourseEnrollment, Attendance, AttendanceToken, Feedback
+from .models import Organization, Lecturer, Student, Course, CourseEnrollment, Attendance, AttendanceToken, Feedback, AtRiskStudent, ReportJob
 from .serializers import (
     LecturerSerializer,
     StudentSerializer,
@@ -44,52 +41,91 @@ from .serializers import (
     LogoutSerializer,
     SubmitLocationSerializer,
     FeedbackSerializer,
+    AtRiskStudentSerializer,
+    ReportJobSerializer,
+    parse_field_list,
 )
+from .pagination import AtRiskStudentPagination
 from rest_framework.permissions import AllowAny, IsAdminUser
 from .validators import get_password_requirements
 from .models import EmailVerificationToken, PasswordResetToken
 from .email_utils import send_verification_email, send_password_reset_email, send_attendance_notification
-from .report_utils import generate_attendance_pdf, generate_attendance_excel
+from .report_limits import acquire_report_slot, release_after, release_report_slot, report_priority
+from .report_utils import (
+    SESSION_ROSTER_HEADERS,
+    get_cached_report_artifact,
+    generate_session_roster_pdf,
+    get_or_build_report_artifact,
+    write_excel_report,
+    iter_attendance_report_rows,
+    stream_attendance_csv,
+    stream_attendance_ndjson,
+    REPORT_ARTIFACT_TYPES,
+    REPORT_FILTER_KEYS,
+    check_report_download_token,
+)
+from .enrollment_utils import (
+    ROSTER_MODES,
+    ROSTER_REPLACE,
+    apply_course_roster,
+    close_session,
+    diff_course_roster,
+    mark_student_present,
+)
+from .export_utils import EXPORT_FORMATS, EXPORT_TABLES, PYARROW_AVAILABLE, write_export
+from .roster_utils import enrolled_count, is_student_enrolled, is_student_present, session_roster_rows
+from .etag_utils import conditional_on_versions
+from .middleware import exempt_from_compression
+from .values_utils import attendance_history, live_attendance_counts, session_roster_values
+from .sync_utils import sync_changes
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError as DjangoValidationError
 from django.http import HttpResponse
 from datetime import datetime
 
+
+# Version counters behind conditional GET (see etag_utils)
+def user_versions(view, request, *args, **kwargs):
+    return [('user', request.user.pk)]
+
+
+def course_list_versions(view, request, *args, **kwargs):
+    return [('user', request.user.pk), ('courses', 'all')]
+
+
+def lecturer_course_versions(view, request, *args, **kwargs):
+    lecturer = get_identity(request).lecturer
+    course_ids = Course.objects.filter(lecturer=lecturer).order_by('pk').values_list('pk', flat=True) if lecturer else []
+    return [('user', request.user.pk)] + [('course', course_id) for course_id in course_ids]
+
+
 # Current user profile info
 class MeView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_on_versions(user_versions)
     def get(self, request, *args, **kwargs):
-        user = request.user
-        role = 'admin' if user.is_staff or user.is_superuser else 'user'
+        identity = get_identity(request)
+        user = identity.user
         data = {
             'id': user.id,
             'username': user.username,
             'email': user.email,
             'first_name': user.first_name,
             'last_name': user.last_name,
-            'role': role,
-            'student_id': None,
-            'lecturer_id': None,
+            'role': identity.role,
+            'student_id': identity.student.student_id if identity.is_student else None,
+            'lecturer_id': identity.lecturer.staff_id if identity.is_lecturer else None,
             'organization': None
         }
-        
-        if hasattr(user, 'student'):
-            data['role'] = 'student'
-            data['student_id'] = user.student.student_id
-            data['phone_number'] = user.student.phone_number
-            if user.student.organization:
-                data['organization'] = {'id': user.student.organization.id, 'name': user.student.organization.name}
+
+        if identity.profile is not None:
+            data['phone_number'] = identity.profile.phone_number
             # Mock preferences for now or pull from model if added
-            data['notification_preferences'] = {} 
-
-        if hasattr(user, 'lecturer'):
-            data['role'] = 'lecturer'
-            data['lecturer_id'] = user.lecturer.staff_id
-            data['phone_number'] = user.lecturer.phone_number
-            if user.lecturer.organization:
-                data['organization'] = {'id': user.lecturer.organization.id, 'name': user.lecturer.organization.name}
             data['notification_preferences'] = {}
+        organization = identity.organization
+        if organization:
+            data['organization'] = {'id': organization.id, 'name': organization.name}
 
         return Response(data)
 
@@ -104,14 +140,15 @@ class MeView(APIView):
         user.save()
 
         # Update Role fields
-        if hasattr(user, 'student'):
-            student = user.student
+        identity = get_identity(request)
+        if identity.is_student:
+            student = identity.student
             if 'phone_number' in data:
                 student.phone_number = data['phone_number']
             student.save()
         
-        elif hasattr(user, 'lecturer'):
-            lecturer = user.lecturer
+        elif identity.is_lecturer:
+            lecturer = identity.lecturer
             if 'phone_number' in data:
                 lecturer.phone_number = data['phone_number']
             lecturer.save()
@@ -130,18 +167,12 @@ class OrganizationViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         from .models import Organization
         # Get organizations the user has access to
-        user = self.request.user
-        if user.is_staff or user.is_superuser:
+        identity = get_identity(self.request)
+        if identity.is_admin:
             return Organization.objects.filter(is_active=True)
         
         # For students and lecturers, return their organization
-        org_ids = []
-        if hasattr(user, 'student') and user.student.organization:
-            org_ids.append(user.student.organization.id)
-        if hasattr(user, 'lecturer') and user.lecturer.organization:
-            org_ids.append(user.lecturer.organization.id)
-        
-        return Organization.objects.filter(id__in=org_ids, is_active=True)
+        return Organization.objects.filter(id__in=identity.organization_ids, is_active=True)
 
     def get_serializer_class(self):
         from .serializers import OrganizationSerializer
@@ -157,36 +188,63 @@ class PasswordRequirementsView(APIView):
 
 # Lecturer ViewSet
 class LecturerViewSet(viewsets.ModelViewSet):
-    queryset = Lecturer.objects.all()
+    # Matches LecturerSerializer: nested user and organization, course ids
+    queryset = Lecturer.objects.select_related('user', 'organization').prefetch_related('courses')
     serializer_class = LecturerSerializer
     permission_classes = [IsAuthenticated]
 
     @action(detail=False, methods=['get'], url_path='my-courses')
+    @conditional_on_versions(course_list_versions)
     def my_courses(self, request):
-        lecturer = get_object_or_404(Lecturer, user=request.user)
-        courses = Course.objects.filter(lecturer=lecturer)
-        serializer = CourseSerializer(courses, many=True)
+        lecturer = lecturer_or_404(request)
+        courses = course_list_queryset(Course.objects.filter(lecturer=lecturer), request)
+        serializer = CourseSerializer(courses, many=True, context={'request': request})
         return Response(serializer.data)
 
 # Student ViewSet
 class StudentViewSet(viewsets.ModelViewSet):
-    queryset = Student.objects.all()
+    # Matches StudentSerializer: nested user and organization, course ids
+    queryset = Student.objects.select_related('user', 'organization').prefetch_related('courses')
     serializer_class = StudentSerializer
     permission_classes = [IsAuthenticated]
 
+def course_list_queryset(queryset, request=None):
+    """
+    Load what CourseSerializer will render in a fixed number of queries:
+    the roster count is annotated and nested objects are only fetched
+    when the client asks for them with ?expand=
+    """
+    expand = parse_field_list(request, 'expand')
+    queryset = queryset.select_related('lecturer').annotate(student_count=enrolled_count())
+    if 'students' in expand:
+        queryset = queryset.prefetch_related('students')
+    if 'lecturer' in expand:
+        queryset = queryset.select_related('lecturer__user', 'lecturer__organization').prefetch_related('lecturer__courses')
+    if 'organization' in expand:
+        queryset = queryset.select_related('organization')
+    return queryset
+
+
 # Course ViewSet
 class CourseViewSet(viewsets.ModelViewSet):
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        return course_list_queryset(super().get_queryset(), self.request)
+
+    @conditional_on_versions(course_list_versions)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def perform_create(self, serializer):
-        user = self.request.user
-        if hasattr(user, 'lecturer'):
-            serializer.save(lecturer=user.lecturer, organization=user.lecturer.organization)
-        elif hasattr(user, 'student'):
+        identity = get_identity(self.request)
+        if identity.is_lecturer:
+            serializer.save(lecturer=identity.lecturer, organization=identity.lecturer.organization)
+        elif identity.is_student:
              # Students shouldn't create courses, but just in case
-             serializer.save(organization=user.student.organization)
+             serializer.save(organization=identity.student.organization)
         else:
             serializer.save()
 
@@ -221,34 +279,18 @@ class CourseViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(detail=True, methods=['get'])
+    @conditional_on_versions(
+        lambda view, request, pk=None: [('course', pk)],
+        extra=lambda view, request, pk=None: timezone.now().date(),  # Today's session
+    )
     def live_attendance(self, request, pk=None):
         """
         Get real-time statistics for the current day's attendance session.
         Useful for polling during the QR code display.
         """
         course = self.get_object()
-        today = timezone.now().date()
-        
-        try:
-            attendance = Attendance.objects.get(course=course, date=today)
-            present_students = attendance.present_students.all()
-            present_count = present_students.count()
-            # Return last 5 attendees for visual feedback
-            recent_attendees = [{
-                'name': s.name,
-                'time': 'Just now' # Timestamp would need M2M through model with timestamp
-            } for s in present_students.order_by('-id')[:5]]
-        except Attendance.DoesNotExist:
-            present_count = 0
-            recent_attendees = []
-
-        total_enrolled = course.students.count()
-        
-        return Response({
-            'present_count': present_count,
-            'total_enrolled': total_enrolled,
-            'recent_attendees': recent_attendees
-        })
+        # Return last 5 attendees for visual feedback
+        return Response(live_attendance_counts(course, timezone.now().date(), recent=5))
 
     @action(detail=False, methods=['post'])
     def batch_upload(self, request):
@@ -326,7 +368,8 @@ class CourseViewSet(viewsets.ModelViewSet):
         course = self.get_object()
 
         # Permission check: only lecturer assigned to the course
-        if not hasattr(request.user, 'lecturer') or request.user.lecturer != course.lecturer:
+        lecturer = get_identity(request).lecturer
+        if lecturer is None or lecturer.pk != course.lecturer_id:
             return Response({'error': 'Permission denied. Only the course lecturer may generate QR tokens.'}, status=status.HTTP_403_FORBIDDEN)
 
         token_value = request.data.get('token')
@@ -397,9 +440,8 @@ class CourseViewSet(viewsets.ModelViewSet):
         except Course.DoesNotExist:
             return Response({'error': 'Course not found.'}, status=status.HTTP_404_NOT_FOUND)
             
-        try:
-            student = Student.objects.get(user=request.user)
-        except Student.DoesNotExist:
+        student = get_identity(request).student
+        if student is None:
             return Response({'error': 'Student profile not found.'}, status=status.HTTP_404_NOT_FOUND)
         
         # Use get_or_create for M2M with through model
@@ -426,7 +468,7 @@ class CourseViewSet(viewsets.ModelViewSet):
                 return Response({'error': 'Token has expired.'}, status=status.HTTP_400_BAD_REQUEST)
 
             course = attendance_token.course
-            student = get_object_or_404(Student, user=request.user)
+            student = student_or_404(request)
 
             if student not in course.students.all():
                 return Response({'error': 'Student is not enrolled in this course.'}, status=status.HTTP_400_BAD_REQUEST)
@@ -435,7 +477,7 @@ class CourseViewSet(viewsets.ModelViewSet):
                 course=course,
                 date=timezone.now().date()
             )
-            attendance.present_students.add(student)
+            mark_student_present(attendance, student)
             attendance.save()
             
             # Send notification to student
@@ -452,10 +494,25 @@ class CourseViewSet(viewsets.ModelViewSet):
         
 # Attendance ViewSet
 class AttendanceViewSet(viewsets.ModelViewSet):
-    queryset = Attendance.objects.all()
+    # Matches AttendanceSerializer: compact course, present students with user, organization and course ids
+    queryset = Attendance.objects.prefetch_related(
+        Prefetch('course', queryset=course_list_queryset(Course.objects.all())),
+        Prefetch('present_students', queryset=StudentViewSet.queryset),
+    )
     serializer_class = AttendanceSerializer
     permission_classes = [IsAuthenticated]
 
+    def perform_update(self, serializer):
+        # Closing goes through close_session so enrollment counters and at-risk entries follow
+        data = serializer.validated_data
+        closing = serializer.instance.is_active and (data.get('is_active') is False or data.get('ended_at') is not None)
+        if closing:
+            data.pop('is_active', None)
+            ended_at = data.pop('ended_at', None)
+        attendance = serializer.save()
+        if closing:
+            close_session(attendance, ended_at)
+
     @action(detail=False, methods=['get'])
     def generate_excel(self, request):
         attendance_id = request.query_params.get('attendance_id')
@@ -465,35 +522,42 @@ class AttendanceViewSet(viewsets.ModelViewSet):
 
         attendance = get_object_or_404(Attendance, id=attendance_id)
 
-        # Create an Excel workbook and add a worksheet
-        workbook = Workbook()
-        worksheet = workbook.active
-        worksheet.title = "Attendance Report"
-
-        # Add header row
-        worksheet.append(['Student ID', 'Student Name', 'Date of Attendance', 'Status'])
-
-        # Collect present students
-        present_students = [(student.student_id, student.name) for student in attendance.present_students.all()]
-
-        # Collect missed students
-        course_students = list(attendance.course.students.all())
-        missed_students = [(student.student_id, student.name) for student in course_students if student not in attendance.present_students.all()]
-
-        # Write present students
-        for student_id, student_name in sorted(present_students):
-            worksheet.append([student_id, student_name, attendance.date, 'Present'])
+        slots = acquire_report_slot(attendance.organization_id, getattr(settings, 'REPORT_SLOT_WAIT', 1))
+        if slots is None:
+            raise Throttled(wait=getattr(settings, 'REPORT_RETRY_AFTER', 5))
+        try:
+            # Present students first, then absent students
+            output = write_excel_report(SESSION_ROSTER_HEADERS, session_roster_rows(attendance))
+        finally:
+            release_report_slot(slots)
+        return FileResponse(
+            output,
+            as_attachment=True,
+            filename=f"attendance_{attendance_id}.xlsx",
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
 
-        # Write absent students
-        for student_id, student_name in sorted(missed_students):
-            worksheet.append([student_id, student_name, attendance.date, 'Absent'])
+    @action(detail=False, methods=['get'])
+    def generate_pdf(self, request):
+        attendance_id = request.query_params.get('attendance_id')
 
-        # Create an HTTP response with the Excel file
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = f'attachment; filename="attendance_{attendance_id}.xlsx"'
+        if not attendance_id:
+            return Response({'error': 'attendance_id parameter is required.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        workbook.save(response)
-        return response
+        attendance = get_object_or_404(Attendance.objects.select_related('course'), id=attendance_id)
+        slots = acquire_report_slot(attendance.organization_id, getattr(settings, 'REPORT_SLOT_WAIT', 1))
+        if slots is None:
+            raise Throttled(wait=getattr(settings, 'REPORT_RETRY_AFTER', 5))
+        try:
+            buffer = generate_session_roster_pdf(attendance, session_roster_rows(attendance))
+        finally:
+            release_report_slot(slots)
+        return FileResponse(
+            buffer,
+            as_attachment=True,
+            filename=f"attendance_{attendance_id}.pdf",
+            content_type='application/pdf'
+        )
 
     @action(detail=False, methods=['post'], url_path='end_attendance')
     def end_attendance(self, request):
@@ -507,22 +571,33 @@ class AttendanceViewSet(viewsets.ModelViewSet):
         except Attendance.DoesNotExist:
             return Response({'error': 'No active attendance found for the course.'}, status=status.HTTP_404_NOT_FOUND)
 
-        attendance.is_active = False
-        attendance.ended_at = timezone.now()
-        attendance.save()
+        close_session(attendance)
         return Response({'status': 'Attendance session ended successfully'}, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'])
+    def roster(self, request, pk=None):
+        """Present and absent students of a session, without the nested serializers of retrieve"""
+        attendance = get_object_or_404(Attendance.objects.only('id', 'course_id', 'date', 'is_active'), pk=pk)
+        return Response(session_roster_values(attendance))
     
 
 # AttendanceToken ViewSet
 class AttendanceTokenViewSet(viewsets.ModelViewSet):
-    queryset = AttendanceToken.objects.all()
+    # Matches AttendanceTokenSerializer: compact course
+    queryset = AttendanceToken.objects.prefetch_related(
+        Prefetch('course', queryset=course_list_queryset(Course.objects.all()))
+    )
     serializer_class = AttendanceTokenSerializer
     permission_classes = [IsAuthenticated]
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Attendance token values are secrets
+        return exempt_from_compression(super().finalize_response(request, response, *args, **kwargs))
+
 
 class FeedbackViewSet(viewsets.ModelViewSet):
     """Create feedback (anyone) and list recent feedback (admin only)."""
-    queryset = Feedback.objects.all()
+    queryset = Feedback.objects.select_related('user')
     serializer_class = FeedbackSerializer
     throttle_classes = []  # set per-action
 
@@ -601,9 +676,12 @@ class StudentEnrolledCoursesView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        user = self.request.user
-        student = get_object_or_404(Student, user=user)
-        return Course.objects.filter(students=student)
+        student = student_or_404(self.request)
+        return course_list_queryset(Course.objects.filter(students=student), self.request)
+
+    @conditional_on_versions(course_list_versions)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
 # Custom Login Views
 class StudentLoginView(ObtainAuthToken):
@@ -709,22 +787,20 @@ class SubmitLocationView(generics.GenericAPIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         # Verify user is a student
-        user = request.user
-        if not hasattr(user, 'student'):
+        student = get_identity(request).student
+        if student is None:
             return Response({
                 'error': 'Only students can mark attendance'
             }, status=status.HTTP_403_FORBIDDEN)
 
-        student = user.student
-
         # Verify student is enrolled in course
-        if student not in token.course.students.all():
+        if not is_student_enrolled(token.course, student):
             return Response({
                 'error': 'Student not enrolled in this course'
             }, status=status.HTTP_403_FORBIDDEN)
 
         # Check if already marked present
-        if student in attendance.present_students.all():
+        if is_student_present(attendance, student):
             return Response({
                 'message': 'Attendance already marked',
                 'status': 'already_present'
@@ -739,7 +815,7 @@ class SubmitLocationView(generics.GenericAPIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         # Mark attendance
-        attendance.present_students.add(student)
+        mark_student_present(attendance, student)
         attendance.save()
 
         # Get location info for response
@@ -751,13 +827,13 @@ class SubmitLocationView(generics.GenericAPIView):
             send_attendance_notification_async.delay(
                 student.name,
                 token.course.name,
-                user.email,
+                request.user.email,
                 student.phone_number
             )
         except Exception:
             # Fallback to synchronous notification
             from .email_utils import send_attendance_notification
-            send_attendance_notification(student, token.course)
+            send_attendance_notification(student, token.course, token.course.lecturer)
 
         return Response({
             'status': 'success',
@@ -765,6 +841,56 @@ class SubmitLocationView(generics.GenericAPIView):
             'location_info': location_info
         }, status=status.HTTP_200_OK)
 
+# At-Risk Students View
+class AtRiskStudentListView(generics.ListAPIView):
+    """Page through students below the attendance threshold, lowest rate first."""
+    serializer_class = AtRiskStudentSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = AtRiskStudentPagination
+
+    def get_queryset(self):
+        for key in ('course_id', 'organization'):
+            value = self.request.query_params.get(key)
+            if value and not value.isdigit():
+                raise ValidationError({key: 'Must be an integer.'})
+        identity = get_identity(self.request)
+        queryset = AtRiskStudent.objects.select_related('student', 'course')
+
+        if identity.is_lecturer:
+            queryset = queryset.filter(course__lecturer=identity.lecturer)
+        elif identity.is_admin:
+            organization = identity.organization
+            org_id = organization.id if organization else self.request.query_params.get('organization')
+            if org_id:
+                queryset = queryset.filter(organization_id=org_id)
+        else:
+            return AtRiskStudent.objects.none()
+
+        course_id = self.request.query_params.get('course_id')
+        if course_id:
+            queryset = queryset.filter(course_id=course_id)
+        return queryset.order_by('attendance_rate', 'id')
+
+# Student Attendance Summary View
+class StudentAttendanceSummaryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        student = student_or_404(request)
+
+        # Percentages come straight from the maintained enrollment counters
+        enrollments = CourseEnrollment.objects.filter(student=student).select_related('course').order_by('course__course_code')
+        response_data = [{
+            'course_id': enrollment.course_id,
+            'course_code': enrollment.course.course_code,
+            'course_name': enrollment.course.name,
+            'sessions_held': enrollment.sessions_held,
+            'sessions_attended': enrollment.sessions_attended,
+            'attendance_percentage': enrollment.attendance_percentage,
+        } for enrollment in enrollments]
+
+        return Response(response_data)
+
 # Student Attendance History View
 from rest_framework.response import Response
 
@@ -772,56 +898,55 @@ class StudentAttendanceHistoryView(generics.GenericAPIView):
     serializer_class = AttendanceSerializer
     permission_classes = [IsAuthenticated]
 
+    @conditional_on_versions(course_list_versions)
     def get(self, request, *args, **kwargs):
-        # Fetch the current user and the corresponding student object
-        user = self.request.user
-        student = get_object_or_404(Student, user=user)
+        # The current user's student profile
+        student = student_or_404(request)
 
         # Retrieve attendance records where the student was present
-        attendance_records = Attendance.objects.filter(
-            present_students=student
-        ).order_by('-date')
-
-        # Categorize records by course code and order by date descending within each course
-        categorized_records = defaultdict(list)
-        for attendance in attendance_records:
-            course_code = attendance.course.course_code
-            categorized_records[course_code].append({
-                'date': attendance.date.strftime('%Y-%m-%d'),
-            })
+        attendance_records = Attendance.objects.filter(present_students=student)
 
-        # Prepare the response data
-        response_data = [{'course_code': course, 'attendances': records} for course, records in categorized_records.items()]
-
-        return Response(response_data)
+        # Dates grouped by course code, most recent first, straight from .values_list()
+        return Response(attendance_history(attendance_records))
     
 #Lecturer Attendance History View
 class LecturerAttendanceHistoryView(generics.GenericAPIView):
     serializer_class = AttendanceSerializer
     permission_classes = [IsAuthenticated]
 
+    @conditional_on_versions(lecturer_course_versions)
     def get(self, request, *args, **kwargs):
-        # Fetch the current user and the corresponding lecturer object
-        user = self.request.user
-        lecturer = get_object_or_404(Lecturer, user=user)
+        # The current user's lecturer profile
+        lecturer = lecturer_or_404(request)
 
         # Retrieve attendance records for courses taught by the lecturer
-        attendance_records = Attendance.objects.filter(
-            course__lecturer=lecturer
-        ).order_by('-date')
+        attendance_records = Attendance.objects.filter(course__lecturer=lecturer)
+
+        # Dates grouped by course code, most recent first, straight from .values_list()
+        return Response(attendance_history(attendance_records))
 
-        # Categorize records by course code and order by date descending within each course
-        categorized_records = defaultdict(list)
-        for attendance in attendance_records:
-            course_code = attendance.course.course_code
-            categorized_records[course_code].append({
-                'date': attendance.date.strftime('%Y-%m-%d'),
-            })
+# Delta Sync View
+class SyncView(APIView):
+    """
+    Rows a student or lecturer can see that changed since ?cursor=<n>
+    (omit it for a full snapshot). Clients store the returned cursor and keep
+    requesting while has_more is true. Admins use the list endpoints.
+    """
+    permission_classes = [IsAuthenticated]
 
-        # Prepare the response data
-        response_data = [{'course_code': course, 'attendances': records} for course, records in categorized_records.items()]
+    def get(self, request, *args, **kwargs):
+        try:
+            cursor = int(request.query_params.get('cursor') or 0)
+        except ValueError:
+            return Response({'error': 'cursor must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if cursor < 0:
+            return Response({'error': 'cursor must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = sync_changes(get_identity(request), cursor)
+        if data is None:
+            return Response({'error': 'Only students and lecturers can sync'}, status=status.HTTP_403_FORBIDDEN)
+        return Response(data)
 
-        return Response(response_data)
 # Lecturer Location View
 class LecturerLocationView(APIView):
     permission_classes = [IsAuthenticated]
@@ -1145,6 +1270,62 @@ class AdminEnrollStudentView(APIView):
         return Response({'status': 'student_enrolled', 'course_id': course.id, 'student_id': student.id})
 
 
+class AdminBulkEnrollView(APIView):
+    """
+    Apply a whole roster to a course in a fixed number of queries.
+
+    Takes course_id and either student_ids (a list of student ID numbers) or
+    a CSV file with a student_id column. mode=replace (default) makes the
+    roster exactly that list, add only enrolls and remove only unenrolls;
+    dry_run=true reports the diff without applying it.
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        course_id = request.data.get('course_id')
+        mode = request.data.get('mode', ROSTER_REPLACE)
+        if not course_id:
+            return Response({'error': 'course_id is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        if mode not in ROSTER_MODES:
+            return Response({'error': f'mode must be one of: {", ".join(ROSTER_MODES)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        upload = request.FILES.get('file')
+        if upload:
+            try:
+                reader = csv.DictReader(io.StringIO(upload.read().decode('utf-8-sig')))
+            except UnicodeDecodeError:
+                return Response({'error': 'File must be UTF-8 encoded.'}, status=status.HTTP_400_BAD_REQUEST)
+            if not reader.fieldnames or 'student_id' not in reader.fieldnames:
+                return Response({'error': 'CSV must have a student_id column.'}, status=status.HTTP_400_BAD_REQUEST)
+            codes = [row['student_id'] for row in reader]
+        else:
+            # A JSON list, or repeated form fields
+            codes = request.data.getlist('student_ids') if hasattr(request.data, 'getlist') else request.data.get('student_ids')
+            if not isinstance(codes, list):
+                return Response({'error': 'student_ids (a list) or a CSV file is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        codes = {str(code).strip() for code in codes if str(code).strip()}
+        if not codes:
+            return Response({'error': 'No student IDs given.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        course = get_object_or_404(Course, id=course_id)
+        students = Student.objects.filter(student_id__in=codes)
+        if course.organization_id:
+            students = students.filter(organization_id=course.organization_id)
+        found = dict(students.values_list('student_id', 'pk'))
+        not_found = sorted(codes - set(found))
+        if not_found:
+            # Nothing is applied, so a typo cannot unenroll a student under replace
+            return Response({'error': 'Unknown student IDs.', 'not_found': not_found}, status=status.HTTP_400_BAD_REQUEST)
+
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+        if dry_run:
+            to_add, to_remove = diff_course_roster(course, found.values(), mode)
+            result = {'added': len(to_add), 'removed': len(to_remove)}
+        else:
+            result = apply_course_roster(course, found.values(), mode)
+        return Response({'course_id': course.id, 'mode': mode, 'dry_run': dry_run, **result})
+
+
 class RequestPasswordResetView(APIView):
     permission_classes = [AllowAny]
     
@@ -1224,67 +1405,239 @@ class VerifyEmailView(APIView):
             return Response({'error': 'Invalid token'}, status=status.HTTP_400_BAD_REQUEST)
 
 
+def report_scope(request, format_type, filters):
+    """
+    Limit a report to what the caller may see. Staff get their organization
+    (superusers without one get every organization), lecturers their own
+    courses; transcripts are staff-only and students cannot run reports.
+
+    Returns:
+        tuple: (filters with the caller's limits applied, organization id or None)
+    """
+    identity = get_identity(request)
+    filters = {key: filters.get(key) for key in REPORT_FILTER_KEYS if filters.get(key)}
+    for key in ('course_id', 'student_id', 'lecturer_id'):
+        if key in filters and not str(filters[key]).isdigit():
+            raise ValidationError({key: 'Must be an integer.'})
+
+    organization = identity.organization
+    if identity.is_admin:
+        if organization is None and not identity.user.is_superuser:
+            raise PermissionDenied('Your account is not linked to an organization.')
+        return filters, organization.id if organization else None
+
+    if format_type == 'transcript':
+        raise PermissionDenied('Only staff can generate transcripts.')
+    if not identity.is_lecturer:
+        raise PermissionDenied('Only staff and lecturers can generate reports.')
+    lecturer = identity.lecturer
+    if 'course_id' in filters and not Course.objects.filter(pk=filters['course_id'], lecturer=lecturer).exists():
+        raise PermissionDenied('You can only report on your own courses.')
+    filters['lecturer_id'] = lecturer.pk
+    return filters, lecturer.organization_id
+
+
+REPORT_QUEUE_UNAVAILABLE = 'The report queue is unavailable. Please try again shortly.'
+
+
+def enqueue_report_job(job):
+    """
+    Hand a report job to Celery. Reports are never rendered inside a web
+    request: if the broker is unavailable the job is marked failed with a
+    retryable error instead.
+
+    Returns:
+        bool: True if the job was queued
+    """
+    from .tasks import generate_report_job
+    try:
+        generate_report_job.apply_async((job.id,), priority=report_priority(job.format, job.filters))
+        return True
+    except Exception as e:
+        print(f"Failed to queue report job {job.pk}: {e}")
+        job.status = ReportJob.STATUS_FAILED
+        job.error = REPORT_QUEUE_UNAVAILABLE
+        job.completed_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'completed_at'])
+        return False
+
+
+def queue_report_job(job, request, success_status):
+    """
+    Enqueue a saved job once its row commits and describe it. If the broker
+    refused it the response is a 503 with Retry-After.
+    """
+    queued = []
+    transaction.on_commit(lambda: queued.append(enqueue_report_job(job)))
+    data = ReportJobSerializer(job, context={'request': request}).data
+    if queued == [False]:
+        retry_after = getattr(settings, 'REPORT_RETRY_AFTER', 5)
+        return Response(data, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(retry_after)})
+    return Response(data, status=success_status)
+
+
+class ReportJobViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Queue background report jobs and poll their status and download link."""
+    serializer_class = ReportJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        # Same scope as report_scope: staff see their organization's jobs, and
+        # only superusers without an organization see every job
+        identity = get_identity(self.request)
+        if identity.is_admin:
+            organization = identity.organization
+            if organization is not None:
+                return ReportJob.objects.filter(organization_id=organization.id)
+            if identity.user.is_superuser:
+                return ReportJob.objects.all()
+        return ReportJob.objects.filter(requested_by=identity.user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        filters, organization_id = report_scope(
+            request, serializer.validated_data['format'], serializer.validated_data.get('filters') or {}
+        )
+        job = serializer.save(requested_by=request.user, filters=filters, organization_id=organization_id)
+        return queue_report_job(job, request, status.HTTP_201_CREATED)
+
+
+class ReportJobDownloadView(APIView):
+    """Serve a finished report artifact; the signed token in the URL is the credential."""
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request, pk):
+        if not check_report_download_token(pk, request.query_params.get('token', '')):
+            return Response({'error': 'Download link is invalid or has expired.'}, status=status.HTTP_403_FORBIDDEN)
+
+        job = get_object_or_404(ReportJob, pk=pk)
+        if not job.is_downloadable():
+            return Response({'error': 'Report is not available for download.'}, status=status.HTTP_410_GONE)
+
+        extension, content_type = REPORT_ARTIFACT_TYPES[job.format]
+        return FileResponse(
+            job.artifact.open('rb'),
+            as_attachment=True,
+            filename=f"attendance_report_{job.pk}.{extension}",
+            content_type=content_type
+        )
+
+
+class ReportFormatNegotiation(DefaultContentNegotiation):
+    """Leave ?format= to the view (pdf, excel, csv...) instead of DRF renderer selection."""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
+
+
 class AttendanceReportView(APIView):
     permission_classes = [IsAuthenticated]
+    content_negotiation_class = ReportFormatNegotiation
     
     def get(self, request):
         # Get query parameters
-        format_type = request.query_params.get('format', 'pdf')  # pdf or excel
-        course_id = request.query_params.get('course_id')
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-        student_id = request.query_params.get('student_id')
-        
-        # Base queryset
-        attendances = Attendance.objects.all().select_related('student', 'course', 'course__lecturer')
-        
-        # Apply filters
-        if course_id:
-            attendances = attendances.filter(course_id=course_id)
-        if student_id:
-            attendances = attendances.filter(student_id=student_id)
-        if start_date:
-            attendances = attendances.filter(date__gte=start_date)
-        if end_date:
-            attendances = attendances.filter(date__lte=end_date)
-        
-        # Order by date
-        attendances = attendances.order_by('-date')
-        
-        # Get course if specified
-        course = None
-        if course_id:
-            try:
-                course = Course.objects.get(id=course_id)
-            except Course.DoesNotExist:
-                pass
-        
-        # Generate date range string
-        date_range = None
-        if start_date and end_date:
-            date_range = f"{start_date} to {end_date}"
-        elif start_date:
-            date_range = f"From {start_date}"
-        elif end_date:
-            date_range = f"Until {end_date}"
-        
-        # Generate report based on format
-        if format_type == 'excel':
-            buffer = generate_attendance_excel(attendances, course, date_range)
-            filename = f"attendance_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            response = HttpResponse(
-                buffer.getvalue(),
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
-        else:  # Default to PDF
-            buffer = generate_attendance_pdf(attendances, course, date_range)
-            filename = f"attendance_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
+        format_type = request.query_params.get('format', 'pdf')  # pdf, excel, csv or ndjson
+        filters, organization_id = report_scope(
+            request, format_type, {key: request.query_params.get(key) for key in REPORT_FILTER_KEYS}
+        )
+
+        # Large reports can be rendered by a worker instead of this request
+        if request.query_params.get('async') == '1' and format_type in REPORT_ARTIFACT_TYPES:
+            return self.queue_job(request, format_type, filters, organization_id)
+
+        report_format = format_type if format_type in ('csv', 'ndjson', 'excel') else 'pdf'
+
+        # PDF and Excel reports are served from the content-addressed cache when possible
+        cached = None
+        if report_format in ('pdf', 'excel'):
+            cached = get_cached_report_artifact(report_format, filters, organization_id)
+
+        slots = None
+        if cached is None:
+            # Rendering is CPU-bound; when this node or organization is at capacity
+            # the report is queued instead so check-ins keep their workers
+            slots = acquire_report_slot(organization_id, getattr(settings, 'REPORT_SLOT_WAIT', 1))
+            if slots is None:
+                return self.queue_job(request, report_format, filters, organization_id)
+
+        # Flat formats stream one row per check-in without buffering the report
+        if report_format in ('csv', 'ndjson'):
+            rows = iter_attendance_report_rows(organization_id=organization_id, **filters)
+            if report_format == 'csv':
+                body, content_type = stream_attendance_csv(rows), 'text/csv'
+            else:
+                body, content_type = stream_attendance_ndjson(rows), 'application/x-ndjson'
+            # The slot is held until the last row has been sent
+            response = StreamingHttpResponse(release_after(body, slots), content_type=content_type)
+            filename = f"attendance_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{report_format}"
             response['Content-Disposition'] = f'attachment; filename="{filename}"'
             return response
 
+        if cached is not None:
+            output, _ = cached
+        else:
+            try:
+                output, _ = get_or_build_report_artifact(report_format, filters, organization_id)
+            finally:
+                release_report_slot(slots)
+
+        extension, content_type = REPORT_ARTIFACT_TYPES[report_format]
+        filename = f"attendance_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+        # Stream the file rather than copying it into the response
+        return FileResponse(output, as_attachment=True, filename=filename, content_type=content_type)
+
+    def queue_job(self, request, format_type, filters, organization_id):
+        serializer = ReportJobSerializer(data={'format': format_type, 'filters': filters}, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        job = serializer.save(requested_by=request.user, organization_id=organization_id)
+        return queue_report_job(job, request, status.HTTP_202_ACCEPTED)
+
+
+class AdminWarehouseExportView(APIView):
+    """
+    Columnar export of one table for the data warehouse.
+
+    GET ?table=sessions|presence|enrollments&format=parquet|arrow&since=<watermark>
+    The watermark for the next incremental pull is returned in X-Export-Watermark;
+    incremental pulls carry tombstones (deleted=true) and may repeat keys, so
+    load them as upserts (see export_utils).
+    """
+    permission_classes = [IsAdminUser]
+    content_negotiation_class = ReportFormatNegotiation
+
+    def get(self, request):
+        table = request.query_params.get('table')
+        file_format = request.query_params.get('format', 'parquet')
+        if table not in EXPORT_TABLES or file_format not in EXPORT_FORMATS:
+            return Response({
+                'error': f"table must be one of {', '.join(EXPORT_TABLES)} and format one of {', '.join(EXPORT_FORMATS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if not PYARROW_AVAILABLE:
+            return Response({'error': 'Columnar export is not available on this server'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        organization = get_identity(request).organization
+        organization_id = organization.id if organization else request.query_params.get('organization')
+        output = tempfile.TemporaryFile()
+        try:
+            rows, watermark = write_export(
+                table, output, file_format,
+                organization_id=organization_id,
+                since=request.query_params.get('since'),
+            )
+        except ValueError as e:
+            output.close()
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        output.seek(0)
+
+        extension, content_type = EXPORT_FORMATS[file_format]
+        response = FileResponse(output, as_attachment=True, filename=f'{table}.{extension}', content_type=content_type)
+        response['X-Export-Rows'] = str(rows)
+        if watermark is not None:
+            response['X-Export-Watermark'] = watermark
+        return response
+
 
 class AdminAnalyticsView(APIView):
     permission_classes = [IsAdminUser]
@@ -1292,15 +1645,33 @@ class AdminAnalyticsView(APIView):
     def get(self, request):
         # Get query parameters
         days = int(request.query_params.get('days', 30))
+        # Staff may bypass the section cache with ?fresh=1
+        fresh = request.query_params.get('fresh') == '1' and request.user.is_staff
+        organization = get_identity(request).organization
+        if organization is None and request.query_params.get('organization'):
+            # Staff without a tenant of their own may pick one to inspect
+            organization = get_object_or_404(Organization, id=request.query_params.get('organization'))
+
+        # Standard windows are served straight from the latest precomputed snapshot
+        window = request.query_params.get('window') or window_for_days(days)
+        snapshot = get_latest_snapshot(window, organization) if window and not fresh else None
+        if snapshot is not None:
+            analytics_data = dict(snapshot.data)
+            analytics_data['computed_at'] = {name: snapshot.computed_at.isoformat() for name in snapshot.data}
+            analytics_data['snapshot'] = {
+                'window': snapshot.window,
+                'version': snapshot.version,
+                'deltas': snapshot.deltas,
+            }
+            return Response(analytics_data)
         
-        # Gather all analytics data
-        analytics_data = {
-            'system_overview': get_system_overview(),
-            'attendance_statistics': get_attendance_statistics(days=days),
-            'top_courses': get_top_courses(limit=10),
-            'attendance_trends': get_attendance_trends(days=days),
-            'student_participation': get_student_participation(),
-            'lecturer_activity': get_lecturer_activity(limit=10)
-        }
+        # Gather all analytics data, each section cached separately
+        analytics_data = {}
+        computed_at = {}
+        for name in ANALYTICS_SECTIONS:
+            analytics_data[name], computed_at[name] = get_analytics_section(
+                name, days=days, organization=organization, fresh=fresh
+            )
+        analytics_data['computed_at'] = computed_at
         
         return Response(analytics_data)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 from pathlib import Path
+from datetime import date
 import os
 
 # Initialize Sentry if DSN provided (optional - set SENTRY_DSN in env for production)
@@ -79,30 +80,52 @@ INSTALLED_APPS = [
     'storages',  # Django Storages for S3
 ]
 
+# Django REST Framework settings (the single source of truth; a second
+# REST_FRAMEWORK assignment would silently replace this one)
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        # Loads the caller's student/lecturer profile and organization with the token
+        'attendance.authentication.IdentityTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 100,
+    # orjson-backed JSON (falls back to DRF's encoder when orjson is not installed)
+    'DEFAULT_RENDERER_CLASSES': (
+        'attendance.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    # Keyset (cursor) pages on indexed orderings; no OFFSET scans
+    'DEFAULT_PAGINATION_CLASS': 'attendance.pagination.StableCursorPagination',
+    'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', 50)),
     # 'DEFAULT_THROTTLE_CLASSES': [
     #     'rest_framework.throttling.AnonRateThrottle',
     #     'rest_framework.throttling.UserRateThrottle'
     # ],
-    # 'DEFAULT_THROTTLE_RATES': {
-    #     'anon': '100/day',
-    #     'user': '1000/day'
-    # }
+    'DEFAULT_THROTTLE_RATES': {
+        # Minimal per-user throttle for attendance token generation
+        'attendance_token_burst': '3/minute',
+        'feedback': '5/hour',
+        'anon': '100/day',
+        'user': '1000/day',
+    },
 }
 
+# Upper bound for ?page_size= on paginated list endpoints
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 200))
+
+# Response compression (attendance.middleware.CompressionMiddleware): smallest
+# body worth compressing, and whether to prefer brotli when the Brotli package
+# is installed and the client accepts it
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_BROTLI = os.getenv('COMPRESSION_BROTLI', 'True') == 'True'
+
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # CORS middleware should be above CommonMiddleware
     'django.middleware.security.SecurityMiddleware',
+    'attendance.middleware.CompressionMiddleware',  # gzip/brotli for API JSON and report streams
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -219,6 +242,19 @@ else:
         }
     }
 
+# Admin analytics sections are cached with stale-while-revalidate:
+# entries are fresh for ANALYTICS_CACHE_TTL seconds, then served stale
+# (while one background refresh runs) until ANALYTICS_CACHE_STALE_TTL.
+ANALYTICS_CACHE_TTL = int(os.getenv('ANALYTICS_CACHE_TTL', 300))
+ANALYTICS_CACHE_STALE_TTL = int(os.getenv('ANALYTICS_CACHE_STALE_TTL', 3600))
+
+# Hourly analytics snapshots (7d/30d/90d/term). Snapshots older than
+# ANALYTICS_SNAPSHOT_MAX_AGE are ignored in favour of the section cache.
+ANALYTICS_SNAPSHOT_MAX_AGE = int(os.getenv('ANALYTICS_SNAPSHOT_MAX_AGE', 2 * 60 * 60))
+ANALYTICS_SNAPSHOT_RETENTION = int(os.getenv('ANALYTICS_SNAPSHOT_RETENTION', 48))  # versions kept per window
+ANALYTICS_TERM_DAYS = int(os.getenv('ANALYTICS_TERM_DAYS', 120))
+ANALYTICS_TERM_START = date.fromisoformat(os.getenv('ANALYTICS_TERM_START')) if os.getenv('ANALYTICS_TERM_START') else None
+
 # Security settings for production
 if not DEBUG:
     SECURE_SSL_REDIRECT = True
@@ -280,22 +316,6 @@ elif not DEBUG:
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
-# Django REST Framework settings
-REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
-    ],
-    'DEFAULT_PERMISSION_CLASSES': [
-        'rest_framework.permissions.IsAuthenticated',
-    ],
-    # Minimal per-user throttle for attendance token generation
-    'DEFAULT_THROTTLE_RATES': {
-        'attendance_token_burst': '3/min',
-        'feedback': '10/hour'
-    }
-}
-
 # GIS and other settings
 GDAL_LIBRARY_PATH = os.getenv('GDAL_LIBRARY_PATH', 'C:\\GDAL\\bin\\gdal304.dll')
 
@@ -325,6 +345,16 @@ CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 minutes
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 
+# Report jobs get their own queue with message priorities (0 = first on Redis),
+# so course reports overtake institution-wide ones. Workers started without -Q
+# consume both queues; a dedicated `-Q reports` worker can isolate them.
+from kombu import Queue
+CELERY_TASK_QUEUES = (Queue('celery'), Queue('reports'))
+CELERY_TASK_DEFAULT_QUEUE = 'celery'
+CELERY_TASK_ROUTES = {'attendance.tasks.generate_report_job': {'queue': 'reports'}}
+CELERY_BROKER_TRANSPORT_OPTIONS = {'priority_steps': list(range(10)), 'sep': ':', 'queue_order_strategy': 'priority'}
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1  # Prefetched messages would bypass the priorities
+
 # Celery Beat Schedule (for periodic tasks)
 from celery.schedules import crontab
 CELERY_BEAT_SCHEDULE = {
@@ -336,8 +366,75 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'attendance.tasks.send_attendance_reminders',
         'schedule': crontab(minute='*/30'),  # Every 30 minutes
     },
+    'compute-analytics-snapshots': {
+        'task': 'attendance.tasks.compute_analytics_snapshots',
+        'schedule': crontab(minute=0),  # Every hour
+    },
+    'reconcile-attendance-counters': {
+        'task': 'attendance.tasks.reconcile_attendance_counters',
+        'schedule': crontab(hour=2, minute=30),  # Nightly
+    },
+    'cleanup-expired-report-jobs': {
+        'task': 'attendance.tasks.cleanup_expired_report_jobs',
+        'schedule': crontab(minute=15),  # Every hour
+    },
+    'prune-sync-log': {
+        'task': 'attendance.tasks.prune_sync_log',
+        'schedule': crontab(hour=3, minute=0),  # Nightly
+    },
 }
 
+# Background report jobs: artifacts are kept for REPORT_ARTIFACT_TTL seconds and
+# signed download links stay valid for REPORT_DOWNLOAD_URL_TTL seconds
+REPORT_ARTIFACT_TTL = int(os.getenv('REPORT_ARTIFACT_TTL', 24 * 60 * 60))
+REPORT_DOWNLOAD_URL_TTL = int(os.getenv('REPORT_DOWNLOAD_URL_TTL', 60 * 60))
+
+# Rendered reports are cached by content hash; least recently used entries are
+# evicted once their total size exceeds REPORT_CACHE_MAX_BYTES
+REPORT_CACHE_MAX_BYTES = int(os.getenv('REPORT_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+# PDF reports with more rows than this are drawn page by page on a canvas
+# instead of laid out as one platypus table (see `manage.py benchmark_report_pdf`)
+REPORT_PDF_TABLE_MAX_ROWS = int(os.getenv('REPORT_PDF_TABLE_MAX_ROWS', 500))
+
+# Report rendering concurrency: at most REPORT_NODE_CONCURRENCY reports per host
+# and REPORT_ORG_CONCURRENCY per organization. A request waits up to
+# REPORT_SLOT_WAIT seconds for a slot before its report is queued as a job.
+REPORT_NODE_CONCURRENCY = int(os.getenv('REPORT_NODE_CONCURRENCY', 2))
+REPORT_ORG_CONCURRENCY = int(os.getenv('REPORT_ORG_CONCURRENCY', 2))
+REPORT_SLOT_WAIT = float(os.getenv('REPORT_SLOT_WAIT', 1))
+REPORT_SLOT_TTL = int(os.getenv('REPORT_SLOT_TTL', 15 * 60))
+REPORT_RETRY_AFTER = int(os.getenv('REPORT_RETRY_AFTER', 5))
+
+# Rows per record batch (Parquet row group) in warehouse exports
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 50000))
+# Incremental exports stop EXPORT_LAG_SECONDS short of now and re-read the last
+# EXPORT_OVERLAP_SECONDS before the previous watermark, so changes from slow
+# transactions are exported late rather than skipped
+EXPORT_LAG_SECONDS = int(os.getenv('EXPORT_LAG_SECONDS', 60))
+EXPORT_OVERLAP_SECONDS = int(os.getenv('EXPORT_OVERLAP_SECONDS', 600))
+
+# Term transcripts are rendered in batches across a process pool; 0 means one worker per core.
+# Report jobs are capped at TRANSCRIPT_MAX_WORKERS since a job holds a single report slot
+# (and render in-process under the Celery prefork pool); manage.py generate_transcripts is not capped
+TRANSCRIPT_WORKERS = int(os.getenv('TRANSCRIPT_WORKERS', 0))
+TRANSCRIPT_MAX_WORKERS = int(os.getenv('TRANSCRIPT_MAX_WORKERS', 2))
+TRANSCRIPT_BATCH_SIZE = int(os.getenv('TRANSCRIPT_BATCH_SIZE', 200))
+
+# Delta sync (/api/sync/): at most SYNC_PAGE_SIZE change log entries per
+# response; entries are written on commit, and those younger than
+# SYNC_SETTLE_SECONDS are held back so log inserts committing out of order are
+# not skipped; clients offline longer than
+# SYNC_LOG_RETENTION_DAYS get a full snapshot
+SYNC_PAGE_SIZE = int(os.getenv('SYNC_PAGE_SIZE', 1000))
+SYNC_SETTLE_SECONDS = float(os.getenv('SYNC_SETTLE_SECONDS', 2))
+SYNC_LOG_RETENTION_DAYS = int(os.getenv('SYNC_LOG_RETENTION_DAYS', 30))
+
+# At-risk detection: enrollments below AT_RISK_THRESHOLD percent attendance
+# after at least AT_RISK_MIN_SESSIONS closed sessions are flagged
+AT_RISK_THRESHOLD = float(os.getenv('AT_RISK_THRESHOLD', 75))
+AT_RISK_MIN_SESSIONS = int(os.getenv('AT_RISK_MIN_SESSIONS', 3))
+
 EMAIL_PORT = int(os.getenv('EMAIL_PORT', '587'))
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True') == 'True'
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
@@ -386,18 +483,3 @@ if DEBUG:
 LOGIN_REDIRECT_URL = '/api/'
 LOGOUT_REDIRECT_URL = '/api-auth/login/'
 
-REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
-    ),
-    'DEFAULT_PERMISSION_CLASSES': (
-        'rest_framework.permissions.IsAuthenticated',
-    ),
-    'DEFAULT_THROTTLE_RATES': {
-        'attendance_token_burst': '3/minute',
-        'feedback': '5/hour',
-        'anon': '100/day',
-        'user': '1000/day',
-    }
-}
@@ -2,7 +2,7 @@ import { useEffect, useState } from 'react'
 import Calendar from 'react-calendar'
 import 'react-calendar/dist/Calendar.css'
 import { Paper, Typography, Box, Chip, Fade, Skeleton } from '@mui/material'
-import api from '../services/api'
+import { fetchAll } from '../services/api'
 
 export default function AttendanceCalendar({ value, onChange, embedded = false }) {
   const [attendanceDates, setAttendanceDates] = useState([])
@@ -11,9 +11,9 @@ export default function AttendanceCalendar({ value, onChange, embedded = false }
   useEffect(() => {
     async function fetchAttendance() {
       try {
-        const res = await api.get('/api/attendances/')
+        const attendances = await fetchAll('/api/attendances/')
         // Assume each attendance has a 'date' field in ISO format
-        const dates = (res.data.results || res.data).map(a => a.date?.split('T')[0])
+        const dates = attendances.map(a => a.date?.split('T')[0])
         setAttendanceDates(dates.filter(Boolean))
       } catch {
         setAttendanceDates([])
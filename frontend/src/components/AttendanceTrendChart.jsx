@@ -1,7 +1,7 @@
 import { useEffect, useState } from 'react'
 import { Paper, Typography, Box, Skeleton } from '@mui/material'
 import { LineChart, Line, XAxis, YAxis, Tooltip, ResponsiveContainer, CartesianGrid } from 'recharts'
-import api from '../services/api'
+import { fetchAll } from '../services/api'
 
 export default function AttendanceTrendChart({ embedded = false }) {
   const [data, setData] = useState([])
@@ -10,10 +10,9 @@ export default function AttendanceTrendChart({ embedded = false }) {
   useEffect(() => {
     async function fetchAttendance() {
       try {
-        const res = await api.get('/api/attendances/')
+        const attendances = await fetchAll('/api/attendances/')
         // Group by date and count
         const counts = {}
-        const attendances = res.data.results || res.data
         attendances.forEach(a => {
           const date = a.date?.split('T')[0]
           if (date) counts[date] = (counts[date] || 0) + 1
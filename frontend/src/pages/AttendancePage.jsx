@@ -13,7 +13,7 @@ import {
   Alert,
 } from '@mui/material'
 import DashboardLayout from '../components/DashboardLayout'
-import api from '../services/api'
+import api, { fetchAll } from '../services/api'
 
 export default function AttendancePage() {
   const [records, setRecords] = useState([])
@@ -22,8 +22,7 @@ export default function AttendancePage() {
   useEffect(() => {
     async function fetchAttendance() {
       try {
-        const res = await api.get('/api/attendances/')
-        setRecords(res.data.results || res.data)
+        setRecords(await fetchAll('/api/attendances/'))
       } catch {
         setRecords([])
       }
@@ -38,7 +38,7 @@ import {
   Upload as UploadIcon,
 } from '@mui/icons-material'
 import DashboardLayout from '../components/DashboardLayout'
-import api from '../services/api'
+import api, { fetchAll } from '../services/api'
 
 export default function CoursesPage() {
   const [courses, setCourses] = useState([])
@@ -66,13 +66,14 @@ export default function CoursesPage() {
     setLoading(true)
     try {
       const [coursesRes, lecturersRes, studentsRes] = await Promise.all([
-        api.get('/api/courses/'),
-        api.get('/api/lecturers/'),
-        api.get('/api/students/'),
+        // The roster is only included on request; the edit form needs the student ids
+        fetchAll('/api/courses/?expand=students'),
+        fetchAll('/api/lecturers/'),
+        fetchAll('/api/students/'),
       ])
-      setCourses(coursesRes.data || [])
-      setLecturers(lecturersRes.data || [])
-      setStudents(studentsRes.data || [])
+      setCourses(coursesRes)
+      setLecturers(lecturersRes)
+      setStudents(studentsRes)
     } catch (error) {
       setMessage({ type: 'error', text: 'Failed to load data' })
     } finally {
@@ -230,7 +231,7 @@ export default function CoursesPage() {
                       <TableCell>
                         <Box sx={{ display: 'flex', alignItems: 'center', gap: 1 }}>
                           <PeopleIcon fontSize="small" />
-                          {course.students?.length || 0}
+                          {course.student_count ?? 0}
                         </Box>
                       </TableCell>
                       <TableCell>
@@ -51,17 +51,15 @@ export default function Dashboard() {
              return
         }
 
-        const [lectRes, studRes, courseRes, attRes] = await Promise.all([
-          api.get('/api/lecturers/'),
-          api.get('/api/students/'),
-          api.get('/api/courses/'),
-          api.get('/api/attendances/'),
-        ])
+        // List endpoints are cursor-paginated and carry no totals; the
+        // analytics overview counts every row in the caller's organization
+        const res = await api.get('/api/admin/analytics/')
+        const overview = res.data?.system_overview || {}
         setStats({
-          lecturers: lectRes.data.count ?? lectRes.data.length ?? '--',
-          students: studRes.data.count ?? studRes.data.length ?? '--',
-          courses: courseRes.data.count ?? courseRes.data.length ?? '--',
-          attendance: attRes.data.count ?? attRes.data.length ?? '--',
+          lecturers: overview.total_lecturers ?? '--',
+          students: overview.total_students ?? '--',
+          courses: overview.total_courses ?? '--',
+          attendance: overview.total_attendance_sessions ?? '--',
         })
       } catch (e) {
         setStats({ lecturers: '--', students: '--', courses: '--', attendance: '--' })
@@ -23,7 +23,7 @@ import {
   MenuItem,
 } from '@mui/material'
 import DashboardLayout from '../components/DashboardLayout'
-import api from '../services/api'
+import api, { fetchAll } from '../services/api'
 
 export default function LecturersPage() {
   const [lecturers, setLecturers] = useState([])
@@ -47,8 +47,8 @@ export default function LecturersPage() {
   useEffect(() => {
     async function fetchLecturers() {
       try {
-        const res = await api.get('/api/lecturers/')
-        setLecturers(res.data.results || res.data)
+        const res = await fetchAll('/api/lecturers/')
+        setLecturers(res)
       } catch {
         setLecturers([])
       }
@@ -58,8 +58,8 @@ export default function LecturersPage() {
 
   const refresh = async () => {
     try {
-      const res = await api.get('/api/lecturers/')
-      setLecturers(res.data.results || res.data)
+      const res = await fetchAll('/api/lecturers/')
+      setLecturers(res)
     } catch {
       setLecturers([])
     }
@@ -67,8 +67,8 @@ export default function LecturersPage() {
 
   const refreshCourses = async () => {
     try {
-      const res = await api.get('/api/courses/')
-      setCourses(res.data.results || res.data)
+      const res = await fetchAll('/api/courses/')
+      setCourses(res)
     } catch {
       setCourses([])
     }
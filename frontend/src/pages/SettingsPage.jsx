@@ -22,7 +22,7 @@ import {
   Save as SaveIcon,
 } from '@mui/icons-material';
 import DashboardLayout from '../components/DashboardLayout';
-import api from '../services/api';
+import api, { fetchAll } from '../services/api';
 
 const SettingsPage = () => {
   const [loading, setLoading] = useState(true);
@@ -80,8 +80,7 @@ const SettingsPage = () => {
 
   const loadOrganizations = async () => {
     try {
-      const response = await api.get('/api/organizations/');
-      setOrganizations(Array.isArray(response.data) ? response.data : (response.data.results || []));
+      setOrganizations(await fetchAll('/api/organizations/'));
     } catch (err) {
       console.error('Failed to load organizations:', err);
       setOrganizations([]);
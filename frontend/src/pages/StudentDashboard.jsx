@@ -32,7 +32,7 @@ import {
   EmojiEvents as AwardIcon,
 } from '@mui/icons-material'
 import DashboardLayout from '../components/DashboardLayout'
-import api from '../services/api'
+import api, { fetchAll } from '../services/api'
 
 const quickLinks = [
   {
@@ -90,10 +90,10 @@ export default function StudentDashboard() {
           return
         }
         const [coursesRes, historyRes] = await Promise.all([
-          api.get('/api/studentenrolledcourses/'),
+          fetchAll('/api/studentenrolledcourses/'),
           api.get('/api/student-attendance-history/'),
         ])
-        setCourses(coursesRes.data || [])
+        setCourses(coursesRes)
         setHistory(historyRes.data || [])
       } catch (error) {
         if (error?.response?.status === 404) {
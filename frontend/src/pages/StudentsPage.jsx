@@ -23,7 +23,7 @@ import {
   MenuItem,
 } from '@mui/material'
 import DashboardLayout from '../components/DashboardLayout'
-import api from '../services/api'
+import api, { fetchAll } from '../services/api'
 
 export default function StudentsPage() {
   const [students, setStudents] = useState([])
@@ -48,8 +48,8 @@ export default function StudentsPage() {
   useEffect(() => {
     async function fetchStudents() {
       try {
-        const res = await api.get('/api/students/')
-        setStudents(res.data.results || res.data)
+        const res = await fetchAll('/api/students/')
+        setStudents(res)
       } catch {
         setStudents([])
       }
@@ -59,8 +59,8 @@ export default function StudentsPage() {
 
   const refresh = async () => {
     try {
-      const res = await api.get('/api/students/')
-      setStudents(res.data.results || res.data)
+      const res = await fetchAll('/api/students/')
+      setStudents(res)
     } catch {
       setStudents([])
     }
@@ -68,8 +68,8 @@ export default function StudentsPage() {
 
   const refreshCourses = async () => {
     try {
-      const res = await api.get('/api/courses/')
-      setCourses(res.data.results || res.data)
+      const res = await fetchAll('/api/courses/')
+      setCourses(res)
     } catch {
       setCourses([])
     }
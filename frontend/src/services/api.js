@@ -26,3 +26,17 @@ api.interceptors.response.use(
 )
 
 export default api
+
+// Cursor-paginated lists return { next, results }; follow `next` to the end.
+// Unpaginated endpoints (plain arrays) are returned as they are.
+export async function fetchAll(url, config) {
+  const items = []
+  let next = url
+  while (next) {
+    const res = await api.get(next, next === url ? config : undefined)
+    if (Array.isArray(res.data)) return res.data
+    items.push(...(res.data?.results || []))
+    next = res.data?.next
+  }
+  return items
+}
@@ -14,8 +14,25 @@ export const loginStudent = (username, password, student_id) =>
 export const loginStaff = (username, password, staff_id) =>
   api.post('login/staff/', { username, password, staff_id });
 
-export const fetchCourses = (token) =>
-  api.get('courses/', { headers: { Authorization: `Token ${token}` } });
+// Lists are cursor-paginated ({ next, results }); follow `next` to collect every page
+export const fetchAll = async (token, url) => {
+  const headers = { Authorization: `Token ${token}` };
+  const items = [];
+  let next = url;
+  while (next) {
+    const resp = await api.get(next, { headers });
+    if (Array.isArray(resp.data)) return resp.data;
+    items.push(...(resp.data.results || []));
+    next = resp.data.next;
+  }
+  return items;
+};
+
+export const fetchCourses = (token) => fetchAll(token, 'courses/');
+
+// Changes since `cursor` (0 for a full snapshot); store the returned cursor and repeat while has_more
+export const fetchChanges = (token, cursor = 0) =>
+  api.get('sync/', { params: { cursor }, headers: { Authorization: `Token ${token}` } });
 
 export const takeAttendance = (token, attendanceToken) =>
   api.post('courses/take_attendance/', { token: attendanceToken }, { headers: { Authorization: `Token ${token}` } });
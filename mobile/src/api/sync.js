@@ -0,0 +1,65 @@
+import AsyncStorage from '@react-native-async-storage/async-storage';
+import { fetchChanges } from './client';
+
+// Local copy of what the user can see, kept current with /sync/ deltas
+const STATE_KEY = 'syncState';
+
+const KEYS = {
+  courses: (row) => String(row.id),
+  sessions: (row) => String(row.id),
+  enrollments: (row) => `${row.course_id}:${row.student_id}`,
+  presence: (row) => `${row.attendance_id}:${row.student_id}`,
+};
+
+const emptyState = (token) => ({ token, cursor: 0, courses: {}, enrollments: {}, sessions: {}, presence: {} });
+
+const dropWhere = (rows, test) => {
+  Object.keys(rows).forEach((key) => { if (test(rows[key])) delete rows[key]; });
+};
+
+const dropSessions = (state, test) => {
+  const gone = new Set(Object.values(state.sessions).filter(test).map((session) => session.id));
+  dropWhere(state.sessions, (session) => gone.has(session.id));
+  dropWhere(state.presence, (row) => gone.has(row.attendance_id));
+};
+
+// Apply one /sync/ response following the rules in the server's sync_utils
+const apply = (state, data, isStudent) => {
+  const { changes, deleted } = data;
+  deleted.presence.forEach((row) => { delete state.presence[KEYS.presence(row)]; });
+  dropSessions(state, (session) => deleted.sessions.includes(session.id));
+  deleted.enrollments.forEach((row) => {
+    delete state.enrollments[KEYS.enrollments(row)];
+    if (isStudent) {
+      // Leaving a course takes the course and its sessions with it
+      delete state.courses[String(row.course_id)];
+      dropSessions(state, (session) => session.course_id === row.course_id);
+    }
+  });
+  deleted.courses.forEach((courseId) => {
+    delete state.courses[String(courseId)];
+    dropWhere(state.enrollments, (row) => row.course_id === courseId);
+    dropSessions(state, (session) => session.course_id === courseId);
+  });
+  Object.keys(KEYS).forEach((table) => {
+    changes[table].forEach((row) => { state[table][KEYS[table](row)] = row; });
+  });
+};
+
+// Bring the local copy up to date and return it; the first call (or a reset) loads a full snapshot
+export const syncState = async (token, isStudent) => {
+  const saved = JSON.parse((await AsyncStorage.getItem(STATE_KEY)) || 'null');
+  let state = saved && saved.token === token ? saved : emptyState(token);
+  let hasMore = true;
+  while (hasMore) {
+    const { data } = await fetchChanges(token, state.cursor);
+    if (data.reset) state = emptyState(token);
+    apply(state, data, isStudent);
+    state.cursor = data.cursor;
+    hasMore = data.has_more;
+  }
+  await AsyncStorage.setItem(STATE_KEY, JSON.stringify(state));
+  return state;
+};
+
+export const clearSyncState = () => AsyncStorage.removeItem(STATE_KEY);
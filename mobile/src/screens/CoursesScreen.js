@@ -2,6 +2,7 @@ import React, { useEffect, useState } from 'react';
 import { View, Text, FlatList, Button, TextInput, StyleSheet, Alert } from 'react-native';
 import AsyncStorage from '@react-native-async-storage/async-storage';
 import { fetchCourses, takeAttendance } from '../api/client';
+import { clearSyncState, syncState } from '../api/sync';
 import showMessage from '../utils/toast';
 
 
@@ -20,8 +21,15 @@ export default function CoursesScreen({ navigation, route }) {
           t = await AsyncStorage.getItem('authToken');
           setToken(t);
         }
-        const resp = await fetchCourses(t);
-        setCourses(resp.data);
+        try {
+          // Only what changed since the last visit is downloaded
+          const state = await syncState(t, (await AsyncStorage.getItem('authRole')) !== 'staff');
+          setCourses(Object.values(state.courses));
+        } catch (err) {
+          // Admins have no sync feed; fall back to the course list
+          if (err?.response?.status !== 403) throw err;
+          setCourses(await fetchCourses(t));
+        }
       } catch (err) {
         console.error(err);
         showMessage('Could not fetch courses');
@@ -58,6 +66,8 @@ export default function CoursesScreen({ navigation, route }) {
 
   const onLogout = async () => {
     await AsyncStorage.removeItem('authToken');
+    await AsyncStorage.removeItem('authRole');
+    await clearSyncState();
     navigation.replace('Login');
   };
 
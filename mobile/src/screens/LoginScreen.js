@@ -20,6 +20,7 @@ export default function LoginScreen({ navigation }) {
       }
       const token = resp.data.token;
       await AsyncStorage.setItem('authToken', token);
+      await AsyncStorage.setItem('authRole', role);
       navigation.replace('Courses');
     } catch (err) {
       console.error(err);
@@ -22,8 +22,7 @@ export default function StaffScreen() {
       setToken(t);
       if (t) {
         try {
-          const resp = await fetchCourses(t);
-          setCourses(resp.data);
+          setCourses(await fetchCourses(t));
         } catch (err) {
           console.error(err);
           showMessage('Could not fetch courses');